@@ -1,4 +1,6 @@
 import os
+import json
+import time
 
 from ansible.plugins.callback.default import CallbackModule as default_CallbackModule
 from ansible import constants as C
@@ -24,7 +26,80 @@ INTERESTING_MODULE_PROPS = {
     "failed_when_result": None,
     }
 
+# one JSON event per task and loop item, in the artifacts directory of the play.
+# See projects/repo/scripts/ansible_task_timings.py
+EVENTS_FILENAME = "_ansible.events.jsonl"
+
 class CallbackModule(default_CallbackModule):
+    def __init__(self):
+        super().__init__()
+        self._events_file = None
+        self._starts = {} # (host, task uuid) --> start time of the task
+        self._item_starts = {} # (host, task uuid) --> start time of the current loop item
+        self._retries = {} # (host, task uuid) --> number of failed attempts of the task
+        self._item_retries = {} # (host, task uuid) --> number of failed attempts of the current loop item
+
+    def __set_events_file(self, artifact_extra_logs_dir):
+        if not artifact_extra_logs_dir:
+            self._events_file = None
+            return
+
+        self._events_file = os.path.join(artifact_extra_logs_dir, EVENTS_FILENAME)
+
+    def __write_event(self, result, event_type, status, item=None):
+        if not self._events_file:
+            return
+
+        task = result._task
+        key = (result._host.get_name(), task._uuid)
+        now = time.time()
+        if event_type == "item":
+            start = self._item_starts.get(key, self._starts.get(key, now))
+        else:
+            start = self._starts.get(key, now)
+        res = result._result
+
+        event = dict(
+            type=event_type,
+            role=task._role.get_name() if task._role else None,
+            task=task.get_name(),
+            action=task.action,
+            path=task.get_path().replace(os.getcwd()+'/', '') if task.get_path() else None,
+            host=key[0],
+            start=start,
+            duration=now - start,
+            status=status,
+            changed=bool(res.get("changed", False)),
+            failed=status == "failed",
+            retries=(self._item_retries if event_type == "item" else self._retries).get(key, 0),
+            until=bool(task.until),
+        )
+        if event_type == "item":
+            event["item"] = str(item)
+            # the next item starts now
+            self._item_starts[key] = now
+            self._item_retries.pop(key, None)
+        else:
+            event["items"] = len(res.get("results", [])) if task.loop else None
+
+        try:
+            with open(self._events_file, "a") as f:
+                print(json.dumps(event, default=str), file=f)
+        except OSError as e:
+            self._display.warning(f"Could not write the task event in {self._events_file}: {e}")
+
+    def __task_done(self, result, status):
+        self.__write_event(result, "task", status)
+
+        key = (result._host.get_name(), result._task._uuid)
+        self._starts.pop(key, None)
+        self._item_starts.pop(key, None)
+        self._retries.pop(key, None)
+        self._item_retries.pop(key, None)
+
+    def __item_done(self, result, status):
+        self.__write_event(result, "item", status, item=self._get_item_label(result._result))
+
     def __display_result(self, result, color, ignore_errors=None, loop_idx=0):
         if ignore_errors not in (None, False):
             self._display.display(f"==> FAILED | ignore_errors={ignore_errors}", color=color)
@@ -97,6 +172,7 @@ class CallbackModule(default_CallbackModule):
         self._display.display(f"", color=color)
 
     def v2_runner_on_skipped(self, result):
+        self.__task_done(result, "skipped")
         self._print_task_banner(result._task, head=True)
 
         self._display.display(f"==> SKIPPED | {result._result.get('skip_reason', '(no reason provided)')}",
@@ -106,6 +182,7 @@ class CallbackModule(default_CallbackModule):
 
 
     def v2_runner_on_failed(self, result, ignore_errors=False):
+        self.__task_done(result, "failed")
         self._print_task_banner(result._task, head=True)
 
         color = C.COLOR_VERBOSE if ignore_errors else C.COLOR_ERROR
@@ -114,6 +191,7 @@ class CallbackModule(default_CallbackModule):
         self._display.display("----- FAILED ----", C.COLOR_ERROR)
 
     def v2_runner_on_ok(self, result):
+        self.__task_done(result, "ok")
         self._print_task_banner(result._task, head=True)
 
         color = C.COLOR_CHANGED if result._result.get('changed', False) \
@@ -122,15 +200,16 @@ class CallbackModule(default_CallbackModule):
         self.__display_result(result, color)
 
     def v2_runner_on_unreachable(self, result):
+        self.__task_done(result, "unreachable")
         del result._result["unreachable"] # no need for `__display_result` to tell that, we already do it here
         self._display.display(f"----- HOST UNREACHABLE ({result._host})----", C.COLOR_ERROR)
         self.__display_result(result, C.COLOR_VERBOSE, False)
         self._display.display("----- HOST UNREACHABLE ----", C.COLOR_ERROR)
 
     # items are handled as part of the 'normal' task logging
-    def v2_runner_item_on_failed(self, result): pass
-    def v2_runner_item_on_ok(self, result): pass
-    def v2_runner_item_on_skipped(self, result): pass
+    def v2_runner_item_on_failed(self, result): self.__item_done(result, "failed")
+    def v2_runner_item_on_ok(self, result): self.__item_done(result, "ok")
+    def v2_runner_item_on_skipped(self, result): self.__item_done(result, "skipped")
 
     def _print_task_banner(self, task, head=False):
         if head:
@@ -144,6 +223,10 @@ class CallbackModule(default_CallbackModule):
             "Monday 08 March 2021  10:38:44 +0100 (0:00:00.023)       0:00:06.476 **********"
 
     def v2_runner_retry(self, result):
+        key = (result._host.get_name(), result._task._uuid)
+        self._retries[key] = self._retries.get(key, 0) + 1
+        self._item_retries[key] = self._item_retries.get(key, 0) + 1
+
         color = C.COLOR_VERBOSE
 
         if result._result['attempts'] == 1:
@@ -166,7 +249,14 @@ class CallbackModule(default_CallbackModule):
         self._display.display("")
 
     def v2_runner_on_start(self, host, task):
-        pass
+        self._starts[(host.get_name(), task._uuid)] = time.time()
+
+    def v2_playbook_on_play_start(self, play):
+        super().v2_playbook_on_play_start(play)
+
+        # in batch mode (ansible_toolbox.run_batch), each play has its own artifacts directory
+        self.__set_events_file(play.get_vars().get("artifact_extra_logs_dir")
+                               or os.environ.get("ARTIFACT_EXTRA_LOGS_DIR"))
 
     def v2_playbook_on_task_start(self, task, is_conditional):
         self._display.display("")
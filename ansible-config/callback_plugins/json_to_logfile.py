@@ -10,6 +10,7 @@ __metaclass__ = type
 
 import os
 import json
+import time
 
 import logging
 import logging.handlers
@@ -36,6 +37,15 @@ DOCUMENTATION = '''
         ini:
         - section: callback_json_to_file
           key: logfile
+      per_play:
+        description: store the logs of each play in the '_ansible.log.json' file of its 'artifact_extra_logs_dir' variable
+        env:
+        - name: ANSIBLE_JSON_TO_LOGFILE_PER_PLAY
+        default: false
+        type: bool
+        ini:
+        - section: callback_json_to_file
+          key: per_play
 '''
 
 
@@ -58,10 +68,14 @@ class CallbackModule(CallbackBase):
         super(CallbackModule, self).set_options(task_keys=task_keys, var_options=var_options, direct=direct)
 
         self.logfile = self.get_option("logfile")
+        self.per_play = self.get_option("per_play")
 
         with open(self.logfile, "a+") as f:
             print("[", file=f)
         self.is_open = True
+        self.play_name = None
+        self.task_name = None
+        self.task_start = None
 
         print("JSON_TO_LOGFILE: Storing json logs in", self.logfile)
         self.hostname = socket.gethostname()
@@ -69,6 +83,12 @@ class CallbackModule(CallbackBase):
     def _write(self, data, finished=False):
         self._warn_if_not_open()
 
+        if data["scope"] == "task":
+            # used to build the execution trace (projects/core/library/trace.py)
+            data["task"] = self.task_name
+            data["start"] = self.task_start
+            data["end"] = time.time()
+
         if not finished:
             end = "," + "\n"
         else:
@@ -83,6 +103,41 @@ class CallbackModule(CallbackBase):
 
         print("JSON_TO_LOGFILE: WARNING: logfile already closed ....")
 
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.task_name = task.get_name() # includes the role name
+        self.task_start = time.time()
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.v2_playbook_on_task_start(task, False)
+
+    def v2_playbook_on_play_start(self, play):
+        if not self.per_play:
+            return
+
+        artifact_extra_logs_dir = play.get_vars().get("artifact_extra_logs_dir")
+        if not artifact_extra_logs_dir:
+            return
+
+        logfile = os.path.join(artifact_extra_logs_dir, "_ansible.log.json")
+        if logfile == self.logfile:
+            return
+
+        if self.is_open:
+            self._write({"scope": "play",
+                         "log_level": "info",
+                         "status": "finished",
+                         "play": self.play_name,
+                         },
+                        finished=True)
+
+        self.logfile = logfile
+        with open(self.logfile, "a+") as f:
+            print("[", file=f)
+        self.is_open = True
+        self.play_name = play.get_name()
+
+        print("JSON_TO_LOGFILE: Storing json logs in", self.logfile)
+
     def playbook_on_stats(self, stats):
         hosts = set()
         for dictt in stats.ok, stats.failures, stats.skipped, stats.rescued:
@@ -134,6 +134,9 @@ def generate_usage_data(entries, variables, main_key, secondary_key):
     variables_copy = dict(variables)  # make a copy before modifying
 
     for entry in entries:
+        if hasattr(entry.results, "load_all"):
+            entry.results.load_all() # lazy results of the columnar cache, read through __dict__
+
         main_field = entry.results.__dict__.get(main_key)
         if not main_field:
             continue
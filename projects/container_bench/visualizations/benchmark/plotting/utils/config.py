@@ -165,6 +165,9 @@ def GetInfo(settings):
     data = {}
 
     for entry in common.Matrix.filter_records(settings):
+        if hasattr(entry.results, "load_all"):
+            entry.results.load_all() # lazy results of the columnar cache, read through __dict__
+
         metrics = entry.results.__dict__.get("metrics")
         if not metrics:
             continue
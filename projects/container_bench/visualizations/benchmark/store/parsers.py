@@ -2,8 +2,8 @@ import math
 import types
 import yaml
 import json
-from pathlib import Path
 
+import projects.matrix_benchmarking.visualizations.helpers.store as helpers_store
 import projects.matrix_benchmarking.visualizations.helpers.store.parsers as helpers_store_parsers
 
 
@@ -186,7 +186,7 @@ BENCHMARK_PARSERS = {
 
 def _read_timestamp_from_file(dirname, benchmark_path, log_file_name):
     timestamp_file = benchmark_path / "artifacts" / log_file_name.replace('.log', '_ts.yaml')
-    if not timestamp_file.exists():
+    if not helpers_store.get_directory_index(dirname).exists(timestamp_file):
         return None
     try:
         with open(register_important_file(dirname, timestamp_file)) as f:
@@ -227,8 +227,9 @@ def _parse_synthetic_benchmark(dirname):
     metric.read_throughput = None
     metric.write_throughput = None
 
-    for benchmark_path in dirname.glob(RUN_BENCHMARK_DIR):
-        if not Path(benchmark_path / "artifacts" / log_file_name).exists():
+    directory_index = helpers_store.get_directory_index(dirname)
+    for benchmark_path in directory_index.glob(RUN_BENCHMARK_DIR):
+        if not directory_index.exists(benchmark_path / "artifacts" / log_file_name):
             continue
 
         with open(
@@ -266,8 +267,9 @@ def _parse_metrics(dirname):
     command = ""
     timestamp = 0
     memory_usages = []
-    for benchmark_path in dirname.glob(RUN_BENCHMARK_DIR):
-        if not Path(benchmark_path / "artifacts" / "metrics.json").exists():
+    directory_index = helpers_store.get_directory_index(dirname)
+    for benchmark_path in directory_index.glob(RUN_BENCHMARK_DIR):
+        if not directory_index.exists(benchmark_path / "artifacts" / "metrics.json"):
             continue
         with open(
             register_important_file(dirname, benchmark_path / "artifacts" / "metrics.json")
@@ -12,8 +12,16 @@ import shutil
 import shlex
 import importlib
 import logging
+import json
+import re
+import io
+import contextlib
+import threading
+import traceback
 
 from projects.core.library import config
+from projects.core.library import env as env_lib
+from projects.core.library import trace
 TOPSAIL_DIR = pathlib.Path(config.__file__).parents[3]
 
 ANSIBLE_OS_CONFIGS_YAML = """
@@ -31,30 +39,94 @@ linux:
 ANSIBLE_OS_CONFIGURATIONS = yaml.safe_load(ANSIBLE_OS_CONFIGS_YAML)
 
 
+TOOLBOX_MANIFEST_VERSION = 1
+TOOLBOX_MANIFEST_PATH = pathlib.Path(os.environ.get("TOPSAIL_TOOLBOX_MANIFEST", TOPSAIL_DIR / "projects" / "core" / "library" / ".toolbox_manifest.json"))
+
+
+def _toolbox_files():
+    return sorted(toolbox_file for toolbox_file in (TOPSAIL_DIR / "projects").glob("*/toolbox/*.py")
+                  if not toolbox_file.name.startswith(".") and not toolbox_file.name.startswith("_"))
+
+
+def generate_toolbox_manifest(toolbox_files):
+    """
+    Generates the manifest of the toolbox groups: {group: {module, attr}}, without importing the modules.
+    """
+    groups = {}
+    for toolbox_file in toolbox_files:
+        toolbox_name = toolbox_file.with_suffix("").name
+        project_toolbox_module = str(toolbox_file.relative_to(TOPSAIL_DIR).with_suffix("")).replace(os.path.sep, ".")
+
+        has_entrypoint = re.search(r"^__entrypoint\s*=", toolbox_file.read_text(), re.MULTILINE)
+        groups[toolbox_name] = dict(
+            module=project_toolbox_module,
+            attr="__entrypoint" if has_entrypoint else toolbox_name.title(),
+        )
+
+    return groups
+
+
+def load_toolbox_manifest():
+    """
+    Returns the manifest of the toolbox groups.
+
+    The manifest is cached in TOOLBOX_MANIFEST_PATH, and regenerated
+    when the list of toolbox files or their modification times change.
+    """
+    toolbox_files = _toolbox_files()
+    fingerprint = [[str(f.relative_to(TOPSAIL_DIR)), f.stat().st_mtime_ns] for f in toolbox_files]
+
+    try:
+        with open(TOOLBOX_MANIFEST_PATH) as f:
+            manifest = json.load(f)
+
+        if manifest.get("version") == TOOLBOX_MANIFEST_VERSION and manifest.get("files") == fingerprint:
+            return manifest["groups"]
+    except (OSError, ValueError):
+        pass # missing or invalid manifest, regenerate it
+
+    groups = generate_toolbox_manifest(toolbox_files)
+    manifest = dict(version=TOOLBOX_MANIFEST_VERSION, files=fingerprint, groups=groups)
+
+    try:
+        tmp_path = TOOLBOX_MANIFEST_PATH.parent / f".{TOOLBOX_MANIFEST_PATH.name}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, TOOLBOX_MANIFEST_PATH)
+    except OSError as e:
+        logging.debug(f"Could not save the toolbox manifest in {TOOLBOX_MANIFEST_PATH}: {e}")
+
+    return groups
+
+
 class Toolbox:
     """
     The Topsail Toolbox
     """
 
     def __init__(self):
-        for toolbox_file in (TOPSAIL_DIR / "projects").glob("*/toolbox/*.py"):
-            if toolbox_file.name.startswith("."): continue
+        # the toolbox modules are imported lazily, when their group is accessed
+        self._manifest = load_toolbox_manifest()
 
-            project_toolbox_module = str(toolbox_file.relative_to(TOPSAIL_DIR).with_suffix("")).replace(os.path.sep, ".")
-            mod = importlib.import_module(project_toolbox_module)
-            toolbox_name = toolbox_file.with_suffix("").name
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(self._manifest))
 
-            if toolbox_name.startswith("_"): continue
+    def __getattr__(self, toolbox_name):
+        if toolbox_name.startswith("_") or toolbox_name not in self._manifest:
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{toolbox_name}'")
 
-            if hasattr(mod, "__entrypoint"):
-                self.__dict__[toolbox_name] = getattr(mod, "__entrypoint")
-                continue
+        entry = self._manifest[toolbox_name]
+        mod = importlib.import_module(entry["module"])
 
-            try:
-                self.__dict__[toolbox_name] = getattr(mod, toolbox_name.title())
-            except AttributeError as e:
-                logging.fatal(str(e)) # eg: AttributeError: module 'projects.notebooks.toolbox.notebooks' has no attribute 'Notebooks'
-                sys.exit(1)
+        try:
+            group = getattr(mod, entry["attr"])
+        except AttributeError as e:
+            logging.fatal(str(e)) # eg: AttributeError: module 'projects.notebooks.toolbox.notebooks' has no attribute 'Notebooks'
+            sys.exit(1)
+
+        self.__dict__[toolbox_name] = group
+
+        return group
 
 
 def AnsibleRole(role_name):
@@ -137,6 +209,38 @@ class RunAnsibleRole:
         return ""
 
     def _run(self):
+        # do not modify the `os.environ` of this Python process
+        env = os.environ.copy()
+
+        run_result = self._run_playbook(env, sys.argv)
+
+        raise SystemExit(run_result.returncode)
+
+    def _run_playbook(self, env, argv, capture_stdout=False, capture_stderr=False, out=None, exit_on_interrupt=True):
+        """
+        Runs the role with ansible-playbook, and returns its subprocess.CompletedProcess.
+
+        env: the environment of the ansible-playbook process (updated in-place)
+        argv: the toolbox command line, used to name and document the artifacts
+        out: the file where the informative messages are printed (default: sys.stdout)
+        exit_on_interrupt: if False, a KeyboardInterrupt is raised instead of exiting the process
+        """
+
+        if out is None:
+            out = sys.stdout
+
+        self._prepare_play(env, argv, out)
+
+        return _run_plays([self], [argv], env, capture_stdout, capture_stderr, out, exit_on_interrupt)
+
+    def _prepare_play(self, env, argv, out):
+        """
+        Prepares the environment (updated in-place), the artifacts
+        directory and the play of the role.
+
+        Sets self.generated_play and self.artifact_extra_logs_dir.
+        """
+
         if not self.role_name:
             raise RuntimeError("Role not set :/")
 
@@ -148,9 +252,6 @@ class RunAnsibleRole:
             for constant in self.ansible_constants:
                 self.ansible_vars[f"{self.role_name}_{constant['name']}"] = constant["value"]
 
-        # do not modify the `os.environ` of this Python process
-        env = os.environ.copy()
-
         if env.get("ARTIFACT_DIR") is None:
             topsail_base_dir = pathlib.Path(env.get("TOPSAIL_BASE_DIR", "/tmp"))
             env["ARTIFACT_DIR"] = str(topsail_base_dir / f"topsail_{time.strftime('%Y%m%d')}")
@@ -163,9 +264,9 @@ class RunAnsibleRole:
 
         if env.get("ARTIFACT_EXTRA_LOGS_DIR") is None:
             artifact_base_dirname = f"{self.group}__{self.command}" if self.group and self.command \
-                else "__".join(sys.argv[1:3])
+                else "__".join(argv[1:3])
 
-            previous_extra_count = len(list(artifact_dir.glob("*__*")))
+            previous_extra_count = env_lib.allocate_artifact_index(artifact_dir)
 
             name = f"{previous_extra_count:03d}__{prefix}{artifact_base_dirname}{suffix}"
 
@@ -182,7 +283,7 @@ class RunAnsibleRole:
 
         if self.py_command_args:
             with open(artifact_extra_logs_dir / "_python.gen.cmd", "w") as f:
-                print(f"{sys.argv[0]} {self.group} {self.command} \\", file=f)
+                print(f"{argv[0]} {self.group} {self.command} \\", file=f)
                 for key, _value in self.py_command_args.items():
                     value = shlex.quote(str(_value))
                     print(f"   --{key}={value} \\", file=f)
@@ -191,20 +292,20 @@ class RunAnsibleRole:
             with open(artifact_extra_logs_dir / "_python.args.yaml", "w") as f:
                 print(yaml.dump({self.py_command_name: self.py_command_args}), file=f)
 
-        print(f"Using '{env['ARTIFACT_DIR']}' to store the test artifacts.")
+        print(f"Using '{env['ARTIFACT_DIR']}' to store the test artifacts.", file=out)
         self.ansible_vars["artifact_dir"] = env["ARTIFACT_DIR"]
 
-        print(f"Using '{artifact_extra_logs_dir}' to store extra log files.")
+        print(f"Using '{artifact_extra_logs_dir}' to store extra log files.", file=out)
         self.ansible_vars["artifact_extra_logs_dir"] = str(artifact_extra_logs_dir)
 
         if env.get("ANSIBLE_LOG_PATH") is None:
             env["ANSIBLE_LOG_PATH"] = str(artifact_extra_logs_dir / "_ansible.log")
-        print(f"Using '{env['ANSIBLE_LOG_PATH']}' to store ansible logs.")
+        print(f"Using '{env['ANSIBLE_LOG_PATH']}' to store ansible logs.", file=out)
         pathlib.Path(env["ANSIBLE_LOG_PATH"]).parent.mkdir(parents=True, exist_ok=True)
 
         if env.get("ANSIBLE_CACHE_PLUGIN_CONNECTION") is None:
             env["ANSIBLE_CACHE_PLUGIN_CONNECTION"] = str(artifact_dir / "ansible_facts")
-        print(f"Using '{env['ANSIBLE_CACHE_PLUGIN_CONNECTION']}' to store ansible facts.")
+        print(f"Using '{env['ANSIBLE_CACHE_PLUGIN_CONNECTION']}' to store ansible facts.", file=out)
         pathlib.Path(env["ANSIBLE_CACHE_PLUGIN_CONNECTION"]).parent.mkdir(parents=True, exist_ok=True)
 
         # We configure the roles path dynamically appending them to the defaults
@@ -232,20 +333,11 @@ class RunAnsibleRole:
         if env.get("ANSIBLE_CONFIG") is None:
             env["ANSIBLE_CONFIG"] = str(TOPSAIL_DIR / "ansible-config" / "ansible.cfg")
 
-        print(f"Using '{env['ANSIBLE_CONFIG']}' as ansible configuration file.")
+        print(f"Using '{env['ANSIBLE_CONFIG']}' as ansible configuration file.", file=out)
 
         if env.get("ANSIBLE_JSON_TO_LOGFILE") is None:
             env["ANSIBLE_JSON_TO_LOGFILE"] = str(artifact_extra_logs_dir / "_ansible.log.json")
-        print(f"Using '{env['ANSIBLE_JSON_TO_LOGFILE']}' as ansible json log file.")
-
-        # the play file must be in the directory where the 'roles' are
-        tmp_play_file = tempfile.NamedTemporaryFile(
-            "w+",
-            prefix="tmp_play_{}_".format(artifact_extra_logs_dir.name),
-            suffix=".yaml",
-            dir=os.getcwd(),
-            delete=False,
-        )
+        print(f"Using '{env['ANSIBLE_JSON_TO_LOGFILE']}' as ansible json log file.", file=out)
 
         generated_play = [
             dict(
@@ -257,7 +349,7 @@ class RunAnsibleRole:
 
         remote_hostname = env.get("TOPSAIL_REMOTE_HOSTNAME")
         if remote_hostname:
-            print(f"Using TOPSAIL_REMOTE_HOSTNAME={remote_hostname}") # value will be censored by OpenShift
+            print(f"Using TOPSAIL_REMOTE_HOSTNAME={remote_hostname}", file=out) # value will be censored by OpenShift
             if self.ansible_gather_facts:
                 # gather only env values
                 generated_play[0]["gather_facts"] = True
@@ -267,32 +359,7 @@ class RunAnsibleRole:
 
             # run remotely
             generated_play[0]["hosts"] = "remote"
-            inventory_fd, path = tempfile.mkstemp()
-            os.remove(path) # using only the FD. Ensures that the file disappears when this process terminates
-            inventory_f = os.fdopen(inventory_fd, 'w')
-
-            host_properties = []
-            if remote_username := env.get("TOPSAIL_REMOTE_USERNAME"):
-                print(f"Using TOPSAIL_REMOTE_USERNAME={remote_username}") # value will be censored by OpenShift
-
-                host_properties.append("ansible_user="+remote_username)
-
-            # Configure OS-specific Ansible variables
-            if remote_os := env.get("TOPSAIL_REMOTE_OS"):
-                config = ANSIBLE_OS_CONFIGURATIONS.get(remote_os.lower())
-                if not config:
-                    raise ValueError(f"TOPSAIL Ansible OS configuration not found for TOPSAIL_REMOTE_OS={remote_os}")
-                host_properties.extend(config)
 
-            inventory_content = f"""
-[all:vars]
-
-[remote]
-{remote_hostname} {" ".join(host_properties)}
-"""
-
-            print(inventory_content, file=inventory_f)
-            inventory_f.flush()
         else:
             # run locally
             generated_play[0]["connection"] = "local"
@@ -329,41 +396,335 @@ class RunAnsibleRole:
         generated_play_path = artifact_extra_logs_dir / "_ansible.play.yaml"
         with open(generated_play_path, "w") as f:
             yaml.dump(generated_play, f)
-        shutil.copy(generated_play_path, tmp_play_file.name)
-
-        cmd = ["ansible-playbook", "-vv", tmp_play_file.name]
 
         with open(artifact_extra_logs_dir / "_ansible.env", "w") as f:
             for k, v in env.items():
                 print(f"{k}={v}", file=f)
 
         with open(artifact_extra_logs_dir / "_python.cmd", "w") as f:
-            print(" ".join(map(shlex.quote, sys.argv)), file=f)
+            print(" ".join(map(shlex.quote, argv)), file=f)
 
+        self.generated_play = generated_play[0]
+        self.artifact_extra_logs_dir = artifact_extra_logs_dir
 
-        if remote_hostname:
-            cmd += ["--inventory-file", f"/proc/{os.getpid()}/fd/{inventory_fd}"]
 
-        sys.stdout.flush()
-        sys.stderr.flush()
+def _write_inventory(env, out):
+    """
+    Writes the inventory of the remote host in a file that disappears
+    when this process terminates. Returns the file object.
+    """
+
+    inventory_fd, path = tempfile.mkstemp()
+    os.remove(path) # using only the FD. Ensures that the file disappears when this process terminates
+    inventory_f = os.fdopen(inventory_fd, 'w')
+
+    host_properties = []
+    if remote_username := env.get("TOPSAIL_REMOTE_USERNAME"):
+        print(f"Using TOPSAIL_REMOTE_USERNAME={remote_username}", file=out) # value will be censored by OpenShift
+
+        host_properties.append("ansible_user="+remote_username)
+
+    # Configure OS-specific Ansible variables
+    if remote_os := env.get("TOPSAIL_REMOTE_OS"):
+        config = ANSIBLE_OS_CONFIGURATIONS.get(remote_os.lower())
+        if not config:
+            raise ValueError(f"TOPSAIL Ansible OS configuration not found for TOPSAIL_REMOTE_OS={remote_os}")
+        host_properties.extend(config)
+
+    inventory_content = f"""
+[all:vars]
+
+[remote]
+{env["TOPSAIL_REMOTE_HOSTNAME"]} {" ".join(host_properties)}
+"""
+
+    print(inventory_content, file=inventory_f)
+    inventory_f.flush()
 
-        ret = -1
+    return inventory_f
+
+
+def _run_plays(runnables, argvs, env, capture_stdout, capture_stderr, out, exit_on_interrupt=True):
+    """
+    Runs the prepared plays of the `runnables` in one ansible-playbook
+    process, and returns its subprocess.CompletedProcess.
+
+    When the execution fails, the FAILURE file of the role(s) that did
+    not complete is populated.
+    """
+
+    first_logs_dir = runnables[0].artifact_extra_logs_dir
+
+    # the play file must be in the directory where the 'roles' are
+    tmp_play_file = tempfile.NamedTemporaryFile(
+        "w+",
+        prefix="tmp_play_{}_".format(first_logs_dir.name),
+        suffix=".yaml",
+        dir=os.getcwd(),
+        delete=False,
+    )
+
+    yaml.dump([runnable.generated_play for runnable in runnables], tmp_play_file)
+    tmp_play_file.flush()
+
+    cmd = ["ansible-playbook", "-vv", tmp_play_file.name]
+
+    inventory_f = None
+    if env.get("TOPSAIL_REMOTE_HOSTNAME"):
+        inventory_f = _write_inventory(env, out)
+        cmd += ["--inventory-file", f"/proc/{os.getpid()}/fd/{inventory_f.fileno()}"]
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    ret = -1
+    run_result = None
+    span = trace.Span("ansible-playbook " + ", ".join(runnable.role_name for runnable in runnables), "ansible",
+                      artifact_extra_logs_dirs=[str(runnable.artifact_extra_logs_dir) for runnable in runnables])
+    try:
+        with span, subprocess.Popen(cmd, env=env,
+                                    stdout=subprocess.PIPE if capture_stdout else None,
+                                    stderr=subprocess.PIPE if capture_stderr else None) as proc:
+            with env_lib.subprocess_started(proc.pid):
+                try:
+                    stdout, stderr = proc.communicate()
+                except BaseException:
+                    # including KeyboardInterrupt, like subprocess.run
+                    proc.kill()
+                    raise
+            run_result = subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+        ret = run_result.returncode
+    except KeyboardInterrupt:
+        print("", file=out)
+        print("Interrupted :/", file=out)
+        if not exit_on_interrupt:
+            raise
+        sys.exit(1)
+    finally:
+        tmp_play_file.close()
         try:
-            run_result = subprocess.run(cmd, env=env, check=False)
-            ret = run_result.returncode
-        except KeyboardInterrupt:
-            print("")
-            print("Interrupted :/")
-            sys.exit(1)
+            os.remove(tmp_play_file.name)
+        except FileNotFoundError:
+            pass # play file was removed, ignore
+
+        if inventory_f:
+            inventory_f.close()
+
+        if ret != 0:
+            _write_batch_failures(runnables, argvs, ret)
+
+    return run_result
+
+
+def _write_batch_failures(runnables, argvs, ret):
+    # the plays run sequentially and ansible-playbook stops after the
+    # failed play. In batch mode, json_to_logfile creates the log file
+    # of each play when it starts: the last play with a log file is the
+    # one that failed, the following ones didn't run.
+    failed_idx = 0
+    if len(runnables) > 1:
+        for idx, runnable in enumerate(runnables):
+            if (runnable.artifact_extra_logs_dir / "_ansible.log.json").exists():
+                failed_idx = idx
+
+    for idx, (runnable, argv) in enumerate(zip(runnables, argvs)):
+        if idx < failed_idx:
+            continue
+
+        extra_dir_name = runnable.artifact_extra_logs_dir.name
+        with open(runnable.artifact_extra_logs_dir / "FAILURE", "a") as f:
+            if idx == failed_idx:
+                print(f"[{extra_dir_name}] {' '.join(argv)} --> {ret}", file=f)
+            else:
+                failed_dir_name = runnables[failed_idx].artifact_extra_logs_dir.name
+                print(f"[{extra_dir_name}] {' '.join(argv)} --> not executed, {failed_dir_name} failed", file=f)
+
+
+def run_batch(runnables, env=None, capture_stdout=False, capture_stderr=False, out=None):
+    """
+    Runs several toolbox roles as the successive plays of one
+    ansible-playbook invocation, to pay the ansible startup cost only once.
+
+    runnables: the RunAnsibleRole objects to execute, eg:
+               [Toolbox().cluster().capture_environment(), ...]
+    env: the environment of the ansible-playbook process (default: a copy of os.environ)
+    out: the file where the informative messages are printed (default: sys.stdout)
+
+    Each role gets its own ARTIFACT_EXTRA_LOGS_DIR, with its
+    `_ansible.play.yaml`, `_ansible.log.json` and `FAILURE` files. The
+    `_ansible.log` of the batch is stored in the directory of the first role.
+
+    Returns the subprocess.CompletedProcess of ansible-playbook.
+    """
+
+    if not runnables:
+        raise ValueError("run_batch: no role to execute")
+
+    if out is None:
+        out = sys.stdout
+
+    if env is None:
+        env = os.environ.copy()
+
+    batch_env = None
+    argvs = []
+    for runnable in runnables:
+        role_env = dict(env)
+        # each role must get its own artifacts directory
+        role_env.pop("ARTIFACT_EXTRA_LOGS_DIR", None)
+        if "ANSIBLE_JSON_TO_LOGFILE" not in env:
+            role_env["ANSIBLE_JSON_TO_LOGFILE_PER_PLAY"] = "true"
+
+        argv = ["run_toolbox.py", runnable.group, runnable.command]
+        runnable._prepare_play(role_env, argv, out)
+        argvs.append(argv)
+
+        # the ansible-playbook process environment is shared by all the plays
+        play_environment = runnable.generated_play.setdefault("environment", {})
+        play_environment["ARTIFACT_EXTRA_LOGS_DIR"] = str(runnable.artifact_extra_logs_dir)
+        with open(runnable.artifact_extra_logs_dir / "_ansible.play.yaml", "w") as f:
+            yaml.dump([runnable.generated_play], f)
+
+        if batch_env is None:
+            batch_env = role_env
+
+    batch_dirnames = [str(runnable.artifact_extra_logs_dir) for runnable in runnables]
+    for runnable in runnables:
+        with open(runnable.artifact_extra_logs_dir / "_ansible.batch", "w") as f:
+            yaml.dump(dict(ansible_log=batch_env["ANSIBLE_LOG_PATH"], roles=batch_dirnames), f)
+
+    return _run_plays(runnables, argvs, batch_env, capture_stdout, capture_stderr, out)
+
+
+_in_process_toolbox = None
+_in_process_lock = threading.Lock()
+_stream_proxy_lock = threading.Lock()
+
+
+class _ThreadStream(object):
+    """
+    Proxy of sys.stdout/sys.stderr, which redirects the writes of the
+    threads capturing it, and forwards the writes of the other threads
+    to the original stream.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, "target", None) or self._stream
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+@contextlib.contextmanager
+def _capture_stream(name, target):
+    """
+    Redirects the writes of the current thread to sys.<name> into
+    `target`. Unlike contextlib.redirect_stdout, the other threads keep
+    writing to the original stream.
+    """
+
+    with _stream_proxy_lock:
+        proxy = getattr(sys, name)
+        if not isinstance(proxy, _ThreadStream):
+            proxy = _ThreadStream(proxy)
+            setattr(sys, name, proxy)
+
+    previous = getattr(proxy._local, "target", None)
+    proxy._local.target = target
+    try:
+        yield
+    finally:
+        proxy._local.target = previous
+
+def _exit_code(system_exit):
+    if system_exit.code is None:
+        return 0
+    if isinstance(system_exit.code, int):
+        return system_exit.code
+
+    return 1
+
+
+def run_in_process(argv, env, capture_stdout=False, capture_stderr=False):
+    """
+    Runs a toolbox command in this Python process. Only the
+    ansible-playbook process is forked.
+
+    argv: the toolbox command line: [run_toolbox.py, group, command, args...]
+    env: the environment of the ansible-playbook process (updated in-place)
+
+    Returns a subprocess.CompletedProcess, with the stdout/stderr bytes if captured.
+    """
+    global _in_process_toolbox
+
+    import fire
+
+    # Print help rather than opening a pager (as run_toolbox.py does)
+    fire.core.Display = lambda lines, out: print(*lines, file=out)
+
+    out = io.StringIO() if capture_stdout else sys.stdout
+    err = io.StringIO() if capture_stderr else sys.stderr
+
+    runnable = None
+    returncode = 0
+
+    # the commands may update os.environ["ARTIFACT_TOOLBOX_NAME_SUFFIX"]
+    # while being resolved, so this step is serialized, and the suffix
+    # is moved into the ansible-playbook environment.
+    with _in_process_lock:
+        if _in_process_toolbox is None:
+            _in_process_toolbox = Toolbox()
+
+        prev_suffix = os.environ.get("ARTIFACT_TOOLBOX_NAME_SUFFIX")
+        _set_environ("ARTIFACT_TOOLBOX_NAME_SUFFIX", env.get("ARTIFACT_TOOLBOX_NAME_SUFFIX"))
+        try:
+            with contextlib.ExitStack() as capture:
+                if capture_stdout:
+                    capture.enter_context(_capture_stream("stdout", out))
+                if capture_stderr:
+                    capture.enter_context(_capture_stream("stderr", err))
+
+                runnable = fire.Fire(_in_process_toolbox, command=argv[1:], name=pathlib.Path(argv[0]).name,
+                                     serialize=lambda result: None) # do not print the result
+        except SystemExit as e: # fire.core.FireExit is a SystemExit
+            returncode = _exit_code(e)
+        except Exception:
+            traceback.print_exc(file=err)
+            returncode = 1
         finally:
-            try:
-                os.remove(tmp_play_file.name)
-            except FileNotFoundError:
-                pass # play file was removed, ignore
+            _set_environ("ARTIFACT_TOOLBOX_NAME_SUFFIX", os.environ.get("ARTIFACT_TOOLBOX_NAME_SUFFIX"), env)
+            _set_environ("ARTIFACT_TOOLBOX_NAME_SUFFIX", prev_suffix)
+
+    run_result = None
+    if returncode == 0 and hasattr(runnable, "_run_playbook"):
+        run_result = runnable._run_playbook(env, argv, capture_stdout=capture_stdout, capture_stderr=capture_stderr, out=out,
+                                            exit_on_interrupt=False)
+        returncode = run_result.returncode
+    # else: CLI didn't resolve completely (eg, --help) or failed
+
+    stdout = None
+    if capture_stdout:
+        stdout = out.getvalue().encode("utf8") + (run_result.stdout if run_result else b"")
+
+    stderr = None
+    if capture_stderr:
+        stderr = err.getvalue().encode("utf8") + (run_result.stderr if run_result else b"")
+
+    return subprocess.CompletedProcess(argv, returncode, stdout, stderr)
 
-            if ret != 0:
-                extra_dir_name = pathlib.Path(env['ARTIFACT_EXTRA_LOGS_DIR']).name
-                with open(artifact_extra_logs_dir / "FAILURE", "a") as f:
-                    print(f"[{extra_dir_name}] {' '.join(sys.argv)} --> {ret}", file=f)
 
-        raise SystemExit(ret)
+def _set_environ(key, value, environ=os.environ):
+    if value is None:
+        environ.pop(key, None)
+    else:
+        environ[key] = value
@@ -0,0 +1,84 @@
+import os
+import logging
+import traceback
+import functools
+
+import jinja2
+import jinja2.filters
+
+###
+# Rendering of the `command_args.yml.j2` files, shared by the
+# `from_config` toolbox command and the in-process resolver of the
+# `config` module.
+###
+
+def log_warning(msg):
+    logging.warning(msg)
+
+
+def raise_exception(msg):
+    raise Exception(msg)
+
+
+@jinja2.filters.pass_environment
+def or_env(environment, value, attribute=None):
+    if value:
+        return value
+
+    if not attribute:
+        # not a SystemExit: the templates are rendered inside the test orchestration
+        msg = "An attribute must be passed to or_env ..."
+        logging.error(msg)
+        raise ValueError(msg)
+
+    return os.getenv(attribute)
+
+
+FILTERS = dict(
+    or_env=or_env,
+    raise_exception=raise_exception,
+    log_warning=log_warning,
+)
+
+
+@functools.lru_cache(maxsize=16)
+def _compile_template(command_args_file, mtime_ns):
+    with open(command_args_file) as f:
+        command_args = f.read()
+
+    environment = jinja2.Environment()
+    environment.filters.update(FILTERS)
+
+    return environment.from_string(command_args)
+
+
+def render(config, command_args_file):
+    """
+    Renders the `command_args_file` Jinja template with the `config` dictionnary.
+
+    The compiled template is cached until the file is modified.
+    """
+
+    command_args_file = str(command_args_file)
+    command_args_tpl = _compile_template(command_args_file, os.stat(command_args_file).st_mtime_ns)
+
+    try:
+        return command_args_tpl.render(config)
+    except jinja2.exceptions.UndefinedError as e:
+        template_frame = traceback.extract_tb(e.__traceback__)[-2]
+        if template_frame.filename != "<template>":
+            raise e
+        msg = f"Error at line {template_frame.lineno} of file {command_args_file}: {e.message}"
+        logging.error("Failed to render the Jinja template.")
+        logging.error(msg)
+        raise jinja2.exceptions.UndefinedError(msg)
+
+
+def command_key(group, command, prefix=None, suffix=None):
+    key = f"{group} {command}"
+    if prefix:
+        key = f"{prefix}/{key}"
+    if suffix:
+        key = f"{key}/{suffix}"
+
+    return key
@@ -6,21 +6,40 @@ import yaml
 import shutil
 import subprocess
 import threading
+import contextvars
+import tempfile
 import re
 from collections import defaultdict
-import jsonpath_ng
 import copy
+import hashlib
+import json
 
 from . import env
 from . import run
 from . import common
+from . import jsonpath as jsonpath_lib
+from . import command_args as command_args_lib
+from . import presets as presets_lib
 
 TOPSAIL_DIR = pathlib.Path(common.__file__).parents[3]
 VARIABLE_OVERRIDES_FILENAME = "variable_overrides.yaml"
+PRESETS_APPLIED_FILENAME = "presets_applied"
+PRESETS_DIFF_FILENAME = "presets_diff.yaml"
 PR_ARG_KEY = "PR_POSITIONAL_ARG_"
 
 project = None # the project config will be populated in init()
 
+# the ConfigOverlay of the current thread or asyncio task
+_overlay_var = contextvars.ContextVar("config_overlay", default=None)
+
+# the references being resolved in the current context: ((reference, dependencies), ...)
+_resolving_var = contextvars.ContextVar("config_resolving", default=())
+
+_MULTI_REFERENCE_RE = re.compile(r"\{@.*?\}")
+
+# the values of these types are returned by get_config without a deep copy
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None), tuple)
+
 class TempValue(object):
     def __init__(self, config, key, value):
         self.config = config
@@ -40,6 +59,140 @@ class TempValue(object):
         return False # If we returned True here, any exception would be suppressed!
 
 
+class Transaction(object):
+    """
+    Batches the `set_config` calls, and writes the configuration file(s) only once, when the outermost transaction terminates.
+    Mind that the in-memory changes are not rolled back if an exception occurs.
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    def __enter__(self):
+        if self.config._get_overlay():
+            return self.config # the overlays are written lazily
+
+        self.config._transaction_depth += 1
+
+        return self.config
+
+    def __exit__(self, ex_type, ex_value, exc_traceback):
+        if self.config._get_overlay():
+            return False
+
+        self.config._transaction_depth -= 1
+
+        if self.config._transaction_depth == 0:
+            self.config.flush()
+
+        return False # If we returned True here, any exception would be suppressed!
+
+
+class ConfigSnapshot(object):
+    """
+    Read-only view of the configuration, as it was when the snapshot was taken.
+
+    The configuration documents are never modified in place
+    (`set_config` copies the dicts on the path of the updated key), so
+    taking a snapshot does not copy anything. `get_config` returns a
+    deep copy of the dicts and lists, so the callers can modify them.
+    Mind that the `config` document itself is shared, and must not be
+    modified in place.
+    """
+
+    read_only = True
+
+    def __init__(self, config, root, resolve_cache=None):
+        self.owner = config
+        self.root = root
+
+        self._config_hash = None
+        self._command_args_cache = None
+        _init_resolve_cache(self, resolve_cache)
+
+    @property
+    def config(self):
+        return self.root
+
+    def _call(self, method, *args, **kwargs):
+        token = _overlay_var.set(self)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _overlay_var.reset(token)
+
+    def get_config(self, *args, **kwargs):
+        return self._call(self.owner.get_config, *args, **kwargs)
+
+    def get_command_args(self, *args, **kwargs):
+        return self._call(self.owner.get_command_args, *args, **kwargs)
+
+
+class ConfigOverlay(ConfigSnapshot):
+    """
+    Applies `values` ({jsonpath: value}) on top of a snapshot of the configuration.
+
+    The overlay is only visible in the current thread or asyncio task,
+    and in the workers started from it with `contextvars.copy_context()`
+    (eg, the `run.Parallel` threads). The configuration file is not
+    modified. Inside the context, `set_config` updates the overlay, and
+    can be called from any thread.
+
+    base: the ConfigSnapshot to start from (default: the configuration of the current context)
+    config_path: where the overlay is saved for the `run_toolbox_from_config`
+                 commands (default: a temporary file of ARTIFACT_DIR,
+                 deleted when the context terminates)
+    """
+
+    read_only = False
+
+    def __init__(self, config, values, config_path=None, base=None):
+        super().__init__(config, None)
+
+        self.values = values
+        self.base = base
+        self.config_path = pathlib.Path(config_path) if config_path else None
+        self.temporary_file = config_path is None
+
+        self._dirty = True
+        self._token = None
+
+    def __enter__(self):
+        base = self.base or self.owner._current()
+        self.root = base.root
+        _init_resolve_cache(self, base._resolve_cache) # same document, same resolved references
+        self._token = _overlay_var.set(self)
+
+        for key, value in self.values.items():
+            self.owner.set_config(key, value, print=False)
+
+        return self
+
+    def __exit__(self, ex_type, ex_value, exc_traceback):
+        _overlay_var.reset(self._token)
+
+        if self.temporary_file and self.config_path:
+            self.config_path.unlink(missing_ok=True)
+
+        return False # If we returned True here, any exception would be suppressed!
+
+    def flush(self):
+        """
+        Saves the configuration of the overlay, and returns the path of the file.
+        """
+
+        if self.config_path is None:
+            fd, path = tempfile.mkstemp(prefix=".config.overlay.", suffix=".yaml", dir=env.ARTIFACT_DIR)
+            os.close(fd)
+            self.config_path = pathlib.Path(path)
+
+        if self._dirty:
+            _atomic_write(self.config_path, yaml.dump(self.root, indent=4, default_flow_style=False, sort_keys=False))
+            self._dirty = False
+
+        return self.config_path
+
+
 class Config:
     def __init__(self, testing_dir, config_path):
         self.testing_dir = testing_dir
@@ -52,8 +205,61 @@ class Config:
 
         logging.info(f"Loading configuration from {self.config_path} ...")
         with open(self.config_path) as config_f:
-            self.config = yaml.safe_load(config_f)
+            self.root = yaml.safe_load(config_f)
+
+        self._transaction_depth = 0
+        self._dirty = False
+
+        self._config_hash = None
+        self._command_args_cache = None
+        _init_resolve_cache(self)
+
+    def transaction(self):
+        return Transaction(self)
+
+    @property
+    def config(self):
+        # the configuration document of the current context. Must not be modified in place.
+        return self._current().root
+
+    def snapshot(self):
+        """
+        Returns a read-only ConfigSnapshot of the configuration of the current context.
+        """
+
+        current = self._current()
+
+        return ConfigSnapshot(self, current.root, current._resolve_cache)
+
+    def overlay(self, values=None, config_path=None, base=None):
+        """
+        Returns a context applying `values` ({jsonpath: value}) on top of
+        the configuration, for the current thread or asyncio task only. See ConfigOverlay.
+        """
+
+        return ConfigOverlay(self, values or {}, config_path, base)
 
+    def _get_overlay(self):
+        overlay = _overlay_var.get()
+
+        return overlay if overlay is not None and overlay.owner is self else None
+
+    def _current(self):
+        # the object holding the configuration of the current context
+        return self._get_overlay() or self
+
+    def flush(self):
+        if not self._dirty:
+            return
+
+        config_content = yaml.dump(self.root, indent=4, default_flow_style=False, sort_keys=False)
+
+        _atomic_write(self.config_path, config_content)
+
+        if (shared_dir := os.environ.get("SHARED_DIR")) and (shared_dir_path := pathlib.Path(shared_dir)) and shared_dir_path.exists():
+            _atomic_write(shared_dir_path / "config.yaml", config_content)
+
+        self._dirty = False
 
     def apply_config_overrides(self, *, ignore_not_found=False, variable_overrides_path=None, log=True):
         if variable_overrides_path is None:
@@ -72,56 +278,100 @@ class Config:
             logging.fatal(msg)
             raise ValueError(msg)
 
-        for key, value in variable_overrides.items():
-            MAGIC_DEFAULT_VALUE = object()
-            handled_secretly = True # current_value MUST NOT be printed below.
-            current_value = self.get_config(key, MAGIC_DEFAULT_VALUE, print=False, warn=False, handled_secretly=handled_secretly)
-            if current_value == MAGIC_DEFAULT_VALUE:
-                if ignore_not_found:
-                    continue
+        with self.transaction():
+            for key, value in variable_overrides.items():
+                MAGIC_DEFAULT_VALUE = object()
+                handled_secretly = True # current_value MUST NOT be printed below.
+                current_value = self.get_config(key, MAGIC_DEFAULT_VALUE, print=False, warn=False, handled_secretly=handled_secretly)
+                if current_value == MAGIC_DEFAULT_VALUE:
+                    if ignore_not_found:
+                        continue
+
+                    if "." in key:
+                        raise ValueError(f"Config key '{key}' does not exist, and cannot create it at the moment :/")
+
+                    self.root = self.root | {key: None}
+                    _invalidate_references(self, key)
+                    # set_config sees no change if the value is None
+                    self._dirty = True
 
-                if "." in key:
-                    raise ValueError(f"Config key '{key}' does not exist, and cannot create it at the moment :/")
+                self.set_config(key, value, print=False)
+                actual_value = self.get_config(key, print=False) # ensure that key has been set, raises an exception otherwise
+                if log:
+                    logging.info(f"config override: {key} --> {actual_value}")
 
-                self.config[key] = None
 
-            self.set_config(key, value, print=False)
-            actual_value = self.get_config(key, print=False) # ensure that key has been set, raises an exception otherwise
-            if log:
-                logging.info(f"config override: {key} --> {actual_value}")
+    def apply_preset(self, name, do_dump=True):
+        self.apply_presets([name], do_dump=do_dump)
 
+    def apply_presets(self, names, do_dump=True):
+        """
+        Applies the `names` presets, one after the other, in a single batch.
+
+        The presets are flattened first (see the `presets` module), so
+        that each config key is set only once. If `do_dump` is set, the
+        values applied are logged in the `presets_applied` file of
+        ARTIFACT_DIR, and the values modified in the `presets_diff.yaml` file.
+        """
+
+        if not names:
+            return
 
-    def apply_preset(self, name):
+        ci_presets = self.get_config("ci_presets", print=False)
         try:
-            values = self.get_config(f'ci_presets["{name}"]', print=False)
-        except IndexError:
-            logging.error(f"Preset '{name}' does not exists :/")
+            compiled = presets_lib.compile_presets(ci_presets, names)
+        except ValueError as e:
+            logging.error(f"Cannot apply the presets {names}: {e}")
             raise
 
-        logging.info(f"Applying preset '{name}' ==> {values}")
-        if values is None:
-            raise ValueError(f"Preset '{name}' does not exists")
+        logging.info(f"Applying the preset(s) {', '.join(names)} ==> {len(compiled.assignments)} values "
+                     f"from {', '.join(compiled.names)}")
 
-        presets = self.get_config("ci_presets.names", print=False) or []
-        if not name in presets:
-            self.set_config("ci_presets.names", presets + [name])
+        for conflict in compiled.conflicts:
+            logging.warning(f"preset[{conflict.overridden_by}] {conflict.key} --> {conflict.new_value} "
+                            f"overrides preset[{conflict.preset}] {conflict.key} --> {conflict.value}")
 
-        for key, value in values.items():
-            if key == "extends":
-                for extend_name in value:
-                    self.apply_preset(extend_name)
-                continue
+        applied = []
+        diff = {}
+        with self.transaction():
+            presets = self.get_config("ci_presets.names", print=False) or []
+            new_presets = [name for name in compiled.names if name not in presets]
+            if new_presets:
+                self.set_config("ci_presets.names", presets + new_presets)
 
-            msg = f"preset[{name}] {key} --> {value}"
-            logging.info(msg)
-            with open(env.ARTIFACT_DIR / "presets_applied", "a") as f:
-                print(msg, file=f)
+            for assignment in compiled.assignments:
+                msg = f"preset[{assignment.preset}] {assignment.key} --> {assignment.value}"
+                logging.info(msg)
+                applied.append(msg)
 
-            self.set_config(key, value, print=False)
+                try:
+                    previous_value = get_jsonpath(self._current().root, assignment.key) if do_dump else None
+                except IndexError as ex:
+                    logging.error(f"set_config: {assignment.key}={assignment.value} --> {ex}")
+                    raise KeyError(f"Key '{assignment.key}' not found in {self.config_path}")
+
+                self.set_config(assignment.key, assignment.value, print=False)
+
+                if do_dump and previous_value != assignment.value:
+                    diff[assignment.key] = dict(preset=assignment.preset, before=previous_value, after=assignment.value)
+
+        if not do_dump:
+            return
+
+        with open(env.ARTIFACT_DIR / PRESETS_APPLIED_FILENAME, "a") as f:
+            print("\n".join(applied), file=f)
+
+        with open(env.ARTIFACT_DIR / PRESETS_DIFF_FILENAME, "a") as f:
+            yaml.dump(dict(presets=list(names), applied=compiled.names, diff=diff,
+                           conflicts=[conflict._asdict() for conflict in compiled.conflicts]),
+                      f, indent=4, default_flow_style=False, sort_keys=False, explicit_start=True)
 
     def get_config(self, jsonpath, default_value=..., warn=True, print=True, handled_secretly=False):
+        if (resolving := _resolving_var.get()):
+            resolving[-1][1].add(jsonpath) # dependency of the reference being resolved
+
         try:
-            value = jsonpath_ng.parse(jsonpath).find(self.config)[0].value
+            value = get_jsonpath(self._current().root, jsonpath)
         except IndexError as ex:
             if default_value != ...:
                 if warn:
@@ -134,7 +384,11 @@ class Config:
         if isinstance(value, str) and value.startswith("*$@"):
             print = False
 
-        value = self.resolve_reference(value, handled_secretly)
+        resolved_value = self.resolve_reference(value, handled_secretly)
+        if resolved_value is value and not isinstance(value, _IMMUTABLE_TYPES):
+            # the document is shared with the snapshots and overlays, the caller may modify the value
+            resolved_value = copy.deepcopy(value)
+        value = resolved_value
 
         if print and not handled_secretly:
             logging.info(f"get_config: {jsonpath} --> {value}")
@@ -143,7 +397,13 @@ class Config:
 
 
     def set_config(self, jsonpath, value, print=True):
-        if threading.current_thread().name != "MainThread":
+        overlay = self._get_overlay()
+        current = overlay or self
+
+        if overlay is not None and overlay.read_only:
+            raise RuntimeError(f"set_config({jsonpath}, ...) cannot be called on a configuration snapshot")
+
+        if overlay is None and threading.current_thread().name != "MainThread":
             msg = f"set_config({jsonpath}, {value}) cannot be called from a thread, to avoid race conditions."
             if os.environ.get("OPENSHIFT_CI") or os.environ.get("PERFLAB_CI"):
                 logging.error(msg)
@@ -154,7 +414,10 @@ class Config:
 
         try:
             self.get_config(jsonpath, print=False, handled_secretly=True) # will raise an exception if the jsonpath does not exist
-            jsonpath_ng.parse(jsonpath).update(self.config, value)
+            previous_value = get_jsonpath(current.root, jsonpath)
+            # copy-on-write: the snapshots and overlays of the previous document are not affected
+            current.root = jsonpath_lib.updated(current.root, jsonpath, value)
+            _invalidate_references(current, jsonpath)
         except Exception as ex:
             logging.error(f"set_config: {jsonpath}={value} --> {ex}")
             raise
@@ -162,36 +425,86 @@ class Config:
         if print:
             logging.info(f"set_config: {jsonpath} --> {value}")
 
-        with open(self.config_path, "w") as f:
-            yaml.dump(self.config, f, indent=4, default_flow_style=False, sort_keys=False)
+        current._config_hash = None # invalidates the command_args cache
 
-        if (shared_dir := os.environ.get("SHARED_DIR")) and (shared_dir_path := pathlib.Path(shared_dir)) and shared_dir_path.exists():
+        unchanged = type(previous_value) is type(value) and previous_value == value
+        if previous_value is value and not isinstance(value, (str, int, float, bool, type(None))):
+            unchanged = False # the value may have been modified in-place
+
+        if unchanged:
+            # nothing changed, no need to write the file again
+            return
 
-            with open(shared_dir_path / "config.yaml", "w") as f:
-                yaml.dump(self.config, f, indent=4, default_flow_style=False, sort_keys=False)
+        current._dirty = True
+
+        if overlay is None and not self._transaction_depth:
+            self.flush()
 
     def save_config_overrides(self):
         variable_overrides_path = env.ARTIFACT_DIR / VARIABLE_OVERRIDES_FILENAME
 
         if not variable_overrides_path.exists():
             logging.debug(f"save_config_overrides: {variable_overrides_path} does not exist, nothing to save.")
-            self.config["overrides"] = {}
+            self.root = self.root | {"overrides": {}}
+            _invalidate_references(self, "overrides")
+            self._dirty = True
+            self._config_hash = None
             return
 
         with open(variable_overrides_path) as f:
             variable_overrides = yaml.safe_load(f)
 
-        self.config["overrides"] = variable_overrides
+        self.root = self.root | {"overrides": variable_overrides}
+        _invalidate_references(self, "overrides")
+        self._dirty = True
+        self._config_hash = None
+
+    def get_command_args(self, group, command, prefix=None, suffix=None):
+        """
+        Returns the arguments of a toolbox command, as rendered from the `command_args.yml.j2` file.
+
+        The rendered document is cached, and reused as long as the
+        configuration, the environment and the template file don't
+        change.
+        """
+        command_args_file = pathlib.Path(os.environ.get("TOPSAIL_FROM_COMMAND_ARGS_FILE", self.testing_dir / "command_args.yml.j2"))
+        current = self._current()
+
+        if current._config_hash is None:
+            config_dump = json.dumps(current.root, sort_keys=True, default=str)
+            current._config_hash = hashlib.sha256(config_dump.encode("utf8")).hexdigest()
+
+        cache_key = (
+            str(command_args_file),
+            command_args_file.stat().st_mtime_ns,
+            current._config_hash,
+            hash(frozenset(os.environ.items())), # the template can access the environment
+        )
+
+        if current._command_args_cache and current._command_args_cache[0] == cache_key:
+            all_command_args = current._command_args_cache[1]
+        else:
+            rendered = command_args_lib.render(current.root, command_args_file)
+            all_command_args = yaml.safe_load(rendered)
+            current._command_args_cache = (cache_key, all_command_args)
+
+        command_key = command_args_lib.command_key(group, command, prefix, suffix)
+        try:
+            return copy.deepcopy(all_command_args[command_key])
+        except KeyError:
+            raise KeyError(f"key '{command_key}' not found in {command_args_file}")
 
     def apply_preset_from_pr_args(self):
+        presets_to_apply = []
         for config_key in self.get_config("$", print=False).keys():
             if not config_key.startswith(PR_ARG_KEY): continue
             if config_key == f"{PR_ARG_KEY}0": continue
 
             presets = self.get_config(config_key)
             if not presets: continue
-            for preset in presets.strip().split(" "):
-                self.apply_preset(preset)
+            presets_to_apply += presets.strip().split(" ")
+
+        self.apply_presets(presets_to_apply)
 
     def detect_apply_light_profile(self, profile, name_suffix="light"):
         if os.environ.get("OPENSHIFT_CI"):
@@ -280,7 +593,7 @@ class Config:
 
         def multi_dereference():
             new_value = value
-            for ref in re.findall(r"\{@.*?\}", value):
+            for ref in _MULTI_REFERENCE_RE.findall(value):
                 ref_key = ref.strip("{@}")
                 ref_value = self.get_config(ref_key, print=False)
                 new_value = new_value.replace(ref, str(ref_value))
@@ -290,6 +603,7 @@ class Config:
         # --- #
 
         if value.startswith("*$@"):
+            # not cached: the secret values must not stay in memory
             return secret_file_dereference()
 
         if value.startswith("*@"):
@@ -304,16 +618,89 @@ class Config:
 
         # --- #
 
+        current = self._current()
+        resolving = _resolving_var.get()
 
-        new_value = simple_dereference() if value.startswith("@") \
-            else multi_dereference()
+        cached = current._resolve_cache.get(value)
+        if cached is not None:
+            new_value, dependencies = cached
+        else:
+            if any(reference == value for reference, _ in resolving):
+                chain = " -> ".join([reference for reference, _ in resolving] + [value])
+                msg = f"resolve_reference: circular reference: {chain}"
+                logging.fatal(msg)
+                raise ValueError(msg)
+
+            root = current.root
+            dependencies = set()
+            token = _resolving_var.set(resolving + ((value, dependencies),))
+            try:
+                new_value = simple_dereference() if value.startswith("@") \
+                    else multi_dereference()
+            finally:
+                _resolving_var.reset(token)
+
+            with current._resolve_lock:
+                if current.root is root: # not modified by another thread in the meantime
+                    current._resolve_cache[value] = (new_value, dependencies)
+
+        if resolving:
+            # the dependencies are transitive
+            resolving[-1][1].update(dependencies)
 
         if not handled_secretly:
             logging.info(f"resolve_reference: {value} ==> '{new_value}'")
 
+        if isinstance(new_value, _IMMUTABLE_TYPES):
+            return new_value
+
         return copy.deepcopy(new_value)
 
 
+def _init_resolve_cache(holder, resolve_cache=None):
+    # holder: the Config or ConfigSnapshot owning the configuration document
+    # resolve_cache: {reference --> (resolved value, set of the jsonpaths it depends on)}
+    holder._resolve_cache = dict(resolve_cache or {})
+    holder._resolve_lock = threading.Lock()
+
+
+def _depends_on(dependency, keys):
+    # tells if a `dependency` jsonpath may be affected by the update of the `keys` path
+    dependency_keys = jsonpath_lib.simple_keys(dependency)
+    if dependency_keys is None:
+        return True # not a plain key, cannot tell
+
+    shortest = min(len(dependency_keys), len(keys))
+
+    return dependency_keys[:shortest] == keys[:shortest]
+
+
+def _invalidate_references(holder, jsonpath):
+    """
+    Drops the resolved references of `holder` depending on the `jsonpath` value.
+    """
+
+    keys = jsonpath_lib.simple_keys(jsonpath)
+    with holder._resolve_lock:
+        if keys is None:
+            holder._resolve_cache.clear()
+            return
+
+        for reference, (_, dependencies) in list(holder._resolve_cache.items()):
+            if any(_depends_on(dependency, keys) for dependency in dependencies):
+                del holder._resolve_cache[reference]
+
+
+def _atomic_write(path, content):
+    # write in a temporary file of the same directory, then rename it,
+    # so that the file is never seen partially written
+    tmp_path = path.parent / f".{path.name}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+
+    os.replace(tmp_path, path)
+
+
 def _set_config_environ(testing_dir):
     reloading = False
     config_path_final = pathlib.Path(env.ARTIFACT_DIR / "config.yaml")
@@ -345,27 +732,49 @@ def _set_config_environ(testing_dir):
 
 
 def get_command_arg(group, command, arg, prefix=None, suffix=None, mute=False):
-    try:
-        if not mute:
-            logging.info(f"get_command_arg: {group} {command} {arg}")
+    if not mute:
+        logging.info(f"get_command_arg: {group} {command} {arg}")
+
+    if project is None:
+        # configuration not loaded in this process, ask run_toolbox.py
+        try:
+            proc = run.run_toolbox_from_config(group, command, show_args=arg,
+                                               prefix=prefix, suffix=suffix,
+                                               check=True,
+                                               run_kwargs=dict(capture_stdout=True, capture_stderr=True, log_command=(not mute)))
+        except subprocess.CalledProcessError as e:
+            logging.error(e.stderr.strip().decode("ascii", "ignore"))
+            raise
+
+        return proc.stdout.strip()
+
+    command_args = project.get_command_args(group, command, prefix=prefix, suffix=suffix)
+
+    # same format as `run_toolbox.py from_config ... --show_args=arg`
+    return str(command_args[arg]).strip()
+
+
+def overlay_config_file():
+    """
+    Returns the path of the configuration file of the current ConfigOverlay, or None outside of an overlay.
+    """
+
+    if project is None:
+        return None
 
-        proc = run.run_toolbox_from_config(group, command, show_args=arg,
-                                           prefix=prefix, suffix=suffix,
-                                           check=True,
-                                           run_kwargs=dict(capture_stdout=True, capture_stderr=True, log_command=(not mute)))
-    except subprocess.CalledProcessError as e:
-        logging.error(e.stderr.strip().decode("ascii", "ignore"))
-        raise
+    overlay = project._get_overlay()
+    if overlay is None:
+        return None
 
-    return proc.stdout.strip()
+    return overlay.flush()
 
 
 def set_jsonpath(config, jsonpath, value):
     get_jsonpath(config, jsonpath) # will raise an exception if the jsonpath does not exist
-    jsonpath_ng.parse(jsonpath).update(config, value)
+    jsonpath_lib.update(config, jsonpath, value)
 
 def get_jsonpath(config, jsonpath):
-    return jsonpath_ng.parse(jsonpath).find(config)[0].value
+    return jsonpath_lib.get(config, jsonpath)
 
 
 def test_skip_list():
@@ -428,31 +837,31 @@ def init(testing_dir, apply_preset_from_pr_args=False, apply_config_overrides=Tr
 
     repo_var_overrides = TOPSAIL_DIR / VARIABLE_OVERRIDES_FILENAME
 
-    if repo_var_overrides.exists():
-        logging.info(f"Found '{repo_var_overrides}', apply the variables overrides from it.")
-        project.apply_config_overrides(variable_overrides_path=repo_var_overrides)
+    with project.transaction():
+        if repo_var_overrides.exists():
+            logging.info(f"Found '{repo_var_overrides}', apply the variables overrides from it.")
+            project.apply_config_overrides(variable_overrides_path=repo_var_overrides)
 
-    ci_presets_to_apply = project.get_config("ci_presets.to_apply", [], warn=False)
-    if isinstance(ci_presets_to_apply, str):
-        ci_presets_to_apply = [ci_presets_to_apply]
+        ci_presets_to_apply = project.get_config("ci_presets.to_apply", [], warn=False)
+        if isinstance(ci_presets_to_apply, str):
+            ci_presets_to_apply = [ci_presets_to_apply]
 
-    for preset in ci_presets_to_apply:
-        project.apply_preset(preset)
+        project.apply_presets(ci_presets_to_apply)
 
-    variable_overrides_to_apply = project.get_config("ci_presets.variable_overrides", {}, warn=False)
-    for var_name, var_value in variable_overrides_to_apply.items():
-        project.set_config(var_name, var_value)
+        variable_overrides_to_apply = project.get_config("ci_presets.variable_overrides", {}, warn=False)
+        for var_name, var_value in variable_overrides_to_apply.items():
+            project.set_config(var_name, var_value)
 
-    if repo_var_overrides.exists():
-        # reapply to force overrides on top of presets
-        project.apply_config_overrides(variable_overrides_path=repo_var_overrides, log=False)
+        if repo_var_overrides.exists():
+            # reapply to force overrides on top of presets
+            project.apply_config_overrides(variable_overrides_path=repo_var_overrides, log=False)
 
-    project.apply_config_overrides()
+        project.apply_config_overrides()
 
-    if apply_preset_from_pr_args:
-        project.apply_preset_from_pr_args()
-        # reapply to force overrides on top of presets
-        project.apply_config_overrides(log=False)
+        if apply_preset_from_pr_args:
+            project.apply_preset_from_pr_args()
+            # reapply to force overrides on top of presets
+            project.apply_config_overrides(log=False)
 
     test_skip_list()
 
@@ -4,25 +4,42 @@ import time
 import traceback
 import logging
 import threading
+import contextvars
+import contextlib
+import fcntl
+import re
+
+from . import trace
 
 ###
-# The code below required to properly set the ARTIFACT_DIR in the
-# thead local storage, so that threads don't share the same
-# ARTIFACT_DIR value (and don't update the shared value)
+# The ARTIFACT_DIR is stored in a context variable, so that threads,
+# asyncio tasks and worker processes don't share the same ARTIFACT_DIR
+# value (and don't update the shared value).
+#
+# The threads started with `threading.Thread.start` inherit the
+# artifact directory of the thread starting them. The other contexts
+# (worker processes, thread pools) must propagate it explicitly, with
+# `contextvars.copy_context().run` or `run_in_artifact_dir`. Subprocesses
+# receive it in their environment, with `subprocess_environ`.
+#
+# `$ARTIFACT_DIR` is only updated by the main thread: the environment
+# is shared by all the threads.
 ###
 
 class MyThread(threading.Thread):
 
     def __init__(self, *args, **kwargs):
         super(MyThread, self).__init__(*args, **kwargs)
-        self.parent_artifact_dict = None
+        self.parent_artifact_dir = None
 
     def start(self):
-        self.parent_artifact_dict = get_tls_artifact_dir()
+        self.parent_artifact_dir = _artifact_dir_var.get()
         super(MyThread, self).start()
 
     def run(self):
-        _set_tls_artifact_dir(self.parent_artifact_dict)
+        if self.parent_artifact_dir is not None:
+            # the environment is left untouched, see _update_environ
+            _artifact_dir_var.set(self.parent_artifact_dir)
         super(MyThread, self).run()
 
 threading.Thread = MyThread
@@ -35,20 +52,116 @@ def __getattr__(name):
     return globals()[name]
 
 _main_artifact_dir = None
-_tls_artifact_dir = threading.local()
+_artifact_dir_var = contextvars.ContextVar("ARTIFACT_DIR", default=None)
 
 def get_tls_artifact_dir():
-    return _tls_artifact_dir.val
+    # contexts where the artifact directory hasn't been propagated
+    # fall back to the main artifact directory
+    return _artifact_dir_var.get() or _main_artifact_dir
 
 
 def _set_tls_artifact_dir(value):
-    _tls_artifact_dir.val = value
+    token = _artifact_dir_var.set(value)
+    _update_environ()
+
+    return token
+
+
+def _reset_tls_artifact_dir(token, previous_value):
+    try:
+        _artifact_dir_var.reset(token)
+    except ValueError:
+        # the context changed since the token was created
+        _artifact_dir_var.set(previous_value)
+
+    _update_environ()
+
+
+def _update_environ():
+    # $ARTIFACT_DIR is kept up to date for the main thread code reading
+    # it directly. The environment is shared by all the threads, so
+    # the other threads only pass their ARTIFACT_DIR to their
+    # subprocesses, with `subprocess_environ`.
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    artifact_dir = get_tls_artifact_dir()
+    if artifact_dir is not None:
+        os.environ["ARTIFACT_DIR"] = str(artifact_dir)
+
+
+def subprocess_environ(environ=None):
+    """
+    Returns a copy of `environ` (default: os.environ) with the ARTIFACT_DIR of the current context.
+    """
+
+    sub_environ = dict(os.environ if environ is None else environ)
+    artifact_dir = get_tls_artifact_dir()
+    if artifact_dir is not None:
+        sub_environ["ARTIFACT_DIR"] = str(artifact_dir)
+
+    return sub_environ
+
+
+# the set of the subprocesses started in the current context,
+# {(pid, leads its process group)}, when they are tracked (run.Parallel tasks)
+_subprocesses_var = contextvars.ContextVar("subprocesses", default=None)
+
+
+def track_subprocesses(subprocesses):
+    """
+    Records the subprocesses started in the current context (see
+    `subprocess_started`) in the `subprocesses` set.
+    """
+
+    _subprocesses_var.set(subprocesses)
+
+
+@contextlib.contextmanager
+def subprocess_started(pid, process_group=False):
+    """
+    Records the `pid` subprocess in the tracked subprocesses of the
+    current context while it runs, so that `run.Parallel` can kill the
+    subprocesses of the tasks still running after their cancellation.
+
+    process_group: True if the subprocess leads its own process group
+    """
+
+    subprocesses = _subprocesses_var.get()
+    if subprocesses is None:
+        yield
+        return
+
+    subprocess = (pid, process_group)
+    subprocesses.add(subprocess)
+    try:
+        yield
+    finally:
+        subprocesses.discard(subprocess)
+
+
+def run_in_artifact_dir(artifact_dir, function, *args, **kwargs):
+    """
+    Runs `function(*args, **kwargs)` with `artifact_dir` as ARTIFACT_DIR.
+
+    Meant to propagate the artifact directory into worker processes
+    (the function and its arguments must be picklable).
+    """
+
+    previous_artifact_dir = _artifact_dir_var.get()
+    token = _set_tls_artifact_dir(pathlib.Path(artifact_dir))
+    try:
+        return function(*args, **kwargs)
+    finally:
+        _reset_tls_artifact_dir(token, previous_artifact_dir)
 
 ###
-# end of the thread local storage code
+# end of the artifact directory context code
 ###
 
 def init():
+    global _main_artifact_dir
+
     if "ARTIFACT_DIR" in os.environ:
         artifact_dir = pathlib.Path(os.environ["ARTIFACT_DIR"])
 
@@ -60,8 +173,11 @@ def init():
         os.environ["ARTIFACT_DIR"] = str(artifact_dir)
 
     artifact_dir.mkdir(parents=True, exist_ok=True)
+    _main_artifact_dir = artifact_dir
     _set_tls_artifact_dir(artifact_dir)
 
+    trace.init(artifact_dir)
+
 
 def NextArtifactDir(name, *, lock=None, counter_p=None):
     if lock:
@@ -69,7 +185,7 @@ def NextArtifactDir(name, *, lock=None, counter_p=None):
             next_count = counter_p[0]
             counter_p[0] += 1
     else:
-        next_count = next_artifact_index()
+        next_count = allocate_artifact_index(get_tls_artifact_dir())
 
     dirname = get_tls_artifact_dir() / f"{next_count:03d}__{name}"
 
@@ -80,30 +196,99 @@ class TempArtifactDir(object):
     def __init__(self, dirname):
         self.dirname = pathlib.Path(dirname)
         self.previous_dirname = None
+        self.token = None
+        self.span = trace.Span(self.dirname.name, "artifact_dir", dirname=str(self.dirname))
 
     def __enter__(self):
         self.previous_dirname = get_tls_artifact_dir()
-        os.environ["ARTIFACT_DIR"] = str(self.dirname)
         self.dirname.mkdir(exist_ok=True)
 
-        _set_tls_artifact_dir(self.dirname)
+        self.token = _set_tls_artifact_dir(self.dirname)
+        self.span.__enter__()
 
         return True
 
     def __exit__(self, ex_type, ex_value, exc_traceback):
-        global _ARTIFACT_DIR
-
         if ex_value:
             logging.error(f"Caught exception {ex_type.__name__}: {ex_value}")
             with open(get_tls_artifact_dir() / "FAILURE", "a") as f:
                 print(f"{ex_type.__name__}: {ex_value}", file=f)
                 print(''.join(traceback.format_exception(None, value=ex_value, tb=exc_traceback)), file=f)
 
-        os.environ["ARTIFACT_DIR"] = str(self.previous_dirname)
-        _set_tls_artifact_dir(self.previous_dirname)
+        self.span.__exit__(ex_type, ex_value, exc_traceback)
+        _reset_tls_artifact_dir(self.token, self.previous_dirname)
 
         return False # If we returned True here, any exception would be suppressed!
 
 
 def next_artifact_index():
-    return len(list(get_tls_artifact_dir().glob("*__*")))
+    """
+    Returns the index of the next `NNN__name` directory of the current
+    ARTIFACT_DIR, without reserving it (see `allocate_artifact_index`).
+    """
+
+    dirname = get_tls_artifact_dir()
+    try:
+        fd = os.open(dirname / ARTIFACT_INDEX_FILENAME, os.O_RDONLY)
+    except FileNotFoundError:
+        return _next_free_artifact_index(dirname, None)
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        return _next_free_artifact_index(dirname, os.read(fd, 64).strip())
+    finally:
+        os.close(fd) # releases the lock
+
+
+# counter of the `NNN__name` entries of an artifact directory
+ARTIFACT_INDEX_FILENAME = ".artifact_index"
+
+_ARTIFACT_INDEX_RE = re.compile(r"^(\d+)__")
+
+def _next_free_artifact_index(dirname, content):
+    # the counter may lag behind the directories created without it
+    # (eg, by the shell scripts counting the `*__*` entries), so the
+    # next index is also above the highest `NNN__` prefix.
+
+    try:
+        counter = int(content) if content else 0
+    except ValueError:
+        logging.warning(f"Invalid artifact index file in {dirname}: {content}. Ignoring it.")
+        counter = 0
+
+    highest = -1
+    with os.scandir(dirname) as entries:
+        for entry in entries:
+            if (match := _ARTIFACT_INDEX_RE.match(entry.name)):
+                highest = max(highest, int(match.group(1)))
+
+    return max(counter, highest + 1)
+
+
+def allocate_artifact_index(dirname):
+    """
+    Allocates and returns the next `NNN__name` index of `dirname`.
+
+    The index is reserved in a counter file, protected with an
+    exclusive lock, so that concurrent allocations (from threads or
+    processes) never return the same value. The index is also above
+    the highest `NNN__` prefix of the directory, so that the entries
+    created without the counter are never reused.
+    """
+
+    dirname = pathlib.Path(dirname)
+    dirname.mkdir(parents=True, exist_ok=True)
+
+    fd = os.open(dirname / ARTIFACT_INDEX_FILENAME, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        index = _next_free_artifact_index(dirname, os.read(fd, 64).strip())
+
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{index + 1}\n".encode())
+    finally:
+        os.close(fd) # releases the lock
+
+    return index
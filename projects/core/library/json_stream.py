@@ -0,0 +1,127 @@
+import re
+import json
+
+###
+# Incremental parsing of the big JSON lists returned by `oc get
+# ... -ojson` (`{"apiVersion": ..., "items": [{...}, {...}], ...}`).
+#
+# The text is fed chunk by chunk, and the elements of the list are
+# returned as soon as they are complete, so that only one element is
+# kept in memory at a time.
+###
+
+_SPECIAL_CHARS_RE = re.compile(r'["\\\[\]{}]')
+
+
+class JSONItemsParser(object):
+    """
+    Incremental parser of the elements of the `key` list of a JSON
+    object. The elements of the list must be JSON objects or arrays.
+
+    Example:
+
+    parser = JSONItemsParser("items")
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            ...
+    parser.close()
+    """
+
+    def __init__(self, key="items"):
+        self.key = key
+
+        self.depth = 0
+        self.in_string = False
+        self.skip_next = False # the first char of the next chunk is escaped
+
+        self.in_list = False
+        self.list_done = False
+
+        # the last string found at depth 1 (the key of the next value)
+        self.string_pieces = None
+        self.last_string = None
+
+        # the pieces of the current element of the list
+        self.item_pieces = None
+
+    def feed(self, text):
+        """
+        Parses `text`, and returns the list of the elements completed.
+        """
+
+        items = []
+        if self.list_done or not text:
+            return items
+
+        item_start = 0 if self.item_pieces is not None else None
+        string_start = 0 if self.string_pieces is not None else None
+
+        # an escape consumes exactly the next char, whatever it is,
+        # including the first char of the next chunk
+        escaped_pos = 0 if self.skip_next else None
+        self.skip_next = False
+
+        for match in _SPECIAL_CHARS_RE.finditer(text):
+            pos = match.start()
+            char = text[pos]
+
+            if pos == escaped_pos:
+                continue # escaped char
+
+            if self.in_string:
+                if char == "\\":
+                    escaped_pos = pos + 1
+                    if escaped_pos == len(text):
+                        self.skip_next = True
+                elif char == '"':
+                    self.in_string = False
+                    if string_start is not None:
+                        self.string_pieces.append(text[string_start:pos])
+                        self.last_string = "".join(self.string_pieces)
+                        self.string_pieces = None
+                        string_start = None
+                continue
+
+            if char == '"':
+                self.in_string = True
+                if self.depth == 1:
+                    self.string_pieces = []
+                    string_start = pos + 1
+
+            elif char in "[{":
+                self.depth += 1
+
+                if self.depth == 2 and char == "[" and not self.in_list and self.last_string == self.key:
+                    self.in_list = True
+                elif self.depth == 3 and self.in_list:
+                    self.item_pieces = []
+                    item_start = pos
+
+            elif char in "]}":
+                self.depth -= 1
+
+                if self.depth == 2 and self.in_list and self.item_pieces is not None:
+                    self.item_pieces.append(text[item_start:pos+1])
+                    items.append(json.loads("".join(self.item_pieces)))
+                    self.item_pieces = None
+                    item_start = None
+
+                elif self.depth == 1 and self.in_list:
+                    self.in_list = False
+                    self.list_done = True
+                    break
+
+        if item_start is not None and self.item_pieces is not None:
+            self.item_pieces.append(text[item_start:])
+        if string_start is not None and self.string_pieces is not None:
+            self.string_pieces.append(text[string_start:])
+
+        return items
+
+    def close(self):
+        """
+        Raises a ValueError if the document did not contain a complete `key` list.
+        """
+
+        if not self.list_done:
+            raise ValueError(f"Incomplete JSON document: '{self.key}' list not found or not terminated")
@@ -0,0 +1,137 @@
+import re
+import copy
+import functools
+
+import jsonpath_ng
+
+###
+# jsonpath_ng.parse is expensive (it runs a PLY lexer and parser on
+# every call), and the config helpers call it thousands of times per
+# test run. Most of the keys are plain `a.b.c` / `a["b"]` lookups that
+# don't need jsonpath at all: they are resolved with a direct dict walk.
+# The other expressions are parsed once and kept in a bounded LRU cache.
+###
+
+JSONPATH_CACHE_SIZE = 1024
+
+# jsonpath_ng lexer identifiers
+_ID_RE = r"[a-zA-Z_][a-zA-Z0-9_\-]*"
+_SIMPLE_SEGMENT_RE = re.compile(rf"""\.({_ID_RE})|\[\s*"([^"\\]*)"\s*\]|\[\s*'([^'\\]*)'\s*\]""")
+
+# jsonpath_ng lexer reserved words, cannot be used as plain field names
+_RESERVED_WORDS = ("where", "wherenot")
+
+
+@functools.lru_cache(maxsize=JSONPATH_CACHE_SIZE)
+def parse(jsonpath):
+    """Returns the compiled jsonpath_ng expression of `jsonpath`, from the cache if available"""
+
+    return jsonpath_ng.parse(jsonpath)
+
+
+@functools.lru_cache(maxsize=JSONPATH_CACHE_SIZE)
+def simple_keys(jsonpath):
+    """
+    Returns the tuple of dict keys to walk to resolve `jsonpath`,
+    or None if `jsonpath` isn't a plain `a.b.c` / `a["b"]` key.
+
+    '$' returns an empty tuple (the document root).
+    """
+
+    path = jsonpath.strip()
+
+    if path == "$":
+        return ()
+
+    if path.startswith("$"):
+        path = path[1:]
+    else:
+        path = "." + path
+
+    keys = []
+    pos = 0
+    while pos < len(path):
+        match = _SIMPLE_SEGMENT_RE.match(path, pos)
+        if not match:
+            return None
+
+        name, dquoted, squoted = match.groups()
+        if name is not None:
+            if name in _RESERVED_WORDS:
+                return None
+            keys.append(name)
+        else:
+            keys.append(dquoted if dquoted is not None else squoted)
+
+        pos = match.end()
+
+    return tuple(keys) if keys else None
+
+
+def _walk(data, keys, jsonpath):
+    for key in keys:
+        if not isinstance(data, dict) or key not in data:
+            raise IndexError(f"{jsonpath}: key '{key}' not found")
+        data = data[key]
+
+    return data
+
+
+def get(data, jsonpath):
+    """
+    Returns the first value matching `jsonpath` in `data`.
+
+    Raises IndexError if nothing matches (like `jsonpath_ng.parse(jsonpath).find(data)[0]`).
+    """
+
+    keys = simple_keys(jsonpath)
+    if keys is not None:
+        return _walk(data, keys, jsonpath)
+
+    return parse(jsonpath).find(data)[0].value
+
+
+def update(data, jsonpath, value):
+    """
+    Updates the value(s) matching `jsonpath` in `data`.
+
+    Mind that this function does not check that `jsonpath` exists.
+    """
+
+    keys = simple_keys(jsonpath)
+    if keys and not callable(value):
+        try:
+            parent = _walk(data, keys[:-1], jsonpath)
+        except IndexError:
+            parent = None
+
+        if isinstance(parent, dict) and keys[-1] in parent:
+            parent[keys[-1]] = value
+            return data
+
+    return parse(jsonpath).update(data, value)
+
+
+def updated(data, jsonpath, value):
+    """
+    Returns a copy of `data` where the value(s) matching `jsonpath` are replaced with `value`.
+
+    `data` is not modified. For the plain `a.b.c` keys, only the
+    dicts on the path to the value are copied, the rest of the
+    document is shared with `data`.
+    """
+
+    keys = simple_keys(jsonpath)
+    if not keys or callable(value):
+        return parse(jsonpath).update(copy.deepcopy(data), value)
+
+    def set_path(node, depth):
+        if not isinstance(node, dict) or keys[depth] not in node:
+            raise IndexError(f"{jsonpath}: key '{keys[depth]}' not found")
+
+        new_node = dict(node)
+        new_node[keys[depth]] = value if depth == len(keys) - 1 else set_path(node[keys[depth]], depth + 1)
+
+        return new_node
+
+    return set_path(data, 0)
@@ -0,0 +1,556 @@
+import os
+import ssl
+import json
+import time
+import queue
+import socket
+import base64
+import pathlib
+import logging
+import tempfile
+import threading
+import http.client
+import urllib.parse
+
+import yaml
+
+from projects.core.library import trace
+
+###
+# Minimal Kubernetes REST client, to query the cluster without forking
+# an `oc` process for each request.
+#
+# The HTTP connections to the API server are kept alive and shared
+# between the threads. The `wait_for*` helpers list the resources once,
+# then follow their modifications with a `watch` request, so that a
+# condition is detected as soon as the API server reports it, without
+# polling.
+#
+# The client only relies on the Python standard library. It reads the
+# current context of the kubeconfig file, or it can be pointed to any
+# API server URL (eg, a fake API server, or `oc proxy`).
+###
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_REQUEST_TIMEOUT = 60 # seconds
+DEFAULT_WAIT_TIMEOUT = 300 # seconds
+DEFAULT_LIST_PAGE_SIZE = 500
+
+# the API server closes the watch requests after this delay, and they are restarted
+WATCH_SERVER_TIMEOUT = 240 # seconds
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+
+class ApiError(Exception):
+    """
+    Error returned by the Kubernetes API server.
+    """
+
+    def __init__(self, status, reason, message=""):
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+        super().__init__(f"{status} {reason}: {message}" if message else f"{status} {reason}")
+
+
+class NotFoundError(ApiError):
+    pass
+
+
+class _WatchExpired(Exception):
+    # the resourceVersion of the watch is too old (410 Gone), the resources must be listed again
+    pass
+
+
+class Client(object):
+    """
+    Kubernetes REST API client.
+
+    server: the URL of the API server (eg, https://api.cluster:6443 or http://127.0.0.1:8001)
+    token: the bearer token used to authenticate the requests
+    ca_file, ca_data: the certificate authority of the API server
+    cert_file, key_file: the client certificate used to authenticate the requests
+    insecure: if True, the certificate of the API server is not verified
+    pool_size: the maximum number of idle connections kept open
+    timeout: the timeout (in seconds) of the requests
+    """
+
+    def __init__(self, server, token=None, ca_file=None, ca_data=None, cert_file=None, key_file=None,
+                 insecure=False, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_REQUEST_TIMEOUT):
+
+        url = urllib.parse.urlsplit(server)
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"Invalid API server URL: {server}")
+
+        self.server = server
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+        self.ssl_context = None
+        if self.scheme == "https":
+            self.ssl_context = ssl.create_default_context(cafile=ca_file, cadata=ca_data)
+            if insecure:
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+            if cert_file:
+                self.ssl_context.load_cert_chain(cert_file, key_file)
+
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._resources = {} # resource name --> (api path, plural, namespaced)
+        self._resources_lock = threading.Lock()
+
+    @classmethod
+    def from_kubeconfig(cls, kubeconfig=None, context=None, **kwargs):
+        """
+        Creates a client for the `context` (default: the current context) of the `kubeconfig` file
+        (default: $KUBECONFIG or ~/.kube/config).
+        """
+
+        if kubeconfig is None:
+            kubeconfig = os.environ.get("KUBECONFIG", "").split(":")[0] or pathlib.Path.home() / ".kube" / "config"
+        kubeconfig = pathlib.Path(kubeconfig)
+
+        with open(kubeconfig) as f:
+            kubeconfig_content = yaml.safe_load(f)
+
+        def lookup(section, name):
+            for entry in kubeconfig_content.get(section) or []:
+                if entry["name"] == name:
+                    return entry[section.rstrip("s")]
+            raise ValueError(f"{section.rstrip('s').title()} '{name}' not found in {kubeconfig}")
+
+        context = lookup("contexts", context or kubeconfig_content.get("current-context"))
+        cluster = lookup("clusters", context["cluster"])
+        user = lookup("users", context["user"]) if context.get("user") else {}
+
+        if "exec" in user or "auth-provider" in user:
+            raise ValueError(f"The authentication plugins of {kubeconfig} are not supported")
+
+        def relative_path(path):
+            return str(kubeconfig.parent / path) if path else None
+
+        client_kwargs = dict(
+            server=cluster["server"],
+            token=user.get("token"),
+            ca_file=relative_path(cluster.get("certificate-authority")),
+            ca_data=base64.b64decode(cluster["certificate-authority-data"]).decode()
+                if cluster.get("certificate-authority-data") else None,
+            insecure=cluster.get("insecure-skip-tls-verify", False),
+        )
+
+        if user.get("tokenFile"):
+            client_kwargs["token"] = pathlib.Path(relative_path(user["tokenFile"])).read_text().strip()
+
+        if user.get("client-certificate-data"):
+            # the ssl module only loads the certificates from files
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                cert_file = pathlib.Path(tmp_dir) / "client.crt"
+                key_file = pathlib.Path(tmp_dir) / "client.key"
+                cert_file.write_bytes(base64.b64decode(user["client-certificate-data"]))
+                key_file.write_bytes(base64.b64decode(user["client-key-data"]))
+
+                return cls(**client_kwargs, cert_file=str(cert_file), key_file=str(key_file), **kwargs)
+
+        return cls(**client_kwargs,
+                   cert_file=relative_path(user.get("client-certificate")),
+                   key_file=relative_path(user.get("client-key")),
+                   **kwargs)
+
+    # --- connections
+
+    def _new_connection(self, timeout):
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout, context=self.ssl_context)
+
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _get_connection(self, timeout):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            return self._new_connection(timeout), False
+
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.timeout = timeout
+
+        return conn, True
+
+    def _release_connection(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _request(self, method, path, params=None, body=None, timeout=None):
+        """
+        Sends a request to the API server, and returns the (connection, response) tuple.
+        The response must be consumed before the connection is released.
+        """
+
+        if params:
+            path += "?" + urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+
+        headers = {"Accept": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+
+        timeout = timeout or self.timeout
+        conn, reused = self._get_connection(timeout)
+        try:
+            conn.request(method, self.base_path + path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            conn.close()
+            if not reused:
+                raise
+
+        # the idle connection was closed by the API server, retry with a new one
+        conn = self._new_connection(timeout)
+        try:
+            conn.request(method, self.base_path + path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def request(self, method, path, params=None, body=None):
+        """
+        Sends a request to the API server, and returns the decoded JSON response.
+        Raises an ApiError (or NotFoundError) if the request failed.
+        """
+
+        conn, response = self._request(method, path, params, body)
+        try:
+            content = response.read()
+        except Exception:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release_connection(conn)
+
+        if response.status >= 400:
+            raise _api_error(response.status, response.reason, content)
+
+        return json.loads(content) if content else None
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    # --- resource discovery
+
+    def _discover(self, resource):
+        api_paths = ["/api/v1"]
+        for group in self.request("GET", "/apis")["groups"]:
+            api_paths.append(f"/apis/{group['preferredVersion']['groupVersion']}")
+
+        resource = resource.lower()
+        name, _, group = resource.partition(".")
+
+        for api_path in api_paths:
+            group_version = api_path.removeprefix("/apis/").removeprefix("/api/")
+            api_group = group_version.rpartition("/")[0] if "/" in group_version else ""
+            if group and api_group != group and not api_group.startswith(group + "."):
+                continue
+
+            try:
+                resource_list = self.request("GET", api_path)["resources"]
+            except ApiError as e:
+                logging.debug(f"Could not discover the resources of {api_path}: {e}")
+                continue
+
+            for entry in resource_list:
+                if "/" in entry["name"]:
+                    continue # subresource
+
+                names = [entry["name"], entry.get("singularName") or "", entry["kind"].lower()] + entry.get("shortNames", [])
+                if name in names:
+                    return api_path, entry["name"], entry["namespaced"]
+
+        raise ValueError(f"Resource '{resource}' not found in the API server")
+
+    def resolve(self, resource):
+        """
+        Returns the (api path, plural name, namespaced) tuple of `resource`.
+
+        `resource` can be given as with `oc get`: plural or singular name,
+        kind or short name, optionally followed by its API group (eg,
+        `pods`, `node`, `jobs.batch`, `llminferenceservice`).
+        """
+
+        with self._resources_lock:
+            if resource not in self._resources:
+                self._resources[resource] = self._discover(resource)
+
+            return self._resources[resource]
+
+    def _path(self, resource, namespace=None, name=None):
+        api_path, plural, namespaced = self.resolve(resource)
+
+        path = api_path
+        if namespaced and namespace:
+            path += f"/namespaces/{namespace}"
+        path += f"/{plural}"
+        if name:
+            path += f"/{name}"
+
+        return path
+
+    # --- queries
+
+    def get(self, resource, name, namespace=None):
+        """
+        Returns the `resource`/`name` object. Raises a NotFoundError if it does not exist.
+        """
+
+        return self.request("GET", self._path(resource, namespace, name))
+
+    def exists(self, resource, name, namespace=None):
+        try:
+            self.get(resource, name, namespace)
+        except NotFoundError:
+            return False
+
+        return True
+
+    def _list(self, resource, namespace=None, label_selector=None, field_selector=None):
+        path = self._path(resource, namespace)
+        params = dict(labelSelector=label_selector, fieldSelector=field_selector,
+                      limit=DEFAULT_LIST_PAGE_SIZE)
+
+        items = []
+        while True:
+            result = self.request("GET", path, params)
+            items += result.get("items", [])
+
+            metadata = result.get("metadata", {})
+            if not metadata.get("continue"):
+                return items, metadata.get("resourceVersion")
+
+            params["continue"] = metadata["continue"]
+
+    def list(self, resource, namespace=None, label_selector=None, field_selector=None):
+        """
+        Returns the list of the `resource` objects, in `namespace` (default: all the namespaces).
+        """
+
+        items, _ = self._list(resource, namespace, label_selector, field_selector)
+
+        return items
+
+    def delete(self, resource, name, namespace=None, missing_ok=True):
+        """
+        Deletes the `resource`/`name` object. Does not wait for its deletion.
+        """
+
+        try:
+            self.request("DELETE", self._path(resource, namespace, name))
+        except NotFoundError:
+            if not missing_ok:
+                raise
+
+    # --- watches
+
+    def watch(self, resource, namespace=None, label_selector=None, field_selector=None,
+              resource_version=None, timeout=WATCH_SERVER_TIMEOUT):
+        """
+        Yields the (event type, object) modifications of the `resource`
+        objects, for at most `timeout` seconds. The event type is
+        ADDED, MODIFIED, DELETED or BOOKMARK.
+        """
+
+        params = dict(watch="true", labelSelector=label_selector, fieldSelector=field_selector,
+                      resourceVersion=resource_version, allowWatchBookmarks="true",
+                      timeoutSeconds=max(1, int(timeout)))
+
+        # the socket timeout stops the watch if the API server stops sending events
+        conn, response = self._request("GET", self._path(resource, namespace), params, timeout=timeout + 5)
+        try:
+            if response.status >= 400:
+                raise _api_error(response.status, response.reason, response.read())
+
+            for line in response:
+                if not line.strip():
+                    continue
+
+                event = json.loads(line)
+                if event["type"] == "ERROR":
+                    status = event["object"]
+                    if status.get("code") == 410:
+                        raise _WatchExpired(status.get("message"))
+                    raise ApiError(status.get("code"), status.get("reason"), status.get("message"))
+
+                yield event["type"], event["object"]
+        finally:
+            # the stream may not have been fully consumed
+            conn.close()
+
+    def wait_for_list(self, resource, condition, namespace=None, label_selector=None, field_selector=None,
+                      timeout=DEFAULT_WAIT_TIMEOUT):
+        """
+        Waits until `condition(objects)` returns a true value, and returns it.
+
+        `objects` is the list of the current `resource` objects. The
+        condition is evaluated once after listing the objects, then
+        after each modification reported by the API server.
+        Raises a TimeoutError after `timeout` seconds.
+        """
+
+        deadline = time.monotonic() + timeout
+        with trace.Span(f"wait_for {resource}", "k8s", namespace=namespace,
+                        label_selector=label_selector, field_selector=field_selector):
+            while True:
+                items, resource_version = self._list(resource, namespace, label_selector, field_selector)
+                objects = {_object_key(obj): obj for obj in items}
+
+                result = condition(list(objects.values()))
+                if result:
+                    return result
+
+                try:
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError(f"Timed out after {timeout}s waiting for the {resource} condition")
+
+                        for event_type, obj in self.watch(resource, namespace, label_selector, field_selector,
+                                                          resource_version, timeout=min(remaining, WATCH_SERVER_TIMEOUT)):
+                            resource_version = obj.get("metadata", {}).get("resourceVersion", resource_version)
+
+                            if event_type == "BOOKMARK":
+                                continue
+                            elif event_type == "DELETED":
+                                objects.pop(_object_key(obj), None)
+                            else:
+                                objects[_object_key(obj)] = obj
+
+                            result = condition(list(objects.values()))
+                            if result:
+                                return result
+
+                            if time.monotonic() > deadline:
+                                break
+                except _WatchExpired:
+                    logging.debug(f"Watch of {resource} expired, listing the objects again ...")
+                except (socket.timeout, TimeoutError) as e:
+                    if time.monotonic() < deadline:
+                        continue # socket timeout of a silent watch, list again
+                    raise TimeoutError(f"Timed out after {timeout}s waiting for the {resource} condition") from e
+
+    def wait_for(self, resource, name, condition, namespace=None, timeout=DEFAULT_WAIT_TIMEOUT):
+        """
+        Waits until `condition(obj)` returns a true value, and returns
+        it. `obj` is the `resource`/`name` object, or None if it does not
+        exist. Raises a TimeoutError after `timeout` seconds.
+        """
+
+        def object_condition(objects):
+            return condition(objects[0] if objects else None)
+
+        return self.wait_for_list(resource, object_condition, namespace,
+                                  field_selector=f"metadata.name={name}", timeout=timeout)
+
+    def wait_for_deletion(self, resource, name=None, namespace=None, label_selector=None, timeout=DEFAULT_WAIT_TIMEOUT):
+        """
+        Waits until the `resource`/`name` object (or all the `resource` objects matching the selector) are deleted.
+        """
+
+        field_selector = f"metadata.name={name}" if name else None
+
+        return self.wait_for_list(resource, lambda objects: not objects, namespace,
+                                  label_selector, field_selector, timeout)
+
+    def wait_for_condition(self, resource, name, condition_type, namespace=None, timeout=DEFAULT_WAIT_TIMEOUT):
+        """
+        Waits until the `condition_type` status condition of the `resource`/`name` object is True, and returns the object.
+        """
+
+        return self.wait_for(resource, name,
+                             lambda obj: obj if has_condition(obj, condition_type) else None,
+                             namespace, timeout)
+
+
+def _object_key(obj):
+    metadata = obj.get("metadata", {})
+
+    return metadata.get("namespace"), metadata.get("name")
+
+
+def _api_error(status, reason, content):
+    message = ""
+    try:
+        message = json.loads(content).get("message", "")
+    except (ValueError, AttributeError):
+        message = content.decode(errors="replace")[:200] if content else ""
+
+    error_cls = NotFoundError if status == 404 else ApiError
+
+    return error_cls(status, reason, message)
+
+
+def has_condition(obj, condition_type, status="True"):
+    """
+    Tells if the `condition_type` status condition of `obj` has the `status` value.
+    """
+
+    if not obj:
+        return False
+
+    for condition in obj.get("status", {}).get("conditions") or []:
+        if condition.get("type") == condition_type:
+            return condition.get("status") == status
+
+    return False
+
+
+def get_client():
+    """
+    Returns the shared client of the current kubeconfig (re-created when $KUBECONFIG or the file changes).
+
+    Set TOPSAIL_K8S_SERVER to use an API server URL without authentication (eg, `oc proxy` or a fake API server).
+    """
+
+    global _client, _client_key
+
+    server = os.environ.get("TOPSAIL_K8S_SERVER")
+    if server:
+        key = ("server", server)
+    else:
+        kubeconfig = os.environ.get("KUBECONFIG", "").split(":")[0] or pathlib.Path.home() / ".kube" / "config"
+        try:
+            mtime = os.stat(kubeconfig).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        key = (str(kubeconfig), mtime)
+
+    with _client_lock:
+        if _client is None or _client_key != key:
+            if _client is not None:
+                _client.close()
+
+            _client = Client(server) if server else Client.from_kubeconfig(kubeconfig)
+            _client_key = key
+
+        return _client
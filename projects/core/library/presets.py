@@ -0,0 +1,126 @@
+import collections
+
+###
+# Compilation of the `ci_presets` of the configuration.
+#
+# A preset is a dict of {config key: value} assignments, which can
+# `extends` other presets. Instead of applying the presets recursively,
+# key by key, the presets are flattened into a list of assignments
+# where each key appears only once (the last assignment wins, as if
+# the presets were applied one after the other). Each preset is
+# flattened only once, even if it is extended by multiple presets.
+###
+
+# an assignment of the flattened presets. `preset` is the preset setting the value.
+Assignment = collections.namedtuple("Assignment", ["key", "value", "preset"])
+
+# two presets setting the same key to different values, when `overridden_by` does not extend `preset`
+Conflict = collections.namedtuple("Conflict", ["key", "preset", "value", "overridden_by", "new_value"])
+
+# the result of compile_presets
+CompiledPresets = collections.namedtuple("CompiledPresets", ["names", "assignments", "conflicts"])
+
+EXTENDS_KEY = "extends"
+
+# the keys of the `ci_presets` section that are not presets
+RESERVED_KEYS = ("names", "name", "to_apply", "variable_overrides")
+
+
+class _FlatPreset(object):
+    def __init__(self, names, assignments):
+        self.names = names # the names of the preset and of the presets it extends, in application order
+        self.assignments = assignments
+
+
+class _Compiler(object):
+    def __init__(self, ci_presets):
+        self.ci_presets = ci_presets
+        self.flat_presets = {}
+        self.extended = {} # preset name --> the set of the presets it extends (transitively), including itself
+        self.conflicts = {}
+
+    def flatten(self, name, stack=()):
+        if name in stack:
+            raise ValueError(f"Preset cycle detected: {' -> '.join(stack + (name,))}")
+
+        if name in self.flat_presets:
+            return self.flat_presets[name]
+
+        values = self.ci_presets.get(name) if name not in RESERVED_KEYS else None
+        if not isinstance(values, dict):
+            raise ValueError(f"Preset '{name}' does not exists")
+
+        names = [name]
+        assignments = []
+        extended = {name}
+        for key, value in values.items():
+            if key != EXTENDS_KEY:
+                assignments.append(Assignment(key, value, name))
+                continue
+
+            for extend_name in ([value] if isinstance(value, str) else value):
+                flat_extend = self.flatten(extend_name, stack + (name,))
+                names += flat_extend.names
+                assignments += flat_extend.assignments
+                extended |= self.extended[extend_name]
+
+        self.extended[name] = extended
+        flat_preset = _FlatPreset(_unique(names), self.collapse(assignments))
+        self.flat_presets[name] = flat_preset
+
+        return flat_preset
+
+    def collapse(self, assignments):
+        # keeps only the last assignment of each key, in the order of the last assignments.
+        # Dropping the previous assignments of a key doesn't change the result, as the last one overwrites them.
+        last_indexes = {}
+        for index, assignment in enumerate(assignments):
+            previous_index = last_indexes.get(assignment.key)
+            if previous_index is not None:
+                self.check_conflict(assignments[previous_index], assignment)
+            last_indexes[assignment.key] = index
+
+        return [assignment for index, assignment in enumerate(assignments) if last_indexes[assignment.key] == index]
+
+    def check_conflict(self, previous, assignment):
+        if previous.value == assignment.value or previous.preset == assignment.preset:
+            return
+
+        if previous.preset in self.extended.get(assignment.preset, ()):
+            return # the preset intentionally overrides a preset it extends
+
+        key = (assignment.key, previous.preset, assignment.preset)
+        self.conflicts[key] = Conflict(assignment.key, previous.preset, previous.value,
+                                       assignment.preset, assignment.value)
+
+
+def _unique(names):
+    return list(dict.fromkeys(names))
+
+
+def compile_presets(ci_presets, names):
+    """
+    Flattens the `names` presets of the `ci_presets` configuration section.
+
+    Returns a CompiledPresets tuple with:
+    - names: the names of the presets applied (including the extended ones), in application order
+    - assignments: the list of Assignment to apply, in order. Each key appears once.
+    - conflicts: the list of Conflict, when two presets that do not
+      extend each other set the same key to different values (the
+      result depends on the order of the presets)
+
+    Raises a ValueError if a preset does not exist, or if the `extends` contain a cycle.
+    """
+
+    compiler = _Compiler(ci_presets or {})
+
+    all_names = []
+    assignments = []
+    for name in names:
+        flat_preset = compiler.flatten(name)
+        all_names += flat_preset.names
+        assignments += flat_preset.assignments
+
+    assignments = compiler.collapse(assignments)
+
+    return CompiledPresets(_unique(all_names), assignments, list(compiler.conflicts.values()))
@@ -5,12 +5,22 @@ logging.getLogger().setLevel(logging.INFO)
 import json
 import signal
 import itertools
+import time
+import threading
+import asyncio
+import contextvars
+import weakref
+import concurrent.futures
+import multiprocessing
+import codecs
+import pathlib
+import re
+import collections
+from collections import defaultdict
 
 import subprocess
 
-import joblib
-
-from . import env, config
+from . import env, config, trace, command_args, json_stream
 
 # create new process group, become its leader, except if we're already pid 1 (defacto group leader, setpgrp gets permission denied error)
 try:
@@ -33,8 +43,16 @@ def raise_signal(sig, frame):
 signal.signal(signal.SIGINT, raise_signal)
 signal.signal(signal.SIGTERM, raise_signal)
 
+# if True, run_toolbox and run_toolbox_from_config run the toolbox
+# commands in this Python process, and only fork the ansible-playbook
+# process. Can be overridden with their `in_process` argument.
+TOOLBOX_IN_PROCESS = os.environ.get("TOPSAIL_TOOLBOX_IN_PROCESS", "false") == "true"
+
+# maximum number of run_async processes running at the same time, per event loop
+ASYNC_MAX_CONCURRENCY = int(os.environ.get("TOPSAIL_RUN_ASYNC_MAX_CONCURRENCY", "64"))
+
 
-def run_toolbox_from_config(group, command, prefix=None, suffix=None, show_args=None, extra=None, artifact_dir_suffix=None, mute_stdout=False, check=True, run_kwargs=None):
+def run_toolbox_from_config(group, command, prefix=None, suffix=None, show_args=None, extra=None, artifact_dir_suffix=None, mute_stdout=False, check=True, run_kwargs=None, in_process=None):
     if extra is None:
         extra = {}
 
@@ -51,19 +69,28 @@ def run_toolbox_from_config(group, command, prefix=None, suffix=None, show_args=
     if show_args:
         kwargs["show_args"] = show_args
 
+    if (overlay_config_file := config.overlay_config_file()):
+        # the command must see the values of the ConfigOverlay
+        kwargs["config_file"] = str(overlay_config_file)
+
     if mute_stdout:
         run_kwargs["capture_stdout"] = True
 
     if check is not None:
         run_kwargs["check"] = check
 
-    env_vals = [f'ARTIFACT_DIR="{env.ARTIFACT_DIR}"']
-    if artifact_dir_suffix is not None:
-        env_vals.append(f'ARTIFACT_TOOLBOX_NAME_SUFFIX="{artifact_dir_suffix}"')
+    with trace.Span(command_args.command_key(group, command, prefix, suffix), "toolbox", from_config=True):
+        if _use_in_process(in_process, run_kwargs):
+            return _run_toolbox_in_process(["from_config", group, command] + _dict_to_run_toolbox_argv(kwargs),
+                                           artifact_dir_suffix, **run_kwargs)
 
-    cmd_env = " ".join(env_vals)
+        env_vals = [f'ARTIFACT_DIR="{env.ARTIFACT_DIR}"']
+        if artifact_dir_suffix is not None:
+            env_vals.append(f'ARTIFACT_TOOLBOX_NAME_SUFFIX="{artifact_dir_suffix}"')
 
-    return run(f'{cmd_env} ./run_toolbox.py from_config {group} {command} {_dict_to_run_toolbox_args(kwargs)}', **run_kwargs)
+        cmd_env = " ".join(env_vals)
+
+        return run(f'{cmd_env} ./run_toolbox.py from_config {group} {command} {_dict_to_run_toolbox_args(kwargs)}', **run_kwargs)
 
 
 def _dict_to_run_toolbox_args(args_dict):
@@ -80,7 +107,50 @@ def _dict_to_run_toolbox_args(args_dict):
     return " ".join(args)
 
 
-def run_toolbox(group, command, artifact_dir_suffix=None, run_kwargs=None, mute_stdout=None, mute_stderr=None, check=None, **kwargs):
+def _dict_to_run_toolbox_argv(args_dict):
+    # same as _dict_to_run_toolbox_args, as received by run_toolbox.py after the shell parsing
+    return [f"--{k}={v}" for k, v in args_dict.items()]
+
+
+def _use_in_process(in_process, run_kwargs):
+    if in_process is None:
+        in_process = TOOLBOX_IN_PROCESS
+
+    if not in_process:
+        return False
+
+    if run_kwargs.get("cwd") or run_kwargs.get("stdin_file"):
+        logging.info("run_toolbox: cwd and stdin_file not supported in-process, spawning run_toolbox.py.")
+        return False
+
+    return True
+
+
+def _run_toolbox_in_process(cli_args, artifact_dir_suffix=None, capture_stdout=False, capture_stderr=False, check=True, log_command=True, decode_stdout=True, decode_stderr=True, protect_shell=True, cwd=None, stdin_file=None):
+    # protect_shell, cwd and stdin_file are only relevant when spawning run_toolbox.py
+    from projects.core.library import ansible_toolbox
+
+    argv = ["./run_toolbox.py"] + cli_args
+    if log_command:
+        logging.info(f"run (in-process): {' '.join(argv)}")
+
+    # do not modify the `os.environ` of this Python process
+    cmd_env = env.subprocess_environ()
+    if artifact_dir_suffix is not None:
+        cmd_env["ARTIFACT_TOOLBOX_NAME_SUFFIX"] = artifact_dir_suffix
+
+    proc = ansible_toolbox.run_in_process(argv, cmd_env, capture_stdout=capture_stdout, capture_stderr=capture_stderr)
+
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, argv, output=proc.stdout, stderr=proc.stderr)
+
+    if capture_stdout and decode_stdout: proc.stdout = proc.stdout.decode("utf8")
+    if capture_stderr and decode_stderr: proc.stderr = proc.stderr.decode("utf8")
+
+    return proc
+
+
+def run_toolbox(group, command, artifact_dir_suffix=None, run_kwargs=None, mute_stdout=None, mute_stderr=None, check=None, in_process=None, **kwargs):
     if run_kwargs is None:
         run_kwargs = {}
 
@@ -93,13 +163,54 @@ def run_toolbox(group, command, artifact_dir_suffix=None, run_kwargs=None, mute_
     if check is not None:
         run_kwargs["check"] = check
 
-    env_vals = [f'ARTIFACT_DIR="{env.ARTIFACT_DIR}"']
+    with trace.Span(f"{group} {command}", "toolbox"):
+        if _use_in_process(in_process, run_kwargs):
+            return _run_toolbox_in_process([group, command] + _dict_to_run_toolbox_argv(kwargs),
+                                           artifact_dir_suffix, **run_kwargs)
+
+        env_vals = [f'ARTIFACT_DIR="{env.ARTIFACT_DIR}"']
+        if artifact_dir_suffix is not None:
+            env_vals.append(f'ARTIFACT_TOOLBOX_NAME_SUFFIX="{artifact_dir_suffix}"')
+
+        cmd_env = " ".join(env_vals)
+
+        return run(f'{cmd_env} ./run_toolbox.py {group} {command} {_dict_to_run_toolbox_args(kwargs)}', **run_kwargs)
+
+
+def run_toolbox_batch(commands, artifact_dir_suffix=None, capture_stdout=False, capture_stderr=False, check=True, decode_stdout=True, decode_stderr=True):
+    """
+    Runs several toolbox commands as the plays of one ansible-playbook invocation.
+
+    commands: list of (group, command, kwargs) tuples
+
+    Example:
+
+    run.run_toolbox_batch([
+        ("cluster", "capture_environment", {}),
+        ("rhods", "capture_state", {}),
+    ])
+    """
+    from projects.core.library import ansible_toolbox
+
+    logging.info("run_toolbox_batch: " + ", ".join(f"{group} {command}" for group, command, _ in commands))
+
+    cmd_env = env.subprocess_environ()
     if artifact_dir_suffix is not None:
-        env_vals.append(f'ARTIFACT_TOOLBOX_NAME_SUFFIX="{artifact_dir_suffix}"')
+        cmd_env["ARTIFACT_TOOLBOX_NAME_SUFFIX"] = artifact_dir_suffix
+
+    toolbox = ansible_toolbox.Toolbox()
+    runnables = [getattr(getattr(toolbox, group)(), command)(**kwargs) for group, command, kwargs in commands]
+
+    with trace.Span("toolbox batch", "toolbox", commands=[f"{group} {command}" for group, command, _ in commands]):
+        proc = ansible_toolbox.run_batch(runnables, cmd_env, capture_stdout=capture_stdout, capture_stderr=capture_stderr)
 
-    cmd_env = " ".join(env_vals)
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, output=proc.stdout, stderr=proc.stderr)
+
+    if capture_stdout and decode_stdout: proc.stdout = proc.stdout.decode("utf8")
+    if capture_stderr and decode_stderr: proc.stderr = proc.stderr.decode("utf8")
 
-    return run(f'{cmd_env} ./run_toolbox.py {group} {command} {_dict_to_run_toolbox_args(kwargs)}', **run_kwargs)
+    return proc
 
 
 def run(command, capture_stdout=False, capture_stderr=False, check=True, protect_shell=True, cwd=None, stdin_file=None, log_command=True, decode_stdout=True, decode_stderr=True):
@@ -110,6 +221,7 @@ def run(command, capture_stdout=False, capture_stderr=False, check=True, protect
 
     args["cwd"] = cwd
     args["shell"] = True
+    args["env"] = env.subprocess_environ()
 
     if capture_stdout: args["stdout"] = subprocess.PIPE
     if capture_stderr: args["stderr"] = subprocess.PIPE
@@ -119,30 +231,496 @@ def run(command, capture_stdout=False, capture_stderr=False, check=True, protect
             raise ValueError("Argument 'stdin_file' must be an open file (with a file descriptor)")
         args["stdin"] = stdin_file
 
+    span = trace.Span(_span_name(command), "run", command=command)
+    accounting = CommandAccounting(command, log_command)
+
     if protect_shell:
-        command = f"set -o errexit;set -o pipefail;set -o nounset;set -o errtrace;{command}"
+        command = _protect_shell(command)
 
-    proc = subprocess.run(command, **args)
+    with span:
+        proc = _run_and_wait4(command, args, accounting)
 
     if capture_stdout and decode_stdout: proc.stdout = proc.stdout.decode("utf8")
     if capture_stderr and decode_stderr: proc.stderr = proc.stderr.decode("utf8")
 
     return proc
 
+
+# set TOPSAIL_COMMANDS_LOG=false to disable the resource accounting of the commands
+COMMANDS_LOG_ENABLED = os.environ.get("TOPSAIL_COMMANDS_LOG", "true") != "false"
+COMMANDS_LOG_FILENAME = "commands.jsonl"
+
+
+class CommandAccounting(object):
+    """
+    Records the resource usage of a command (wall time, user/sys CPU
+    time, max RSS and exit code) in the `commands.jsonl` file of the
+    current artifact directory.
+    """
+
+    def __init__(self, command, log_command=True):
+        # the commands not logged may contain secrets: only keep their executable name
+        self.command = command if log_command else (command.split(maxsplit=1) or ["<empty>"])[0] + " (hidden)"
+        self.artifact_dir = env.ARTIFACT_DIR
+        self.start = time.time()
+
+    def record(self, returncode, rusage=None):
+        if not COMMANDS_LOG_ENABLED or self.artifact_dir is None:
+            return
+
+        entry = dict(
+            command=self.command,
+            start=round(self.start, 3),
+            wall=round(time.time() - self.start, 3),
+            user=round(rusage.ru_utime, 3) if rusage else None,
+            sys=round(rusage.ru_stime, 3) if rusage else None,
+            maxrss_kb=rusage.ru_maxrss if rusage else None,
+            returncode=returncode,
+        )
+
+        try:
+            with open(pathlib.Path(self.artifact_dir) / COMMANDS_LOG_FILENAME, "a") as f:
+                print(json.dumps(entry), file=f)
+        except OSError as e:
+            logging.debug(f"Could not record the command resource usage: {e}")
+
+
+def _wait4(proc, accounting):
+    # reaps the process with os.wait4 to get its resource usage.
+    # Popen.wait() returns immediately afterwards, as the returncode is set.
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # already reaped
+        proc.wait()
+        rusage = None
+    else:
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+    accounting.record(proc.returncode, rusage)
+
+    return proc.returncode
+
+
+def _run_and_wait4(command, args, accounting):
+    """
+    Equivalent of `subprocess.run(command, **args)`, but reaps the process with `os.wait4`.
+    """
+
+    check = args.pop("check", False)
+
+    with subprocess.Popen(command, **args) as proc, env.subprocess_started(proc.pid):
+        try:
+            stdout, stderr = _read_outputs(proc)
+            _wait4(proc, accounting)
+        except BaseException:
+            # including KeyboardInterrupt and SignalError
+            proc.kill()
+            raise
+
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, output=stdout, stderr=stderr)
+
+    return subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
+
+
+def _read_outputs(proc):
+    # like Popen.communicate, but doesn't reap the process
+    pipes = [pipe for pipe in (proc.stdout, proc.stderr) if pipe is not None]
+    outputs = {}
+
+    def read(pipe):
+        outputs[pipe] = pipe.read()
+        pipe.close()
+
+    if len(pipes) == 2:
+        # stderr is read in a thread, so that the process never blocks on a full pipe
+        stderr_thread = threading.Thread(target=read, args=(proc.stderr,), daemon=True)
+        stderr_thread.start()
+        read(proc.stdout)
+        stderr_thread.join()
+    elif pipes:
+        read(pipes[0])
+
+    return outputs.get(proc.stdout), outputs.get(proc.stderr)
+
+
+def _protect_shell(command):
+    return f"set -o errexit;set -o pipefail;set -o nounset;set -o errtrace;{command}"
+
+
+def _span_name(command, length=80):
+    name = " ".join(command.split())
+    return name if len(name) <= length else name[:length-3] + "..."
+
+
+# asyncio.Semaphore objects must not be shared between event loops
+_async_semaphores = weakref.WeakKeyDictionary()
+
+def _get_async_semaphore():
+    loop = asyncio.get_running_loop()
+    try:
+        return _async_semaphores[loop]
+    except KeyError:
+        semaphore = _async_semaphores[loop] = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+        return semaphore
+
+
+async def run_async(command, capture_stdout=False, capture_stderr=False, check=True, protect_shell=True, cwd=None, stdin_file=None, log_command=True, decode_stdout=True, decode_stderr=True, semaphore=None):
+    """
+    Coroutine version of `run`, with the same arguments and return value.
+
+    At most ASYNC_MAX_CONCURRENCY processes (or the capacity of `semaphore`)
+    run at the same time. If the coroutine is cancelled, the process group of the
+    command is killed.
+
+    Example:
+
+    proc = await run.run_async("oc get pods -oname", capture_stdout=True)
+    """
+
+    if semaphore is None:
+        semaphore = _get_async_semaphore()
+
+    args = {}
+    args["cwd"] = cwd
+    args["env"] = env.subprocess_environ()
+
+    if capture_stdout: args["stdout"] = asyncio.subprocess.PIPE
+    if capture_stderr: args["stderr"] = asyncio.subprocess.PIPE
+    if stdin_file:
+        if not hasattr(stdin_file, "fileno"):
+            raise ValueError("Argument 'stdin_file' must be an open file (with a file descriptor)")
+        args["stdin"] = stdin_file
+
+    shell_command = _protect_shell(command) if protect_shell else command
+
+    async with semaphore:
+        if log_command:
+            logging.info(f"run_async: {command}")
+
+        accounting = CommandAccounting(command, log_command)
+        with trace.Span(_span_name(command), "run", is_async=True, command=command):
+            # dedicated process group, so that the whole command can be killed on cancellation
+            proc = await asyncio.create_subprocess_shell(shell_command, start_new_session=True, **args)
+            try:
+                with env.subprocess_started(proc.pid, process_group=True):
+                    stdout, stderr = await proc.communicate()
+            except asyncio.CancelledError:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass # already terminated
+                await proc.wait()
+                raise
+
+        # asyncio reaps the process itself, its resource usage isn't available
+        accounting.record(proc.returncode)
+
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, shell_command, output=stdout, stderr=stderr)
+
+    if capture_stdout and decode_stdout: stdout = stdout.decode("utf8")
+    if capture_stderr and decode_stderr: stderr = stderr.decode("utf8")
+
+    return subprocess.CompletedProcess(shell_command, proc.returncode, stdout, stderr)
+
+
+async def gather(*commands, max_concurrency=None, return_exceptions=False, **run_kwargs):
+    """
+    Runs concurrently the `commands` and returns their results, in order.
+
+    commands: shell commands (passed to `run_async` with `run_kwargs`) or awaitables.
+    max_concurrency: the maximum number of commands running at the same time
+                     (default: ASYNC_MAX_CONCURRENCY, shared with the other `run_async` calls)
+    return_exceptions: if False (default), the first exception is raised and the other
+                       commands are cancelled. If True, the exceptions are returned in the results.
+
+    Example, from synchronous code:
+
+    results = asyncio.run(run.gather(*[f"oc get ns {ns}" for ns in namespaces], capture_stdout=True))
+    """
+
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else _get_async_semaphore()
+
+    async def run_one(command):
+        if isinstance(command, str):
+            return await run_async(command, semaphore=semaphore, **run_kwargs)
+
+        async with semaphore:
+            return await command
+
+    tasks = [asyncio.ensure_future(run_one(command)) for command in commands]
+
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+        # wait for the cancelled processes to be killed
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+class Stream(object):
+    """
+    Runs `command` and streams its stdout, with a bounded memory usage.
+
+    tee: if set, path of a file where the whole stdout is saved (relative paths are in the ARTIFACT_DIR)
+    tail_size: the number of bytes of stdout (and stderr) kept in memory, available in `stream.tail`
+    capture_stderr: if True, the tail of stderr is kept in `stream.stderr`. Otherwise, it is not redirected.
+    chunk_size: the maximum size of the chunks read from stdout
+    decode: if True (default), the chunks and lines are decoded as UTF-8 strings
+
+    When the context terminates, the rest of the output is drained (and
+    saved in the `tee` file), then the command return code is checked
+    as in `run`. If an exception is raised in the context, the
+    command is killed.
+
+    Example:
+
+    with run.Stream("oc get pods -A -ojson", tee="pods.json") as stream:
+        for pod in stream.json_items():
+            ...
+
+    with run.Stream("oc get events -A -w") as stream:
+        for line in stream.lines():
+            ...
+    """
+
+    def __init__(self, command, tee=None, tail_size=1024*1024, check=True, protect_shell=True, cwd=None, stdin_file=None, log_command=True, capture_stderr=False, chunk_size=64*1024, decode=True):
+        self.command = command
+        self.tee = tee
+        self.tail_size = tail_size
+        self.check = check
+        self.protect_shell = protect_shell
+        self.cwd = cwd
+        self.stdin_file = stdin_file
+        self.log_command = log_command
+        self.capture_stderr = capture_stderr
+        self.chunk_size = chunk_size
+        self.decode = decode
+
+        self.proc = None
+        self.returncode = None
+        self.span = None
+        self._subprocess_started = None
+
+        self._tee_file = None
+        self._tail = collections.deque()
+        self._tail_len = 0
+        self._stderr_tail = collections.deque()
+        self._stderr_thread = None
+        self._decoder = codecs.getincrementaldecoder("utf8")(errors="replace")
+
+    def __enter__(self):
+        if self.log_command:
+            logging.info(f"run (stream): {self.command}")
+
+        if self.stdin_file and not hasattr(self.stdin_file, "fileno"):
+            raise ValueError("Argument 'stdin_file' must be an open file (with a file descriptor)")
+
+        if self.tee:
+            tee_path = pathlib.Path(self.tee)
+            if not tee_path.is_absolute():
+                tee_path = env.ARTIFACT_DIR / tee_path
+            self._tee_file = open(tee_path, "wb")
+
+        command = _protect_shell(self.command) if self.protect_shell else self.command
+
+        self.span = trace.Span(_span_name(self.command), "run", command=self.command, stream=True)
+        self.span.__enter__()
+        self.accounting = CommandAccounting(self.command, self.log_command)
+
+        self.proc = subprocess.Popen(command, shell=True, cwd=self.cwd, env=env.subprocess_environ(),
+                                     stdin=self.stdin_file or None,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE if self.capture_stderr else None)
+        self._subprocess_started = env.subprocess_started(self.proc.pid)
+        self._subprocess_started.__enter__()
+
+        if self.capture_stderr:
+            # drained in a thread, so that the command never blocks on a full stderr pipe
+            self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+            self._stderr_thread.start()
+
+        return self
+
+    def __exit__(self, ex_type, ex_value, exc_traceback):
+        try:
+            if ex_value is not None:
+                self.proc.kill()
+            else:
+                for _ in self._read_chunks():
+                    pass # drain the rest of the output
+
+            self.returncode = _wait4(self.proc, self.accounting)
+            if self._stderr_thread:
+                self._stderr_thread.join()
+        finally:
+            self._subprocess_started.__exit__(None, None, None)
+            self.proc.stdout.close()
+            if self._tee_file:
+                self._tee_file.close()
+            self.span.__exit__(ex_type, ex_value, exc_traceback)
+
+        if ex_value is None and self.check and self.returncode != 0:
+            raise subprocess.CalledProcessError(self.returncode, self.command, output=self.tail, stderr=self.stderr)
+
+        return False # If we returned True here, any exception would be suppressed!
+
+    def _drain_stderr(self):
+        tail_len = 0
+        for chunk in iter(lambda: self.proc.stderr.read1(self.chunk_size), b""):
+            self._stderr_tail.append(chunk)
+            tail_len += len(chunk)
+            while tail_len - len(self._stderr_tail[0]) >= self.tail_size:
+                tail_len -= len(self._stderr_tail.popleft())
+        self.proc.stderr.close()
+
+    def _read_chunks(self):
+        while chunk := self.proc.stdout.read1(self.chunk_size):
+            if self._tee_file:
+                self._tee_file.write(chunk)
+
+            self._tail.append(chunk)
+            self._tail_len += len(chunk)
+            while self._tail_len - len(self._tail[0]) >= self.tail_size:
+                self._tail_len -= len(self._tail.popleft())
+
+            yield chunk
+
+    @staticmethod
+    def _tail_bytes(chunks, tail_size):
+        return b"".join(chunks)[-tail_size:]
+
+    @property
+    def tail(self):
+        """The last `tail_size` bytes of stdout"""
+        tail = self._tail_bytes(self._tail, self.tail_size)
+        return tail.decode("utf8", errors="replace") if self.decode else tail
+
+    @property
+    def stderr(self):
+        """The last `tail_size` bytes of stderr, if captured"""
+        if not self.capture_stderr:
+            return None
+
+        stderr = self._tail_bytes(self._stderr_tail, self.tail_size)
+        return stderr.decode("utf8", errors="replace") if self.decode else stderr
+
+    def chunks(self):
+        """Yields the chunks of stdout, as they are received"""
+        for chunk in self._read_chunks():
+            if self.decode:
+                chunk = self._decoder.decode(chunk)
+                if not chunk: continue
+            yield chunk
+
+    def lines(self):
+        """Yields the lines of stdout (with their line terminator)"""
+        partial = "" if self.decode else b""
+        for chunk in self.chunks():
+            lines = (partial + chunk).splitlines(keepends=True)
+            partial = lines.pop() if not lines[-1].endswith("\n" if self.decode else b"\n") else partial[:0]
+            yield from lines
+
+        if partial:
+            yield partial
+
+    def json_items(self, key="items"):
+        """Yields the elements of the `key` list of the JSON stdout, as soon as they are received"""
+        if not self.decode:
+            raise ValueError("json_items requires decode=True")
+
+        parser = json_stream.JSONItemsParser(key)
+        for chunk in self.chunks():
+            yield from parser.feed(chunk)
+
+        parser.close()
+
+
+# the `cancelled` Event of the Parallel execution running the current task
+_parallel_cancelled = contextvars.ContextVar("parallel_cancelled", default=None)
+
+
+def parallel_cancelled():
+    """
+    Returns True if the Parallel execution running the current task
+    has been cancelled (another task failed or timed out). Long running
+    tasks can check it to stop cooperatively.
+
+    Always False outside of a Parallel task, and with the "process" backend.
+    """
+
+    cancelled = _parallel_cancelled.get()
+    return cancelled is not None and cancelled.is_set()
+
+
+class ParallelTask(object):
+    def __init__(self, index, function, args, kwargs):
+        self.index = index
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+        self.name = getattr(function, "__name__", str(function))
+        self.status = "pending"
+        self.start = None
+        self.end = None
+        self.future = None
+        self.exception = None
+
+        # the subprocesses running for this task, {(pid, leads its process group)}
+        self.subprocesses = set()
+
+    @property
+    def duration(self):
+        if self.start is None:
+            return None
+
+        return (self.end or time.time()) - self.start
+
+
 class Parallel(object):
-    def __init__(self, name, exit_on_exception=True, dedicated_dir=True):
+    """
+    Runs functions in parallel.
+
+    max_workers: the maximum number of tasks running at the same time (default: the number of CPUs)
+    timeout: the maximum duration of each task, in seconds. A task running longer is considered as failed.
+    rate_limit: the maximum number of task starts per second
+    backend: "threading" (default) or "process"
+    cancel_timeout: when a task fails, how long to wait (in seconds) for the running tasks to complete.
+    """
+
+    BACKENDS = ("threading", "process")
+
+    def __init__(self, name, exit_on_exception=True, dedicated_dir=True,
+                 max_workers=None, timeout=None, rate_limit=None, backend="threading", cancel_timeout=60):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Invalid Parallel backend '{backend}'. Expected one of {self.BACKENDS}.")
+
         self.name = name
         self.parallel_tasks = None
         self.exit_on_exception = exit_on_exception
         self.dedicated_dir = dedicated_dir
 
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.rate_limit = rate_limit
+        self.backend = backend
+        self.cancel_timeout = cancel_timeout
+
+        # set when a task failed. The tasks (threading backend) can check it with run.parallel_cancelled().
+        self.cancelled = threading.Event()
+
     def __enter__(self):
         self.parallel_tasks = []
 
         return self
 
     def delayed(self, function, *args, **kwargs):
-        self.parallel_tasks += [joblib.delayed(function)(*args, **kwargs)]
+        self.parallel_tasks += [ParallelTask(len(self.parallel_tasks), function, args, kwargs)]
 
     def __exit__(self, ex_type, ex_value, exc_traceback):
 
@@ -156,22 +734,268 @@ class Parallel(object):
             context = open("/dev/null") # dummy context
 
         with context:
-            try:
-                joblib.Parallel(n_jobs=-1, backend="threading")(self.parallel_tasks)
-            except Exception as e:
-                if not self.exit_on_exception:
-                    raise e
+            with trace.Span(f"Parallel {self.name}", "parallel", tasks=len(self.parallel_tasks)):
+                failed_task, still_running = self._execute()
 
-                traceback.print_exc()
+            if failed_task is None:
+                return False
 
-                logging.error(f"Exception caught during the '{self.name}' Parallel execution. Exiting.")
-                # kill all processes in my group
-                # (the group was started with the os.setpgrp() above)
-                os.killpg(0, signal.SIGKILL)
-                sys.exit(1)
+            if still_running:
+                logging.error(f"Parallel[{self.name}]: {len(still_running)} task(s) still running after the cancellation: "
+                              + ", ".join(task.name for task in still_running) + ". Their subprocesses have been killed.")
+
+            if not self.exit_on_exception:
+                raise failed_task.exception
+
+            exc = failed_task.exception
+            traceback.print_exception(type(exc), exc, exc.__traceback__)
+
+            logging.error(f"Exception caught during the '{self.name}' Parallel execution. Exiting.")
+
+            sys.exit(1)
 
         return False # If we returned True here, any exception would be suppressed!
 
+    def _execute(self):
+        # the tasks run in daemon threads or processes started by
+        # _submit (the concurrency is bounded below), so that a stuck
+        # task cannot prevent the interpreter from exiting.
+        pending = list(reversed(self.parallel_tasks))
+        running = {}
+        timed_out = [] # the timed out tasks, which may still be running
+        failed_task = None
+        next_start = time.time()
+        cancel_deadline = None
+
+        try:
+            while pending or running:
+                now = time.time()
+
+                # start the next tasks
+                while pending and len(running) < self.max_workers and not self.cancelled.is_set() and now >= next_start:
+                    task = pending.pop()
+                    task.status = "running"
+                    task.start = now
+                    task.future = self._submit(task)
+                    running[task.future] = task
+
+                    if self.rate_limit:
+                        next_start = now + 1 / self.rate_limit
+
+                self._write_progress()
+
+                if not running:
+                    if pending and not self.cancelled.is_set():
+                        time.sleep(max(0, next_start - time.time()))
+                        continue
+                    break
+
+                # wait for a task to complete, or a deadline to expire
+                deadlines = []
+                if pending and len(running) < self.max_workers and not self.cancelled.is_set():
+                    deadlines.append(next_start)
+                if self.timeout:
+                    deadlines += [task.start + self.timeout for task in running.values()]
+                if cancel_deadline:
+                    deadlines.append(cancel_deadline)
+
+                wait_timeout = max(0, min(deadlines) - time.time()) if deadlines else None
+                done, _ = concurrent.futures.wait(running, timeout=wait_timeout,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+
+                now = time.time()
+                for future in done:
+                    task = running.pop(future)
+                    task.end = now
+                    task.exception = future.exception()
+                    task.status = "failed" if task.exception else "done"
+
+                    if task.exception and failed_task is None:
+                        failed_task = task
+
+                if self.timeout:
+                    for future, task in list(running.items()):
+                        if now - task.start < self.timeout: continue
+
+                        running.pop(future)
+                        timed_out.append(task)
+                        task.end = now
+                        task.status = "timeout"
+                        task.exception = TimeoutError(f"Task '{task.name}' of the '{self.name}' Parallel execution didn't complete within {self.timeout}s")
+                        if failed_task is None:
+                            failed_task = task
+
+                if failed_task and not self.cancelled.is_set():
+                    logging.error(f"Parallel[{self.name}]: task '{failed_task.name}' {failed_task.status}: {failed_task.exception}. "
+                                  "Cancelling the remaining tasks.")
+                    self.cancelled.set()
+                    cancel_deadline = now + self.cancel_timeout
+
+                    for task in pending:
+                        task.status = "cancelled"
+                    pending = []
+
+                if cancel_deadline and now >= cancel_deadline:
+                    break
+        finally:
+            still_running = list(running.values()) + [task for task in timed_out if not task.future.done()]
+            for task in still_running:
+                _kill_subprocesses(task)
+
+            self._write_progress()
+
+        return failed_task, still_running
+
+    def _submit(self, task):
+        future = concurrent.futures.Future()
+        future.set_running_or_notify_cancel()
+
+        if self.backend == "process":
+            self._submit_process(task, future)
+            return future
+
+        context = contextvars.copy_context()
+        context.run(_parallel_cancelled.set, self.cancelled)
+        context.run(env.track_subprocesses, task.subprocesses)
+
+        def run_task():
+            try:
+                result = context.run(trace.call, task.name, "parallel", task.function, *task.args, **task.kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        # the thread names label the lanes of the execution trace
+        threading.Thread(target=run_task, name=f"Parallel-{self.name}_{task.index}", daemon=True).start()
+
+        return future
+
+    def _submit_process(self, task, future):
+        # the worker processes don't inherit the context of this thread:
+        # propagate the ARTIFACT_DIR explicitly
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_run_process_task, name=f"Parallel-{self.name}_{task.index}", daemon=True,
+                                          args=(sender, env.ARTIFACT_DIR, task.name, task.function, task.args, task.kwargs))
+        process.start()
+        sender.close()
+
+        # the process leads its own process group (see _run_process_task)
+        task.subprocesses.add((process.pid, True))
+
+        def wait_result():
+            try:
+                succeeded, value = receiver.recv()
+            except EOFError:
+                succeeded, value = False, RuntimeError(f"The process of task '{task.name}' terminated unexpectedly")
+            finally:
+                receiver.close()
+                process.join()
+                task.subprocesses.discard((process.pid, True))
+
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+        threading.Thread(target=wait_result, daemon=True).start()
+
+    def _write_progress(self):
+        if not self.dedicated_dir:
+            return
+
+        count = defaultdict(int)
+        for task in self.parallel_tasks:
+            count[task.status] += 1
+
+        with open(env.ARTIFACT_DIR / "_parallel_progress", "w") as f:
+            print(f"{self.name}: {len(self.parallel_tasks)} tasks | "
+                  + " | ".join(f"{count[status]} {status}" for status in ("pending", "running", "done", "failed", "timeout", "cancelled")), file=f)
+
+        with open(env.ARTIFACT_DIR / "_parallel_tasks.txt", "w") as f:
+            print(f"{'#':>4} {'task':<40} {'status':<10} {'start':<19} {'end':<19} {'duration':>10}", file=f)
+            for task in self.parallel_tasks:
+                start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(task.start)) if task.start else "-"
+                end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(task.end)) if task.end else "-"
+                duration = f"{task.duration:.1f}s" if task.duration is not None else "-"
+                print(f"{task.index:>4} {task.name[:40]:<40} {task.status:<10} {start:<19} {end:<19} {duration:>10}", file=f)
+
+
+def _run_process_task(connection, artifact_dir, name, function, args, kwargs):
+    # runs in the worker process of a "process" backend Parallel task.
+    # Dedicated process group, so that the task and its subprocesses
+    # can be killed together.
+    os.setpgrp()
+
+    try:
+        result = (True, env.run_in_artifact_dir(artifact_dir, trace.call, name, "parallel", function, *args, **kwargs))
+    except BaseException as e:
+        result = (False, e)
+
+    try:
+        connection.send(result)
+    except Exception as e: # not picklable
+        connection.send((False, RuntimeError(f"Cannot return the result of task '{name}': {e.__class__.__name__}: {e}")))
+    finally:
+        connection.close()
+
+
+def _process_descendants(pids):
+    # the descendants of the `pids` processes, from the parent PIDs
+    # of /proc. Collected before killing anything, as the orphans are
+    # reparented to init.
+    children = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue # already terminated
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    descendants = []
+    parents = list(pids)
+    while parents:
+        for child in children.get(parents.pop(), []):
+            descendants.append(child)
+            parents.append(child)
+
+    return descendants
+
+
+def _kill_subprocesses(task):
+    subprocesses = list(task.subprocesses)
+    try:
+        descendants = _process_descendants([pid for pid, _ in subprocesses])
+    except OSError: # no /proc
+        descendants = []
+
+    for pid, process_group in subprocesses:
+        try:
+            if process_group:
+                os.killpg(pid, signal.SIGKILL)
+            else:
+                os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            if not process_group:
+                continue # already terminated
+
+            # the process may not have created its group yet
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    # the shell commands leave their children behind
+    for pid in descendants:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
 
 def run_and_catch(exc, fct, *args, **kwargs):
     """
@@ -211,12 +1035,48 @@ def run_and_catch(exc, fct, *args, **kwargs):
 # - my.config.value1: 1, my.config.value2: b
 # - my.config.value1: 2, my.config.value2: a
 # - my.config.value1: 2, my.config.value2: b
-def run_iterable_fields(iterable_fields, fct, *args, **kwargs):
+def run_iterable_fields(iterable_fields, fct, *args, executor=None, **kwargs):
+    """
+    Runs fct(*args, **kwargs) for each combination of the values of the
+    iterable fields, applied one after the other in config.project.
+
+    executor: if True or a dict of IterableFieldsExecutor options (eg,
+              max_workers, exclusive_keys, checkpoint_file), run the
+              combinations with an IterableFieldsExecutor instead
+              (config overlays, one artifact directory per combination,
+              checkpoint)
+    """
+
+    if executor:
+        options = executor if isinstance(executor, dict) else {}
+        IterableFieldsExecutor(iterable_fields, **options).run(fct, *args, **kwargs)
+        return
+
     if not iterable_fields:
         # nothing to do
         fct(*args, **kwargs)
         return
 
+    iterable_kv, points = _iterable_fields_points(iterable_fields)
+
+    for point in points:
+        with config.project.transaction():
+            for k, v in point.items():
+                config.project.set_config(k, v)
+
+        fct(*args, **kwargs)
+
+        with config.project.transaction():
+            for iter_key, iter_values in iterable_kv.items():
+                config.project.set_config(iter_key, iter_values, print=False)
+
+    with config.project.transaction():
+        for iter_key, iter_values in iterable_kv.items():
+            config.project.set_config(iter_key, iter_values, print=False)
+
+
+def _iterable_fields_points(iterable_fields):
+    # returns the {key: values} of the iterable fields, and the list of their combinations ({key: value})
     iterable_kv = {}
     for iterable_key in iterable_fields:
         iterable_values = config.project.get_config(iterable_key, print=False)
@@ -224,14 +1084,188 @@ def run_iterable_fields(iterable_fields, fct, *args, **kwargs):
         iterable_kv[iterable_key] = iterable_values
 
     kv_list = [[(key, v) for v in iterable_kv[key]] for key in iterable_kv]
-    for kv_entry in itertools.product(*kv_list):
-        for k, v in kv_entry:
-            config.project.set_config(k, v)
 
-        fct(*args, **kwargs)
+    return iterable_kv, [dict(kv_entry) for kv_entry in itertools.product(*kv_list)]
 
-        for iter_key, iter_values in iterable_kv.items():
-            config.project.set_config(iter_key, iter_values, print=False)
 
-    for iter_key, iter_values in iterable_kv.items():
-        config.project.set_config(iter_key, iter_values, print=False)
+class IterableFieldsExecutor(object):
+    """
+    Runs a function for each combination of the values of the iterable
+    fields (see `run_iterable_fields`). Each combination is applied in
+    a `config.project.overlay()`, so `config.project` is never modified,
+    and runs in its own artifact directory.
+
+    name: the name of the execution (artifact directory, checkpoint entries)
+    max_workers: the maximum number of combinations running at the same time
+    exclusive_keys: the config keys identifying the resources used by a
+                    combination (eg, its namespace or cluster). Two combinations
+                    run at the same time only if their values of these keys are
+                    all different. Without exclusive keys, the combinations run
+                    one after the other.
+    checkpoint_file: the JSONL file recording the completed combinations.
+                     The successful ones are skipped when the execution is
+                     restarted. Default: ARTIFACT_DIR/<name>.checkpoint.jsonl,
+                     in the caller's ARTIFACT_DIR (not in the new NNN__<name>
+                     directory), so that a re-run finds it.
+                     Pass False to disable the checkpoint.
+    history_files: checkpoint files of earlier executions, used (with the checkpoint file)
+                   to start the longest combinations first
+    fail_fast: if True, no new combination is started after a failure
+    """
+
+    def __init__(self, iterable_fields, name="iterable_fields", max_workers=1, exclusive_keys=None,
+                 checkpoint_file=None, history_files=None, fail_fast=True):
+        self.iterable_fields = iterable_fields or []
+        self.name = name
+        self.max_workers = max_workers
+        self.exclusive_keys = exclusive_keys or []
+        self.checkpoint_file = checkpoint_file
+        self.history_files = history_files or []
+        self.fail_fast = fail_fast
+
+    @staticmethod
+    def point_key(point):
+        return json.dumps(point, sort_keys=True, default=str)
+
+    def _load_history(self):
+        # returns the keys of the successful combinations of the checkpoint, and the durations of all the known ones
+        completed = set()
+        durations = defaultdict(list)
+
+        files = list(self.history_files)
+        if self.checkpoint_file:
+            files.append(self.checkpoint_file)
+
+        for path in files:
+            path = pathlib.Path(path)
+            if not path.exists():
+                continue
+
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # truncated line of an interrupted execution
+
+                    if entry.get("name") != self.name:
+                        continue
+
+                    key = self.point_key(entry["point"])
+                    if entry["status"] == "success":
+                        durations[key].append(entry["duration"])
+                        if path == pathlib.Path(self.checkpoint_file or "/"):
+                            completed.add(key)
+
+        return completed, {key: sum(values) / len(values) for key, values in durations.items()}
+
+    def _resources(self, point):
+        if not self.exclusive_keys:
+            return {None} # all the combinations conflict
+
+        resources = set()
+        with config.project.overlay(point):
+            for key in self.exclusive_keys:
+                resources.add((key, json.dumps(config.project.get_config(key, print=False), sort_keys=True, default=str)))
+
+        return resources
+
+    def _record(self, point, status, start, error=None):
+        if not self.checkpoint_file:
+            return
+
+        entry = dict(name=self.name, point=point, status=status, start=start,
+                     duration=time.time() - start, error=error)
+        with open(self.checkpoint_file, "a") as f:
+            print(json.dumps(entry, default=str), file=f)
+
+    def _run_point(self, index, point, fct, args, kwargs):
+        dirname = "_".join(str(value) for value in point.values())
+        dirname = re.sub(r"[^A-Za-z0-9_.-]+", "_", dirname)[:60] or f"point_{index}"
+
+        with env.NextArtifactDir(dirname):
+            with config.project.overlay(point, config_path=env.ARTIFACT_DIR / "config.yaml"):
+                logging.info(f"{self.name}: running {point}")
+                with trace.Span(dirname, "iterable_fields", point=point):
+                    return fct(*args, **kwargs)
+
+    def run(self, fct, *args, **kwargs):
+        """
+        Runs fct(*args, **kwargs) for each combination. Raises the exception of the first failed combination.
+        """
+
+        if not self.iterable_fields:
+            return fct(*args, **kwargs)
+
+        _, points = _iterable_fields_points(self.iterable_fields)
+
+        if self.checkpoint_file is None:
+            # outside of the NNN__<name> directory, which changes at each execution
+            self.checkpoint_file = env.ARTIFACT_DIR / f"{self.name}.checkpoint.jsonl"
+
+        with env.NextArtifactDir(self.name):
+            completed, predicted_durations = self._load_history()
+
+            pending = []
+            for index, point in enumerate(points):
+                if self.point_key(point) in completed:
+                    logging.info(f"{self.name}: {point} already completed, skipping it.")
+                    continue
+                pending.append((index, point, self._resources(point)))
+
+            # the combinations never executed first (their duration is unknown), then the longest ones
+            pending.sort(key=lambda entry: -predicted_durations.get(self.point_key(entry[1]), float("inf")))
+
+            logging.info(f"{self.name}: {len(pending)}/{len(points)} combinations to execute, "
+                         f"{self.max_workers} at a time.")
+
+            with trace.Span(f"IterableFields {self.name}", "iterable_fields", points=len(pending)):
+                return self._execute(pending, fct, args, kwargs)
+
+    def _execute(self, pending, fct, args, kwargs):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                         thread_name_prefix=f"IterableFields-{self.name}")
+        running = {} # future --> (point, resources, start)
+        busy_resources = set()
+        failures = []
+
+        try:
+            while pending or running:
+                # start the combinations whose resources are available
+                idx = 0
+                while idx < len(pending) and len(running) < self.max_workers and not (failures and self.fail_fast):
+                    index, point, resources = pending[idx]
+                    if resources & busy_resources:
+                        idx += 1
+                        continue
+
+                    pending.pop(idx)
+                    busy_resources |= resources
+                    future = executor.submit(contextvars.copy_context().run,
+                                             self._run_point, index, point, fct, args, kwargs)
+                    running[future] = (point, resources, time.time())
+
+                if not running:
+                    break # stopped after a failure
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    point, resources, start = running.pop(future)
+                    busy_resources -= resources
+
+                    exc = future.exception()
+                    if exc is None:
+                        self._record(point, "success", start)
+                        continue
+
+                    logging.error(f"{self.name}: {point} failed: {exc.__class__.__name__}: {exc}")
+                    self._record(point, "failed", start, error=f"{exc.__class__.__name__}: {exc}")
+                    failures.append(exc)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        if pending:
+            logging.warning(f"{self.name}: {len(pending)} combination(s) not executed because of the failure.")
+
+        if failures:
+            raise failures[0]
@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import atexit
+import pathlib
+import logging
+import threading
+import itertools
+
+###
+# Execution trace, in the Chrome trace-event format (readable in
+# Perfetto or chrome://tracing).
+#
+# Each process (the test orchestration, the run_toolbox.py processes,
+# the worker processes) appends its events to the
+# `$TOPSAIL_TRACE_DIR/_trace/<pid>.jsonl` file. The process that
+# initialized the trace merges them, with the ansible task timings
+# found in the `_ansible.log.json` files, into
+# `$TOPSAIL_TRACE_DIR/trace.json` when it terminates.
+#
+# Set TOPSAIL_TRACE=false to disable the trace.
+###
+
+TRACE_DIR_ENV_KEY = "TOPSAIL_TRACE_DIR"
+TRACE_FILENAME = "trace.json"
+TRACE_EVENTS_DIRNAME = "_trace"
+
+_lock = threading.Lock()
+_events_file = None
+_events_file_pid = None
+_named_threads = set()
+_async_ids = itertools.count(1)
+
+# above the Linux pid_max, so that the ansible lanes do not collide with the real processes
+ANSIBLE_LANES_FIRST_PID = 5_000_000
+
+
+def enabled():
+    return os.environ.get("TOPSAIL_TRACE", "true") != "false" and TRACE_DIR_ENV_KEY in os.environ
+
+
+def init(artifact_dir):
+    """
+    Starts tracing the execution in `artifact_dir`, unless a parent process already started it.
+    """
+
+    if os.environ.get("TOPSAIL_TRACE", "true") == "false":
+        return
+
+    if TRACE_DIR_ENV_KEY in os.environ:
+        return # tracing initialized by a parent process
+
+    os.environ[TRACE_DIR_ENV_KEY] = str(artifact_dir)
+    atexit.register(write_trace, artifact_dir)
+
+
+def _now_us():
+    return int(time.time() * 1_000_000)
+
+
+def _get_events_file():
+    global _events_file, _events_file_pid
+
+    pid = os.getpid()
+    if _events_file is not None and _events_file_pid == pid:
+        return _events_file
+
+    # first event of this process (or of a forked worker process)
+    events_dir = pathlib.Path(os.environ[TRACE_DIR_ENV_KEY]) / TRACE_EVENTS_DIRNAME
+    events_dir.mkdir(parents=True, exist_ok=True)
+
+    _events_file = open(events_dir / f"{pid}.jsonl", "a", buffering=1)
+    _events_file_pid = pid
+    _named_threads.clear()
+
+    name = " ".join([pathlib.Path(sys.argv[0]).name] + sys.argv[1:3]) if sys.argv else "python"
+    print(json.dumps(dict(ph="M", name="process_name", pid=pid, tid=0, args=dict(name=f"{name} ({pid})"))), file=_events_file)
+
+    return _events_file
+
+
+def _write(*events):
+    try:
+        with _lock:
+            f = _get_events_file()
+            tid = threading.get_ident()
+            if tid not in _named_threads:
+                _named_threads.add(tid)
+                print(json.dumps(dict(ph="M", name="thread_name", pid=os.getpid(), tid=tid,
+                                      args=dict(name=threading.current_thread().name))), file=f)
+
+            for event in events:
+                print(json.dumps(event, default=str), file=f)
+    except OSError as e:
+        logging.debug(f"Could not write the trace events: {e}")
+
+
+class Span(object):
+    """
+    Context manager recording a span of the execution trace.
+
+    name: the name of the span
+    category: the category of the span (run, toolbox, parallel, artifact_dir, ...)
+    is_async: if True, the span is recorded as an async event, on its
+              own track (for the asyncio tasks, which share their thread)
+    args: extra information stored in the span
+    """
+
+    def __init__(self, name, category, is_async=False, **args):
+        self.name = name
+        self.category = category
+        self.is_async = is_async
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = _now_us()
+
+        return self
+
+    def __exit__(self, ex_type, ex_value, exc_traceback):
+        if not enabled():
+            return False
+
+        end = _now_us()
+        args = dict(self.args)
+        if ex_value is not None:
+            args["exception"] = f"{ex_type.__name__}: {ex_value}"
+
+        event = dict(name=self.name, cat=self.category, pid=os.getpid(), tid=threading.get_ident(), args=args)
+        if self.is_async:
+            async_id = next(_async_ids)
+            _write(event | dict(ph="b", ts=self.start, id=async_id),
+                   dict(name=self.name, cat=self.category, pid=os.getpid(), tid=event["tid"],
+                        ph="e", ts=end, id=async_id))
+        else:
+            _write(event | dict(ph="X", ts=self.start, dur=end - self.start))
+
+        return False # do not suppress the exception
+
+
+def call(name, category, function, *args, **kwargs):
+    """
+    Runs `function(*args, **kwargs)` in a trace span (picklable, for the worker processes).
+    """
+
+    with Span(name, category):
+        return function(*args, **kwargs)
+
+
+def _load_ansible_log(path):
+    # the file is a JSON list, not terminated if ansible-playbook was interrupted
+    content = path.read_text().strip()
+    if not content.endswith("]"):
+        content = content.rstrip(",") + "\n]"
+
+    return json.loads(content)
+
+
+def ansible_events(trace_dir):
+    """
+    Returns the trace events of the ansible tasks recorded by the
+    json_to_logfile callback in the `_ansible.log.json` files of `trace_dir`.
+    """
+
+    events = []
+    lane_ids = itertools.count()
+    for dirpath, dirnames, filenames in os.walk(trace_dir):
+        dirnames.sort()
+        if "_ansible.log.json" not in filenames:
+            continue
+
+        path = pathlib.Path(dirpath) / "_ansible.log.json"
+        try:
+            entries = _load_ansible_log(path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not parse {path}: {e}")
+            continue
+
+        pid = ANSIBLE_LANES_FIRST_PID + next(lane_ids)
+        lane_name = f"ansible {path.parent.relative_to(trace_dir)}"
+        events.append(dict(ph="M", name="process_name", pid=pid, tid=0, args=dict(name=lane_name)))
+
+        for entry in entries:
+            if entry.get("scope") != "task" or "start" not in entry:
+                continue
+
+            start = int(entry["start"] * 1_000_000)
+            end = int(entry["end"] * 1_000_000)
+            events.append(dict(ph="X", name=entry.get("task") or "task", cat="ansible",
+                               pid=pid, tid=0, ts=start, dur=end - start,
+                               args=dict(status=entry.get("status"), host=entry.get("host"))))
+
+    return events
+
+
+def write_trace(trace_dir=None):
+    """
+    Merges the events of all the processes and of the ansible tasks in `trace_dir`/trace.json.
+    """
+
+    if trace_dir is None:
+        trace_dir = os.environ[TRACE_DIR_ENV_KEY]
+    trace_dir = pathlib.Path(trace_dir)
+
+    events = []
+    for events_file in sorted((trace_dir / TRACE_EVENTS_DIRNAME).glob("*.jsonl")):
+        with open(events_file) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    pass # truncated line of a killed process
+
+    events += ansible_events(trace_dir)
+
+    dest = trace_dir / TRACE_FILENAME
+    tmp_dest = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    with open(tmp_dest, "w") as f:
+        json.dump(dict(traceEvents=events, displayTimeUnit="ms"), f)
+    os.replace(tmp_dest, dest)
+
+    logging.info(f"Execution trace saved in {dest} ({len(events)} events)")
+
+    return dest
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] in ("-h", "--help"):
+        print(f"Usage: python -m projects.core.library.trace ARTIFACT_DIR")
+        print(f"Regenerates ARTIFACT_DIR/{TRACE_FILENAME} from the recorded events.")
+        sys.exit(0 if len(sys.argv) == 2 else 1)
+
+    logging.getLogger().setLevel(logging.INFO)
+    write_trace(sys.argv[1])
@@ -0,0 +1,245 @@
+import threading
+
+import pytest
+import yaml
+
+from projects.core.library import config, env, presets
+
+
+CONFIG = {
+    "a": {"b": 1, "c": [1, 2]},
+    "name": "test",
+    "ref": "@a.b",
+    "multi_ref": "{@name}-{@a.b}",
+    "chained_ref": "@ref",
+    "dict_ref": "@a",
+    "ci_presets": {
+        "names": [],
+        "base": {"a.b": 10, "name": "base"},
+        "small": {"extends": ["base"], "a.b": 20},
+        "other": {"name": "other", "a.c": [3]},
+        "both": {"extends": ["small", "other"], "a.b": 30},
+        "bad": {"a.missing": 1},
+    },
+}
+
+
+@pytest.fixture
+def cfg(tmp_path, monkeypatch):
+    monkeypatch.setenv("ARTIFACT_DIR", str(tmp_path)) # restored after the test
+
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.dump(CONFIG, sort_keys=False)) # the order of the preset keys matters
+
+    with env.TempArtifactDir(tmp_path):
+        yield config.Config(tmp_path, config_path)
+
+
+def saved_config(cfg):
+    return yaml.safe_load(cfg.config_path.read_text())
+
+
+def test_set_config_writes_the_file(cfg):
+    cfg.set_config("a.b", 2)
+
+    assert cfg.get_config("a.b") == 2
+    assert saved_config(cfg)["a"]["b"] == 2
+
+
+def test_transaction_writes_once(cfg):
+    with cfg.transaction():
+        cfg.set_config("a.b", 2)
+        with cfg.transaction():
+            cfg.set_config("name", "new")
+
+        assert saved_config(cfg)["a"]["b"] == 1 # not written yet
+
+    saved = saved_config(cfg)
+    assert saved["a"]["b"] == 2
+    assert saved["name"] == "new"
+
+
+def test_unknown_key(cfg):
+    with pytest.raises(KeyError):
+        cfg.get_config("a.missing")
+
+    with pytest.raises(KeyError):
+        cfg.set_config("a.missing", 1)
+
+    assert cfg.get_config("a.missing", None, warn=False) is None
+
+
+@pytest.mark.parametrize("overrides", [
+    {"new_key": None},
+    {"new_key": "x", "a.b": 3},
+])
+def test_config_overrides(cfg, tmp_path, overrides):
+    overrides_path = tmp_path / config.VARIABLE_OVERRIDES_FILENAME
+    overrides_path.write_text(yaml.dump(overrides))
+
+    cfg.apply_config_overrides(variable_overrides_path=overrides_path)
+
+    for key, value in overrides.items():
+        assert cfg.get_config(key) == value
+        assert config.get_jsonpath(saved_config(cfg), key) == value
+
+
+def test_get_config_returns_copies(cfg):
+    value = cfg.get_config("a.c")
+    value.append(3)
+    assert cfg.get_config("a.c") == [1, 2]
+
+    value = cfg.get_config("dict_ref")
+    value["b"] = 42
+    assert cfg.get_config("a.b") == 1
+
+
+def test_snapshot_is_not_modified(cfg):
+    snapshot = cfg.snapshot()
+
+    cfg.set_config("a.b", 2)
+    cfg.set_config("a.c", [3])
+
+    assert snapshot.get_config("a.b") == 1
+    assert snapshot.get_config("a.c") == [1, 2]
+    assert snapshot.get_config("ref") == 1
+    assert cfg.get_config("ref") == 2
+
+
+def test_snapshot_is_read_only(cfg):
+    snapshot = cfg.snapshot()
+
+    with pytest.raises(RuntimeError):
+        snapshot._call(cfg.set_config, "a.b", 2)
+
+
+def test_overlay(cfg):
+    with cfg.overlay({"a.b": 2}):
+        assert cfg.get_config("a.b") == 2
+        assert cfg.get_config("ref") == 2
+
+        cfg.set_config("name", "overlay")
+        assert cfg.get_config("multi_ref") == "overlay-2"
+
+        # the threads started without the context don't see the overlay
+        outside = []
+        thread = threading.Thread(target=lambda: outside.append(cfg.get_config("a.b")))
+        thread.start()
+        thread.join()
+        assert outside == [1]
+
+    assert cfg.get_config("a.b") == 1
+    assert cfg.get_config("name") == "test"
+    assert saved_config(cfg)["a"]["b"] == 1
+
+
+def test_overlay_does_not_modify_the_snapshots(cfg):
+    snapshot = cfg.snapshot()
+    with cfg.overlay({"a.c": [4]}):
+        assert cfg.get_config("a.c") == [4]
+        assert snapshot.get_config("a.c") == [1, 2]
+
+
+def test_reference_cache_invalidation(cfg):
+    assert cfg.get_config("ref") == 1
+    assert cfg.get_config("chained_ref") == 1
+    assert cfg.get_config("multi_ref") == "test-1"
+
+    cfg.set_config("a.b", 2)
+    assert cfg.get_config("ref") == 2
+    assert cfg.get_config("chained_ref") == 2 # transitive dependency
+    assert cfg.get_config("multi_ref") == "test-2"
+
+    cfg.set_config("name", "new")
+    assert cfg.get_config("multi_ref") == "new-2"
+
+    # replacing the parent dict invalidates the references to its keys
+    cfg.set_config("a", {"b": 3, "c": []})
+    assert cfg.get_config("ref") == 3
+    assert cfg.get_config("dict_ref") == {"b": 3, "c": []}
+
+    # updating a child key invalidates the references to the parent
+    cfg.set_config("a.c", [5])
+    assert cfg.get_config("dict_ref") == {"b": 3, "c": [5]}
+
+    # changing the reference itself
+    cfg.set_config("ref", "@name")
+    assert cfg.get_config("ref") == "new"
+    assert cfg.get_config("chained_ref") == "new"
+
+
+def test_circular_reference(cfg):
+    cfg.set_config("name", "@chained_ref")
+    cfg.set_config("a.b", "@name")
+
+    with pytest.raises(ValueError):
+        cfg.get_config("ref")
+
+
+def _apply_sequentially(ci_presets, names):
+    # the recursive application of the presets, key by key
+    values = {}
+
+    def apply(name):
+        for key, value in ci_presets[name].items():
+            if key == presets.EXTENDS_KEY:
+                for extend_name in ([value] if isinstance(value, str) else value):
+                    apply(extend_name)
+                continue
+            values[key] = value
+
+    for name in names:
+        apply(name)
+
+    return values
+
+
+@pytest.mark.parametrize("names", [
+    ["base"], ["small"], ["both"], ["other", "small"], ["small", "other"],
+    ["both", "base"], ["base", "both", "other"],
+])
+def test_compile_presets_equivalence(names):
+    ci_presets = CONFIG["ci_presets"]
+    compiled = presets.compile_presets(ci_presets, names)
+
+    compiled_values = {}
+    for assignment in compiled.assignments:
+        compiled_values[assignment.key] = assignment.value
+
+    assert compiled_values == _apply_sequentially(ci_presets, names)
+    assert len(compiled.assignments) == len(compiled_values) # each key once
+
+
+def test_compile_presets_errors():
+    with pytest.raises(ValueError):
+        presets.compile_presets(CONFIG["ci_presets"], ["missing"])
+
+    with pytest.raises(ValueError):
+        presets.compile_presets({"a": {"extends": ["b"]}, "b": {"extends": "a"}}, ["a"])
+
+
+def test_compile_presets_conflicts():
+    compiled = presets.compile_presets(CONFIG["ci_presets"], ["small", "other"])
+    assert [(conflict.key, conflict.preset, conflict.overridden_by) for conflict in compiled.conflicts] \
+        == [("name", "base", "other")]
+
+    # a preset overriding the presets it extends isn't a conflict
+    assert presets.compile_presets(CONFIG["ci_presets"], ["small"]).conflicts == []
+
+
+def test_apply_presets(cfg, tmp_path):
+    cfg.apply_presets(["both"])
+
+    assert cfg.get_config("a.b") == 30
+    assert cfg.get_config("name") == "other"
+    assert cfg.get_config("a.c") == [3]
+    assert cfg.get_config("ci_presets.names") == ["both", "small", "base", "other"]
+    assert saved_config(cfg)["a"]["b"] == 30
+
+    diff = yaml.safe_load((tmp_path / config.PRESETS_DIFF_FILENAME).read_text())
+    assert diff["diff"]["a.b"] == dict(preset="both", before=1, after=30)
+
+
+def test_apply_presets_unknown_key(cfg):
+    with pytest.raises(KeyError):
+        cfg.apply_presets(["bad"])
@@ -0,0 +1,62 @@
+import threading
+
+from projects.core.library import env
+
+
+def test_allocate_artifact_index_sequence(tmp_path):
+    assert [env.allocate_artifact_index(tmp_path) for _ in range(3)] == [0, 1, 2]
+
+
+def test_allocate_artifact_index_existing_entries(tmp_path):
+    # entries created before the counter, or without it (shell scripts)
+    (tmp_path / "000__a").mkdir()
+    (tmp_path / "004__b").mkdir()
+    (tmp_path / "not_an_index").mkdir()
+
+    assert env.allocate_artifact_index(tmp_path) == 5
+
+    (tmp_path / "007__c").mkdir()
+    assert env.allocate_artifact_index(tmp_path) == 8
+    assert env.allocate_artifact_index(tmp_path) == 9
+
+
+def test_allocate_artifact_index_invalid_counter(tmp_path):
+    (tmp_path / "001__a").mkdir()
+    (tmp_path / env.ARTIFACT_INDEX_FILENAME).write_text("garbage\n")
+
+    assert env.allocate_artifact_index(tmp_path) == 2
+
+
+def test_allocate_artifact_index_concurrent(tmp_path):
+    indexes = []
+    lock = threading.Lock()
+
+    def allocate():
+        for _ in range(20):
+            index = env.allocate_artifact_index(tmp_path)
+            with lock:
+                indexes.append(index)
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(indexes) == list(range(80))
+
+
+def test_next_artifact_index_does_not_allocate(tmp_path, monkeypatch):
+    monkeypatch.setenv("ARTIFACT_DIR", str(tmp_path)) # restored after the test
+
+    with env.TempArtifactDir(tmp_path):
+        assert env.next_artifact_index() == 0
+        assert env.next_artifact_index() == 0
+
+        (tmp_path / "002__a").mkdir()
+        assert env.next_artifact_index() == 3
+
+        with env.NextArtifactDir("b"):
+            assert env.ARTIFACT_DIR == tmp_path / "003__b"
+
+        assert env.next_artifact_index() == 4
@@ -0,0 +1,42 @@
+import json
+
+from projects.core.library.json_stream import JSONItemsParser
+
+ITEMS = [
+    {"metadata": {"name": "a", "annotations": {
+        "kubectl.kubernetes.io/last-applied-configuration": json.dumps({"spec": {"x": "]}"}}) + "\n",
+    }}},
+    {"metadata": {"name": "b\\"}, "data": {"quote": "\n\"", "brackets": "[{\\\"}]"}},
+    {"metadata": {"name": "c"}, "list": [1, "\\\\", {"\"": "\\n"}]},
+]
+
+DOCUMENT = json.dumps({"apiVersion": "v1", "items": ITEMS, "kind": "List"}, indent=1)
+
+
+def parse(chunks):
+    parser = JSONItemsParser("items")
+    items = []
+    for chunk in chunks:
+        items += parser.feed(chunk)
+    parser.close()
+
+    return items
+
+
+def test_whole_document():
+    assert parse([DOCUMENT]) == ITEMS
+
+
+def test_every_split_point():
+    for split in range(len(DOCUMENT) + 1):
+        assert parse([DOCUMENT[:split], DOCUMENT[split:]]) == ITEMS, f"split at {split}"
+
+
+def test_one_char_chunks():
+    assert parse(DOCUMENT) == ITEMS
+
+
+def test_quote_after_escape_at_chunk_start():
+    # the '"' following a '\n' escape must close the string
+    assert parse(['{"items": [{"a": "x\\n', '"}]}']) == [{"a": "x\n"}]
+    assert parse(['{"items": [{"a": "x\\', '""}]}']) == [{"a": "x\""}]
@@ -0,0 +1,338 @@
+import json
+import time
+import threading
+import http.server
+import urllib.parse
+
+import pytest
+import yaml
+
+from projects.core.library import k8s
+
+
+API_RESOURCES = {
+    "/api/v1": [
+        dict(name="pods", singularName="pod", kind="Pod", namespaced=True, shortNames=["po"]),
+        dict(name="pods/log", singularName="", kind="Pod", namespaced=True),
+        dict(name="nodes", singularName="node", kind="Node", namespaced=False, shortNames=["no"]),
+    ],
+    "/apis/apps/v1": [
+        dict(name="deployments", singularName="deployment", kind="Deployment", namespaced=True, shortNames=["deploy"]),
+    ],
+}
+
+
+def _object(name, namespace="ns", labels=None, conditions=None):
+    return dict(metadata=dict(name=name, namespace=namespace, labels=labels or {}, resourceVersion="1"),
+                status=dict(conditions=conditions or []))
+
+
+class FakeApiServer(http.server.ThreadingHTTPServer):
+    """
+    Minimal Kubernetes API server: discovery, get/list/delete of the
+    objects, and watch requests replaying the `watch_events` script.
+    """
+
+    daemon_threads = True
+    page_size = 2
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeApiHandler)
+
+        self.objects = {} # api path/plural --> {name: object}
+        self.requests = [] # (method, path, query, headers)
+        self.watch_events = [] # the events sent by each watch request, in order
+        self.on_list = None # called before each list request
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def requests_of(self, path, **query):
+        return [request for request in self.requests
+                if request[1] == path and all(request[2].get(key) == value for key, value in query.items())]
+
+
+class FakeApiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive connections
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send(404, dict(kind="Status", code=404, reason="NotFound", message="not found"))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        self.server.requests.append((method, url.path, query, dict(self.headers)))
+
+        if url.path == "/apis":
+            groups = [dict(name="apps", preferredVersion=dict(groupVersion="apps/v1"))]
+            return self._send(200, dict(groups=groups))
+
+        if url.path in API_RESOURCES:
+            return self._send(200, dict(resources=API_RESOURCES[url.path]))
+
+        api_path, plural, name = self._parse_path(url.path)
+        if plural is None:
+            return self._not_found()
+
+        objects = self.server.objects.setdefault(f"{api_path}/{plural}", {})
+
+        if name:
+            if name not in objects:
+                return self._not_found()
+            if method == "DELETE":
+                return self._send(200, objects.pop(name))
+            return self._send(200, objects[name])
+
+        if query.get("watch") == "true":
+            return self._watch(query)
+
+        if self.server.on_list:
+            self.server.on_list()
+
+        items = [obj for obj in objects.values() if self._matches(obj, query)]
+        start = int(query.get("continue", 0))
+        end = start + self.server.page_size
+        metadata = dict(resourceVersion="10")
+        if end < len(items):
+            metadata["continue"] = str(end)
+
+        self._send(200, dict(items=items[start:end], metadata=metadata))
+
+    def _parse_path(self, path):
+        parts = path.strip("/").split("/")
+        for api_path in API_RESOURCES:
+            prefix = api_path.strip("/").split("/")
+            if parts[:len(prefix)] != prefix:
+                continue
+            rest = parts[len(prefix):]
+            if rest[:1] == ["namespaces"]:
+                rest = rest[2:]
+            if rest:
+                return api_path, rest[0], rest[1] if len(rest) > 1 else None
+
+        return None, None, None
+
+    def _matches(self, obj, query):
+        field_selector = query.get("fieldSelector")
+        if field_selector and obj["metadata"]["name"] != field_selector.removeprefix("metadata.name="):
+            return False
+
+        label_selector = query.get("labelSelector")
+        if label_selector:
+            key, _, value = label_selector.partition("=")
+            if obj["metadata"]["labels"].get(key) != value:
+                return False
+
+        return True
+
+    def _watch(self, query):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        if not self.server.watch_events:
+            # no event: the API server closes the watch after timeoutSeconds
+            time.sleep(int(query["timeoutSeconds"]))
+            return
+
+        for event_type, obj in self.server.watch_events.pop(0):
+            self.wfile.write(json.dumps(dict(type=event_type, object=obj)).encode() + b"\n")
+            self.wfile.flush()
+
+
+@pytest.fixture
+def server():
+    server = FakeApiServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs=dict(poll_interval=0.05), daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    client = k8s.Client(server.url, token="secret")
+    yield client
+    client.close()
+
+
+def _write_kubeconfig(tmp_path, user, current_context="test"):
+    kubeconfig = dict(
+        clusters=[dict(name="cluster", cluster=dict(server="https://api.cluster:6443", **{"insecure-skip-tls-verify": True}))],
+        contexts=[dict(name="test", context=dict(cluster="cluster", user="user"))],
+        users=[dict(name="user", user=user)],
+    )
+    if current_context:
+        kubeconfig["current-context"] = current_context
+
+    path = tmp_path / "kubeconfig"
+    path.write_text(yaml.dump(kubeconfig))
+
+    return path
+
+
+def test_from_kubeconfig(tmp_path):
+    (tmp_path / "token").write_text("from-file\n")
+
+    client = k8s.Client.from_kubeconfig(_write_kubeconfig(tmp_path, dict(token="inline")))
+    assert (client.scheme, client.host, client.port, client.token) == ("https", "api.cluster", 6443, "inline")
+    assert not client.ssl_context.check_hostname
+
+    # the paths are relative to the kubeconfig file
+    client = k8s.Client.from_kubeconfig(_write_kubeconfig(tmp_path, dict(tokenFile="token")))
+    assert client.token == "from-file"
+
+
+@pytest.mark.parametrize("user, current_context", [
+    (dict(exec=dict(command="get-token")), "test"),
+    ({"auth-provider": dict(name="oidc")}, "test"),
+    (dict(token="inline"), "missing"),
+    (dict(token="inline"), None),
+])
+def test_from_kubeconfig_unsupported(tmp_path, user, current_context):
+    with pytest.raises(ValueError):
+        k8s.Client.from_kubeconfig(_write_kubeconfig(tmp_path, user, current_context))
+
+
+def test_get_client(server, monkeypatch):
+    monkeypatch.setenv("TOPSAIL_K8S_SERVER", server.url)
+    monkeypatch.setattr(k8s, "_client", None)
+
+    assert k8s.get_client() is k8s.get_client()
+    assert k8s.get_client().server == server.url
+
+
+@pytest.mark.parametrize("resource, expected", [
+    ("pods", ("/api/v1", "pods", True)),
+    ("Pod", ("/api/v1", "pods", True)),
+    ("po", ("/api/v1", "pods", True)),
+    ("node", ("/api/v1", "nodes", False)),
+    ("deploy", ("/apis/apps/v1", "deployments", True)),
+    ("deployments.apps", ("/apis/apps/v1", "deployments", True)),
+])
+def test_discovery(client, resource, expected):
+    assert client.resolve(resource) == expected
+
+
+def test_discovery_cache(client, server):
+    client.resolve("po")
+    client.resolve("po")
+
+    assert len(server.requests_of("/apis")) == 1
+
+    with pytest.raises(ValueError):
+        client.resolve("log") # subresource
+
+    with pytest.raises(ValueError):
+        client.resolve("pods.apps") # wrong group
+
+
+def test_get(client, server):
+    server.objects["/api/v1/pods"] = {"a": _object("a")}
+
+    assert client.get("pods", "a", "ns")["metadata"]["name"] == "a"
+    assert client.exists("pods", "a", "ns")
+
+    with pytest.raises(k8s.NotFoundError):
+        client.get("pods", "missing", "ns")
+    assert not client.exists("pods", "missing", "ns")
+
+    client.delete("pods", "a", "ns")
+    client.delete("pods", "a", "ns") # missing_ok
+    with pytest.raises(k8s.NotFoundError):
+        client.delete("pods", "a", "ns", missing_ok=False)
+
+    # the requests are authenticated, and share the keep-alive connection
+    assert all(headers["Authorization"] == "Bearer secret" for _, _, _, headers in server.requests)
+    assert len(client._pool.queue) == 1
+
+
+def test_list_paging(client, server):
+    server.objects["/api/v1/pods"] = {f"pod-{idx}": _object(f"pod-{idx}", labels=dict(app="x" if idx % 2 else "y"))
+                                      for idx in range(5)}
+
+    assert [pod["metadata"]["name"] for pod in client.list("pods", "ns")] == [f"pod-{idx}" for idx in range(5)]
+    assert len(server.requests_of("/api/v1/namespaces/ns/pods")) == 3 # 3 pages of 2 items
+
+    assert [pod["metadata"]["name"] for pod in client.list("po", "ns", label_selector="app=x")] == ["pod-1", "pod-3"]
+
+
+def test_wait_for_condition(client, server):
+    server.objects["/apis/apps/v1/deployments"] = {"a": _object("a")}
+    available = _object("a", conditions=[dict(type="Available", status="True")])
+    server.watch_events = [[
+        ("BOOKMARK", dict(metadata=dict(resourceVersion="11"))),
+        ("MODIFIED", _object("a", conditions=[dict(type="Available", status="False")])),
+        ("MODIFIED", available),
+    ]]
+
+    assert client.wait_for_condition("deployments.apps", "a", "Available", "ns", timeout=10) == available
+
+    watch, = server.requests_of("/apis/apps/v1/namespaces/ns/deployments", watch="true")
+    assert watch[2]["resourceVersion"] == "10" # the version of the list
+    assert watch[2]["fieldSelector"] == "metadata.name=a"
+
+
+def test_wait_for_expired_watch(client, server):
+    # the resourceVersion of the list is too old, the objects are listed again
+    server.objects["/api/v1/pods"] = {"a": _object("a")}
+    server.watch_events = [[("ERROR", dict(kind="Status", code=410, reason="Expired", message="too old"))]]
+
+    def on_list():
+        if len(server.requests_of("/api/v1/namespaces/ns/pods")) == 3: # the second list
+            server.objects["/api/v1/pods"]["a"] = _object("a", conditions=[dict(type="Ready", status="True")])
+    server.on_list = on_list
+
+    assert client.wait_for_condition("pod", "a", "Ready", "ns", timeout=10)
+    assert len(server.requests_of("/api/v1/namespaces/ns/pods", watch="true")) == 1
+
+
+def test_wait_for_deletion(client, server):
+    server.objects["/api/v1/pods"] = {"a": _object("a", labels=dict(app="x")), "b": _object("b", labels=dict(app="x"))}
+    server.watch_events = [[("DELETED", _object("a")), ("DELETED", _object("b"))]]
+
+    assert client.wait_for_deletion("pods", namespace="ns", label_selector="app=x", timeout=10)
+
+    # already deleted: no watch
+    assert client.wait_for_deletion("pods", "c", namespace="ns", timeout=10)
+    assert len(server.requests_of("/api/v1/namespaces/ns/pods", watch="true")) == 1
+
+
+def test_wait_for_timeout(client, server):
+    server.objects["/api/v1/nodes"] = {}
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.wait_for("node", "a", lambda obj: obj, timeout=1)
+
+    assert time.monotonic() - start < 5
+
+
+def test_wait_for_api_error(client, server):
+    server.objects["/api/v1/pods"] = {}
+    server.watch_events = [[("ERROR", dict(kind="Status", code=500, reason="InternalError", message="boom"))]]
+
+    with pytest.raises(k8s.ApiError):
+        client.wait_for("pods", "a", lambda obj: obj, "ns", timeout=10)
@@ -0,0 +1,126 @@
+import subprocess
+import threading
+import time
+
+import pytest
+import yaml
+
+from projects.core.library import config, env, run
+
+
+@pytest.fixture(autouse=True)
+def artifact_dir(tmp_path):
+    with env.TempArtifactDir(tmp_path):
+        yield tmp_path
+
+
+def _fail():
+    raise ValueError("boom")
+
+
+def _wait_for_cancellation():
+    while not run.parallel_cancelled():
+        time.sleep(0.05)
+
+
+def test_parallel_max_workers():
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def task():
+        with lock:
+            running.append(1)
+            max_running.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.pop()
+
+    with run.Parallel("test", dedicated_dir=False, max_workers=2) as parallel:
+        for _ in range(5):
+            parallel.delayed(task)
+
+    assert max(max_running) == 2
+    assert [task.status for task in parallel.parallel_tasks] == ["done"] * 5
+
+
+def test_parallel_rate_limit():
+    starts = []
+
+    with run.Parallel("test", dedicated_dir=False, max_workers=4, rate_limit=5) as parallel:
+        for _ in range(4):
+            parallel.delayed(lambda: starts.append(time.time()))
+
+    starts.sort()
+    assert all(b - a >= 0.2 - 0.01 for a, b in zip(starts, starts[1:]))
+
+
+def test_parallel_timeout():
+    with pytest.raises(TimeoutError):
+        with run.Parallel("test", dedicated_dir=False, exit_on_exception=False, timeout=0.2) as parallel:
+            parallel.delayed(_wait_for_cancellation)
+
+    assert parallel.parallel_tasks[0].status == "timeout"
+
+
+def test_parallel_cooperative_cancellation():
+    with pytest.raises(ValueError):
+        with run.Parallel("test", dedicated_dir=False, exit_on_exception=False, max_workers=2) as parallel:
+            parallel.delayed(_wait_for_cancellation)
+            parallel.delayed(_fail)
+            parallel.delayed(_fail) # never started
+
+    assert [task.status for task in parallel.parallel_tasks] == ["done", "failed", "cancelled"]
+
+
+def test_parallel_kills_the_remaining_subprocesses():
+    procs = []
+
+    def stuck():
+        proc = subprocess.Popen(["sleep", "300"])
+        procs.append(proc)
+        with env.subprocess_started(proc.pid):
+            proc.wait()
+
+    def fail():
+        while not procs:
+            time.sleep(0.05)
+        _fail()
+
+    start = time.time()
+    with pytest.raises(ValueError):
+        with run.Parallel("test", dedicated_dir=False, exit_on_exception=False,
+                          max_workers=2, cancel_timeout=0.5) as parallel:
+            parallel.delayed(stuck)
+            parallel.delayed(fail)
+
+    assert time.time() - start < 10
+    assert procs[0].wait(timeout=5) == -9 # SIGKILL
+
+
+def test_parallel_process_backend():
+    with pytest.raises(ValueError):
+        with run.Parallel("test", dedicated_dir=False, exit_on_exception=False, backend="process") as parallel:
+            parallel.delayed(_fail)
+
+
+@pytest.fixture
+def project(artifact_dir, monkeypatch):
+    config_path = artifact_dir / "config.yaml"
+    config_path.write_text(yaml.dump({"tests": {"flavor": ["a", "b"], "size": [1, 2]}}))
+    monkeypatch.setattr(config, "project", config.Config(artifact_dir, config_path))
+
+    return config.project
+
+
+@pytest.mark.parametrize("executor", [None, True, dict(name="matrix", checkpoint_file=False)])
+def test_run_iterable_fields(project, executor):
+    points = []
+
+    def test_one():
+        points.append((project.get_config("tests.flavor"), project.get_config("tests.size")))
+
+    run.run_iterable_fields(["tests.flavor", "tests.size"], test_one, executor=executor)
+
+    assert sorted(points) == [("a", 1), ("a", 2), ("b", 1), ("b", 2)]
+    assert project.get_config("tests.flavor") == ["a", "b"]
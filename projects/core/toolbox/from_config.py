@@ -4,10 +4,8 @@ import io
 import logging
 import traceback
 
-import jinja2
-import jinja2.filters
-
 from projects.core.library.ansible_toolbox import RunAnsibleRole
+from projects.core.library import command_args as command_args_lib
 
 
 class From_Config:
@@ -54,43 +52,7 @@ class From_Config:
         with open(config_file) as f:
             config = yaml.safe_load(f)
 
-        with open(command_args_file) as f:
-            # parse the file as yaml and dump it a string,
-            # to resolve yaml aliases
-            command_args = f.read()
-
-        def log_warning(msg):
-            logging.warning(msg)
-
-        def raise_exception(msg):
-            raise Exception(msg)
-
-        @jinja2.filters.pass_environment
-        def or_env(environment, value, attribute=None):
-            if value:
-                return value
-
-            if not attribute:
-                logging.error("An attribute must be passed to env_override ...")
-                raise SystemExit(1)
-
-            return os.getenv(attribute)
-
-        jinja2.filters.FILTERS["or_env"] = or_env
-        jinja2.filters.FILTERS["raise_exception"] = raise_exception
-        jinja2.filters.FILTERS["log_warning"] = log_warning
-
-        command_args_tpl = jinja2.Template(command_args)
-        try:
-            command_args_rendered = command_args_tpl.render(config)
-        except jinja2.exceptions.UndefinedError as e:
-            template_frame = traceback.extract_tb(e.__traceback__)[-2]
-            if template_frame.filename != "<template>":
-                raise e
-            msg = f"Error at line {template_frame.lineno} of file {command_args_file}: {e.message}"
-            logging.error("Failed to render the Jinja template.")
-            logging.error(msg)
-            raise jinja2.exceptions.UndefinedError(msg)
+        command_args_rendered = command_args_lib.render(config, command_args_file)
 
         if group == "dump" and command == "config":
             print(command_args_rendered)
@@ -98,11 +60,7 @@ class From_Config:
 
         command_args = yaml.safe_load(command_args_rendered)
 
-        command_key = f"{group} {command}"
-        if prefix:
-            command_key = f"{prefix}/{command_key}"
-        if suffix:
-            command_key = f"{command_key}/{suffix}"
+        command_key = command_args_lib.command_key(group, command, prefix, suffix)
 
         try:
             command_args = command_args[command_key].copy()
@@ -74,11 +74,11 @@ def _parse_systemd_critical_chain(dirname, fname):
 def _parse_systemd_journal_duration(dirname):
     systemd_journal_duration = {}
 
-    for journal_file in dirname.glob(artifact_dirnames.JOURNALCTL_U_FILES):
+    for journal_file in helpers_store.glob(dirname, artifact_dirnames.JOURNALCTL_U_FILES):
         entry = types.SimpleNamespace()
 
         lines = [
-            ln for ln in register_important_file(dirname, journal_file)
+            ln for ln in register_important_file(dirname, journal_file.relative_to(dirname))
             .read_text()
             .splitlines()
             if ln and not ln.startswith("-- ") # remove the journal lines starting with -- [Boot ...|Journal begins ...|...]
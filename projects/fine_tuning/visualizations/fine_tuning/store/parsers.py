@@ -380,7 +380,7 @@ def _prepare_file_locations(dirname):
 
     job_logs_file = register_important_file(dirname, locations.job_logs)
 
-    if not job_logs_file.exists():
+    if not helpers_store.get_directory_index(dirname).exists(locations.job_logs):
         locations.job_logs = None
         logging.info(f"Job log file {job_logs_file} does not exist ...")
 
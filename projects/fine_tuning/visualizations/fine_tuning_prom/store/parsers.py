@@ -4,6 +4,7 @@ import json, yaml
 
 import dateutil.parser
 
+import projects.matrix_benchmarking.visualizations.helpers.store as helpers_store
 import projects.matrix_benchmarking.visualizations.helpers.store.parsers as helpers_store_parsers
 
 from . import prom as workload_prom
@@ -86,7 +87,7 @@ def _find_test_timestamps(dirname):
     test_timestamps = []
     FILENAME = "test_start_end.json"
     logging.info(f"Searching for {FILENAME} ...")
-    for test_timestamp_filename in sorted(dirname.glob(f"**/{FILENAME}")):
+    for test_timestamp_filename in helpers_store.glob(dirname, f"**/{FILENAME}"):
         with open(register_important_file(dirname, test_timestamp_filename.relative_to(dirname))) as f:
             try:
                 data = json.load(f)
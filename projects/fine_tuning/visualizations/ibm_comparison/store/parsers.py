@@ -137,10 +137,10 @@ def parse_rh_results(__unused__results, dirname):
 
 
 def parse_once(results, dirname):
-    if (dirname / "from_ibm").exists():
+    if helpers_store.get_directory_index(dirname).exists("from_ibm"):
         parse_ibm_results(results, dirname, "granite-7b-base.csv")
         parse_ibm_results(results, dirname, "lora_multi_gpu_v.1.2.0.csv")
-    elif (dirname / "from_rh").exists():
+    elif helpers_store.get_directory_index(dirname).exists("from_rh"):
         parse_rh_results(results, dirname)
     else:
         raise ValueError("Unexpected directory:", dirname)
@@ -109,7 +109,7 @@ def _parse_inference_service(dirname):
     inference_service = types.SimpleNamespace()
     serving_file = capture_state_dir / "serving.json"
 
-    if (dirname / serving_file).exists():
+    if helpers_store.get_directory_index(dirname).exists(serving_file):
         with open(register_important_file(dirname, serving_file)) as f:
             serving_def = json.load(f)
 
@@ -139,7 +139,7 @@ def _parse_predictor_pod(dirname):
     predictor_pod = types.SimpleNamespace()
     pods_def_file = capture_state_dir / "pods.json"
 
-    if (dirname / pods_def_file).exists():
+    if helpers_store.get_directory_index(dirname).exists(pods_def_file):
         with open(register_important_file(dirname, pods_def_file)) as f:
             pods_def = json.load(f)
     else:
@@ -203,9 +203,9 @@ def _parse_predictor_logs(dirname):
     predictor_logs.distribution = defaultdict(int)
     predictor_logs.line_count = 0
 
-    for log_file in (dirname / kserve_capture_state_dir).glob("logs/*.log"):
+    for log_file in helpers_store.glob(dirname, kserve_capture_state_dir / "logs/*.log"):
 
-        for line in open(log_file).readlines():
+        for line in open(helpers_store.track_file(dirname, log_file.relative_to(dirname))).readlines():
             predictor_logs.line_count += 1
 
             if '"severity":"ERROR"' in line:
@@ -102,5 +102,9 @@ def parse_data(results_dir=None):
 
         results_directories.append(this_dir)
 
+    # parse the directories in parallel, the results are added to the matrix in this order
+    local_store.prefetch(results_directories)
+
+    for this_dir in results_directories:
         expe = "expe"
         store_parse_directory(results_dir, expe, this_dir)
@@ -84,7 +84,7 @@ def _find_test_timestamps(dirname):
     test_timestamps = []
     FILENAME = "test_start_end.json"
     logging.info(f"Searching for {FILENAME} ...")
-    for test_timestamp_filename in sorted(dirname.glob(f"**/{FILENAME}")):
+    for test_timestamp_filename in helpers_store.glob(dirname, f"**/{FILENAME}"):
 
         with open(register_important_file(dirname, test_timestamp_filename.relative_to(dirname))) as f:
             try:
@@ -124,7 +124,7 @@ def _parse_inference_service(dirname):
     inference_service = types.SimpleNamespace()
     serving_file = capture_state_dir / "serving.json"
 
-    if (dirname / serving_file).exists():
+    if helpers_store.get_directory_index(dirname).exists(serving_file):
         with open(register_important_file(dirname, serving_file)) as f:
             serving_def = json.load(f)
 
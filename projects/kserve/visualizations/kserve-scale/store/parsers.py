@@ -10,6 +10,7 @@ import dateutil
 import matrix_benchmarking.cli_args as cli_args
 import matrix_benchmarking.store.prom_db as store_prom_db
 
+import projects.matrix_benchmarking.visualizations.helpers.store as helpers_store
 import projects.matrix_benchmarking.visualizations.helpers.store.parsers as helpers_store_parsers
 
 from . import prom as workload_prom
@@ -143,7 +144,7 @@ def _parse_user_data(dirname, user_count):
     for user_id in range(user_count):
         ci_pod_dirname = artifact_paths.LOCAL_CI_RUN_MULTI_DIR / "artifacts" / f"ci-pod-{user_id}"
         ci_pod_dirpath = dirname / ci_pod_dirname
-        if not (dirname / ci_pod_dirname).exists():
+        if not helpers_store.get_directory_index(dirname).exists(ci_pod_dirname):
             user_data[user_id] = None
             logging.warning(f"No user directory collected for user #{user_id} ({ci_pod_dirname})")
             continue
@@ -229,7 +230,7 @@ def _parse_pod_times(dirname):
 def _parse_user_resource_times(dirname, ci_pod_dir):
     resource_times = {}
 
-    glob_expansion = list(ci_pod_dir.glob("*__kserve__capture_state"))
+    glob_expansion = helpers_store.glob(dirname, ci_pod_dir.relative_to(dirname) / "*__kserve__capture_state")
     if not glob_expansion:
         raise FileNotFoundError(f"'*__kserve__capture_state' not found in {ci_pod_dir}")
 
@@ -301,7 +302,7 @@ def _parse_user_resource_times(dirname, ci_pod_dir):
 def _parse_user_grpc_calls(dirname, ci_pod_dir):
     grpc_calls = []
 
-    files_path = (dirname / ci_pod_dir).glob("*__kserve__validate_model_caikit-isvc-u*-m*/caikit-isvc-u*-m*/call_*.json")
+    files_path = helpers_store.glob(dirname, ci_pod_dir.relative_to(dirname) / "*__kserve__validate_model_caikit-isvc-u*-m*/caikit-isvc-u*-m*/call_*.json")
 
     today = datetime.datetime.today()
     today_min = datetime.datetime.combine(today, datetime.time.min)
@@ -10,7 +10,7 @@ import json
 
 import yaml
 
-from projects.core.library import env, config, run
+from projects.core.library import env, config, run, k8s
 from projects.cluster.library import prom
 from projects.matrix_benchmarking.library import visualize
 import prepare_llmd
@@ -1008,6 +1008,42 @@ def deploy_llm_inference_service(flavor, llmisvc_name, namespace, model_key):
     return llmisvc_name, namespace, llmisvc_path
 
 
+def _get_k8s_client():
+    """
+    Returns the Kubernetes REST client, or None if it cannot be built
+    from the kubeconfig (eg, exec or auth-provider users). The `oc`
+    commands are used instead then.
+    """
+
+    try:
+        return k8s.get_client()
+    except (ValueError, OSError) as e:
+        logging.warning(f"Cannot use the Kubernetes REST client ({e}), falling back to oc")
+        return None
+
+
+def _get_resource(client, resource, name, namespace):
+    """
+    Returns the resource/name object, or None if it cannot be retrieved.
+    Uses `oc` if client is None.
+    """
+
+    if client is not None:
+        try:
+            return client.get(resource, name, namespace)
+        except k8s.ApiError as e:
+            logging.warning(f"Failed to get {resource}/{name}: {e}")
+            return None
+
+    result = run.run(f"oc get {resource}/{name} -n {namespace} -o json",
+                     capture_stdout=True, check=False)
+    if result.returncode != 0:
+        logging.warning(f"Failed to get {resource}/{name}")
+        return None
+
+    return json.loads(result.stdout)
+
+
 def get_llm_inference_url(llmisvc_name, namespace, flavor):
     """
     Gets the URL of the deployed LLM inference service
@@ -1015,45 +1051,29 @@ def get_llm_inference_url(llmisvc_name, namespace, flavor):
 
     logging.info(f"Getting LLM inference service URL for flavor: {flavor}")
 
-    # Check if the LLM inference service has intelligent routing configured
-    scheduler_result = run.run(f"oc get llmisvc/{llmisvc_name} -o jsonpath='{{.spec.router.scheduler}}' -n {namespace}",
-                              capture_stdout=True, check=False)
+    client = _get_k8s_client()
+    llmisvc = _get_resource(client, "llminferenceservice", llmisvc_name, namespace) or {}
 
-    has_router_scheduler = (scheduler_result.returncode == 0 and
-                          scheduler_result.stdout.strip() != "")
+    # Check if the LLM inference service has intelligent routing configured
+    has_router_scheduler = bool(llmisvc.get("spec", {}).get("router", {}).get("scheduler"))
 
     # For services with intelligent routing, get the URL from status
     if has_router_scheduler:
         logging.info("LLM inference service has router scheduler - looking up the gateway URL from status")
 
-        # Get the LLMInferenceService status addresses
-        addresses_result = run.run(f"oc get llminferenceservice {llmisvc_name} -n {namespace} "
-                                  f"-o jsonpath='{{.status.addresses}}'",
-                                  capture_stdout=True, check=False)
-
-        if addresses_result.returncode != 0:
-            raise RuntimeError(f"Failed to get LLMInferenceService addresses: {addresses_result.stderr}")
-
-        # Parse the addresses JSON to find the URL
         gateway_name = config.project.get_config("tests.llmd.inference_service.gateway.name")
 
-        try:
-            addresses = json.loads(addresses_result.stdout)
-            gateway_url = None
-
-            for address in addresses:
-                if address.get('name') == gateway_name:
-                    gateway_url = address.get('url')
-                    break
-
-            if not gateway_url:
-                raise RuntimeError(f"{gateway_name} URL not found in LLMInferenceService status addresses")
+        gateway_url = None
+        for address in llmisvc.get("status", {}).get("addresses") or []:
+            if address.get('name') == gateway_name:
+                gateway_url = address.get('url')
+                break
 
-            logging.info(f"Intelligent-routing flavor - using {gateway_name} URL: {gateway_url}")
-            return gateway_url
+        if not gateway_url:
+            raise RuntimeError(f"{gateway_name} URL not found in LLMInferenceService status addresses")
 
-        except (json.JSONDecodeError, KeyError) as e:
-            raise RuntimeError(f"Failed to parse LLMInferenceService addresses: {e}")
+        logging.info(f"Intelligent-routing flavor - using {gateway_name} URL: {gateway_url}")
+        return gateway_url
 
     # For simple flavors, we need to append the HTTPS port from the service
     elif flavor.startswith("simple"):
@@ -1062,13 +1082,12 @@ def get_llm_inference_url(llmisvc_name, namespace, flavor):
         service_name = f"{llmisvc_name}-kserve-workload-svc"
 
         # Get the HTTPS port from the service
-        port_result = run.run(f"oc get svc {service_name} -n {namespace} "
-                              """-o jsonpath='{.spec.ports[?(@.name==\"https\")].port}'""",
-                             capture_stdout=True, check=False)
+        service = _get_resource(client, "service", service_name, namespace) or {}
+        https_ports = [port["port"] for port in service.get("spec", {}).get("ports", []) if port.get("name") == "https"]
 
-        if port_result.returncode != 0 or not port_result.stdout.strip():
+        if not https_ports:
             raise RuntimeError("Couldn't extract the SVC port :/")
-        https_port = port_result.stdout.strip()
+        https_port = https_ports[0]
         endpoint_url = f"https://{service_name}.{namespace}.svc.cluster.local:{https_port}"
         logging.info(f"Simple flavor - using port {https_port} from service")
 
@@ -1230,26 +1249,35 @@ def cleanup_llm_inference_resources():
 
     # Verify no llminferenceservice resources remain
     logging.info("Verifying no llminferenceservice resources remain")
-    for i in range(6):  # Check up to 6 times with 10 second intervals
-        result = run.run(f"oc get llminferenceservice -n {namespace} --no-headers",
-                       capture_stdout=True)
+    client = _get_k8s_client()
+    if client is not None:
+        try:
+            client.wait_for_deletion("llminferenceservice", namespace=namespace, timeout=60)
+            remaining_services = []
+        except TimeoutError:
+            remaining_services = [service["metadata"]["name"] for service in client.list("llminferenceservice", namespace)]
+    else:
+        for i in range(6):  # Check up to 6 times with 10 second intervals
+            if i:
+                time.sleep(10)
 
-        if not result.stdout.strip():
-            logging.info("No llminferenceservice resources found - cleanup successful")
-            break
-        else:
-            remaining_services = result.stdout.strip().split('\n')
-            remaining_count = len([s for s in remaining_services if s.strip()])
-            logging.info(f"Still found {remaining_count} llminferenceservice resources, waiting...")
+            result = run.run(f"oc get llminferenceservice -n {namespace} --no-headers",
+                             capture_stdout=True)
+            remaining_services = [line.split()[0] for line in result.stdout.strip().split('\n') if line.strip()]
+
+            if not remaining_services:
+                break
 
-            if i == 5:  # Last iteration
-                logging.error(f"Failed to clean up llminferenceservice resources after 60 seconds. {remaining_count} resources still exist:")
-                for service in remaining_services:
-                    if service.strip():
-                        logging.error(f"  - {service}")
-                raise RuntimeError(f"Cannot proceed with test - {remaining_count} llminferenceservice resources still exist in namespace {namespace}")
+            logging.info(f"Still found {len(remaining_services)} llminferenceservice resources, waiting...")
 
-            time.sleep(10)
+    if remaining_services:
+        remaining_count = len(remaining_services)
+        logging.error(f"Failed to clean up llminferenceservice resources after 60 seconds. {remaining_count} resources still exist:")
+        for service in remaining_services:
+            logging.error(f"  - {service}")
+        raise RuntimeError(f"Cannot proceed with test - {remaining_count} llminferenceservice resources still exist in namespace {namespace}")
+
+    logging.info("No llminferenceservice resources found - cleanup successful")
 
     logging.info("LLM inference service cleanup completed successfully")
 
@@ -1263,20 +1291,19 @@ def ensure_gpu_nodes_available():
     logging.info("Verifying GPU nodes are available in the cluster")
 
     try:
-        result = run.run("oc get nodes -l nvidia.com/gpu.present=true --no-headers", capture_stdout=True)
-
-        if result.returncode != 0:
-            raise RuntimeError(f"Failed to check GPU nodes: {result.stderr}")
-
-        gpu_nodes = result.stdout.strip().split('\n') if result.stdout.strip() else []
-        has_gpu_nodes = gpu_nodes and not (len(gpu_nodes) == 1 and gpu_nodes[0] == '')
+        client = _get_k8s_client()
+        if client is not None:
+            gpu_nodes = [node["metadata"]["name"]
+                         for node in client.list("nodes", label_selector="nvidia.com/gpu.present=true")]
+        else:
+            result = run.run("oc get nodes -l nvidia.com/gpu.present=true --no-headers", capture_stdout=True)
+            gpu_nodes = [line.split()[0] for line in result.stdout.strip().split('\n') if line.strip()]
 
-        if not has_gpu_nodes:
+        if not gpu_nodes:
             raise RuntimeError("No GPU nodes found in the cluster. GPU nodes are required for LLM inference testing. Ensure prepare_gpu() was called.")
         else:
             logging.info(f"Found {len(gpu_nodes)} GPU node(s) in the cluster")
-            for node in gpu_nodes:
-                node_name = node.split()[0]
+            for node_name in gpu_nodes:
                 logging.info(f"  - {node_name}")
 
     except Exception as e:
@@ -1308,6 +1335,18 @@ def test_llm_inference_simple(endpoint_url, llmisvc_name, namespace, model_name)
         # Convert payload to JSON string for inline use
         payload_json = json.dumps(test_payload)
 
+        # Wait for the deployment to be available before sending the request
+        client = _get_k8s_client()
+        if client is not None:
+            try:
+                client.wait_for_condition("deployments.apps", deployment_name, "Available",
+                                          namespace, timeout=300)
+            except TimeoutError:
+                logging.warning(f"Deployment {deployment_name} not available after 300s, trying anyway ...")
+        else:
+            run.run(f"oc wait deploy/{deployment_name} -n {namespace} --for=condition=Available --timeout=300s",
+                    check=False)
+
         remaining_tries = 30
         DELAY = 10
         result = None
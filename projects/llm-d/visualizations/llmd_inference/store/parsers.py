@@ -5,8 +5,8 @@ import re
 import json
 import csv
 import types
-import glob
 
+import projects.matrix_benchmarking.visualizations.helpers.store as helpers_store
 import projects.matrix_benchmarking.visualizations.helpers.store.prom as helper_prom_store
 import projects.matrix_benchmarking.visualizations.helpers.store.parsers as helpers_store_parsers
 
@@ -48,15 +48,11 @@ def find_guidellm_benchmark_directories(dirname):
     # Look for all directories matching the guidellm benchmark pattern
     # This includes both single directory and multi-rate directories
     pattern = "*__llmd__run_guidellm_benchmark*"
-    guidellm_dirs = []
+    directory_index = helpers_store.get_directory_index(dirname)
 
-    for path in glob.glob(str(dirname / pattern)):
-        path_obj = pathlib.Path(path)
-        if path_obj.is_dir():
-            guidellm_dirs.append(path_obj)
-
-    # Sort to ensure consistent ordering
-    return sorted(guidellm_dirs)
+    # the glob results are sorted, to ensure consistent ordering
+    return [dirname / path for path in directory_index.glob(pattern)
+            if directory_index.is_dir(path)]
 
 def parse_once(results, dirname):
     """Parse the benchmark log files once"""
@@ -69,13 +65,14 @@ def parse_once(results, dirname):
     results.guidellm_configuration = None
     guidellm_directories = find_guidellm_benchmark_directories(dirname)
 
+    directory_index = helpers_store.get_directory_index(dirname)
     if guidellm_directories:
         for guidellm_dir in guidellm_directories:
             # Check for JSON file first, fallback to log file
             json_file_path = guidellm_dir / "artifacts" / "results" / "benchmarks.json"
             log_file_path = guidellm_dir / "artifacts" / "guidellm_benchmark_job.logs"
 
-            if json_file_path.exists():
+            if directory_index.exists(json_file_path.relative_to(dirname)):
                 benchmarks = parse_guidellm_benchmark_json(dirname, json_file_path.relative_to(dirname))
                 results.guidellm_benchmarks.extend(benchmarks)
                 logging.info(f"Parsed {len(benchmarks)} guidellm benchmarks from JSON: {json_file_path}")
@@ -84,7 +81,7 @@ def parse_once(results, dirname):
                 if results.guidellm_configuration is None:
                     results.guidellm_configuration = _parse_guidellm_config(dirname, json_file_path.relative_to(dirname))
 
-            elif log_file_path.exists():
+            elif directory_index.exists(log_file_path.relative_to(dirname)):
                 raise RuntimeError("Don't want to use log-file parsing (hardcoded)")
                 benchmarks = parse_guidellm_benchmark_log(dirname, log_file_path.relative_to(dirname))
                 results.guidellm_benchmarks.extend(benchmarks)
@@ -98,7 +95,7 @@ def parse_once(results, dirname):
 
     # Parse test metadata
     exit_code_path = "exit_code"
-    if exit_code_path and (dirname / exit_code_path).exists():
+    if exit_code_path and directory_index.exists(exit_code_path):
         with open(register_important_file(dirname, exit_code_path)) as f:
             exit_code = f.read().strip()
             results.test_success = (exit_code == "0")
@@ -116,7 +113,7 @@ def parse_once(results, dirname):
 def parse_guidellm_benchmark_log(dirname, log_file_path: pathlib.Path) -> list[GuidellmBenchmark]:
     """Parse Guidellm benchmark log file and extract metrics for each strategy"""
 
-    if not (dirname / log_file_path).exists():
+    if not helpers_store.get_directory_index(dirname).exists(log_file_path):
         logging.warning(f"Guidellm benchmark log not found: {log_file_path}")
         return []
 
@@ -287,7 +284,7 @@ def parse_guidellm_benchmark_log(dirname, log_file_path: pathlib.Path) -> list[G
 def parse_guidellm_benchmark_json(dirname, json_file_path: pathlib.Path) -> list[GuidellmBenchmark]:
     """Parse Guidellm benchmark JSON file and extract metrics"""
 
-    if not (dirname / json_file_path).exists():
+    if not helpers_store.get_directory_index(dirname).exists(json_file_path):
         logging.warning(f"Guidellm benchmark JSON not found: {json_file_path}")
         return []
 
@@ -479,7 +476,7 @@ def parse_guidellm_benchmark_json(dirname, json_file_path: pathlib.Path) -> list
 def _parse_guidellm_config(dirname, json_file_path: pathlib.Path):
     """Parse GuideLLM configuration from JSON file"""
 
-    if not (dirname / json_file_path).exists():
+    if not helpers_store.get_directory_index(dirname).exists(json_file_path):
         logging.warning(f"GuideLLM JSON config file not found: {json_file_path}")
         return None
 
@@ -513,7 +510,7 @@ def _parse_llmisvc_config(dirname):
 
     llmisvc_config_path = artifact_paths.LLMISVC_CAPTURE_DIR / "artifacts" / "llminferenceservice.json"
 
-    if not (dirname / llmisvc_config_path).exists():
+    if not helpers_store.get_directory_index(dirname).exists(llmisvc_config_path):
         logging.warning(f"LLMISVC config file not found at {llmisvc_config_path}")
         return None
 
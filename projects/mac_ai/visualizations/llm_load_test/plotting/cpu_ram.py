@@ -34,6 +34,9 @@ def generateUsageData(entries, _variables, _ordered_vars, main_key,
     ordered_vars = [v for v in _ordered_vars if v in variables]
 
     for entry in entries:
+        if hasattr(entry.results, "load_all"):
+            entry.results.load_all() # lazy results of the columnar cache, read through __dict__
+
         main_field = entry.results.__dict__.get(main_key)
         if not main_field: continue
 
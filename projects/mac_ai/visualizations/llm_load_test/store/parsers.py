@@ -97,14 +97,16 @@ def _parse_file_links(dirname):
     if not  artifact_paths.MAC_AI_REMOTE_LLAMA_CPP_RUN_MODEL:
         return None
 
-    server_logs = dirname / artifact_paths.MAC_AI_REMOTE_LLAMA_CPP_RUN_MODEL / "artifacts" / "llama_cpp.log"
+    directory_index = helpers_store.get_directory_index(dirname)
+    artifacts_dir = artifact_paths.MAC_AI_REMOTE_LLAMA_CPP_RUN_MODEL / "artifacts"
+    server_logs = artifacts_dir / "llama_cpp.log"
 
-    file_links.server_logs = server_logs.relative_to(dirname) \
-        if server_logs.exists() else None
+    file_links.server_logs = server_logs \
+        if directory_index.exists(server_logs) else None
 
     file_links.server_build_logs = {}
-    for f in (dirname / artifact_paths.MAC_AI_REMOTE_LLAMA_CPP_RUN_MODEL / "artifacts").glob("build.*.log"):
-        file_links.server_build_logs[f.name] = f.relative_to(dirname)
+    for f in directory_index.glob(str(artifacts_dir / "build.*.log")):
+        file_links.server_build_logs[f.name] = f
 
     return file_links
 
@@ -424,7 +426,7 @@ def _parse_system_state(dirname):
 
 @helpers_store_parsers.ignore_file_not_found
 def _parse_ramalama_commit_info(dirname):
-    info_text = (dirname / "ramalama-commit.info").read_text().split("\n")
+    info_text = register_important_file(dirname, "ramalama-commit.info").read_text().split("\n")
 
     ramalama_commit_info = types.SimpleNamespace()
     ramalama_commit_info.date_id = info_text[0]
@@ -95,10 +95,8 @@ def call_parse(step_idx, common_args, common_env):
     parse_env = common_env.copy()
     parse_args = common_args.copy()
 
-    mode = config.project.get_config("matbench.download.mode", None)
-    if mode != "prefer_cache":
-        logging.info(f"Download mode set to '{mode}', ignoring the parser cache.")
-        parse_env["MATBENCH_STORE_IGNORE_CACHE"] = "y"
+    # the parser cache files are validated against the files and the
+    # DirectoryIndex listings they were generated from.
 
     parse_args["output-matrix"] = env.ARTIFACT_DIR / "internal_matrix.json"
 
@@ -0,0 +1,103 @@
+import datetime
+import pickle
+import types
+
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("numpy")
+pytest.importorskip("matrix_benchmarking")
+
+from projects.matrix_benchmarking.visualizations.helpers.store import columnar
+
+
+def _series(values):
+    return types.SimpleNamespace(metric={"pod": "a", "container": "c"}, values=values)
+
+
+def _results():
+    return types.SimpleNamespace(
+        scalar=42,
+        name="test",
+        nothing=None,
+        scalars=[1, 2.5, "x", None],
+        namespaces=[types.SimpleNamespace(a=1, b=[types.SimpleNamespace(c="d")]), 2],
+        mapping={"a": {"b": [1, 2]}, "c": types.SimpleNamespace(d=True)},
+        int_keys={1: "one", 2: types.SimpleNamespace(two=2)},
+        nested=types.SimpleNamespace(
+            inner=types.SimpleNamespace(value=1.5),
+            when=datetime.datetime(2024, 1, 2, 3, 4, 5),
+        ),
+        metrics={
+            "cpu": [_series({1: 0.5, 2: 1.5}), _series({3.5: 2, 4.5: 3})],
+            "memory": [_series({10: 100, 20: 200})],
+            "empty": [],
+        },
+    )
+
+
+def _plain(value):
+    # the SeriesValues mappings compare as dicts
+    if isinstance(value, types.SimpleNamespace):
+        return {key: _plain(item) for key, item in value.__dict__.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    if isinstance(value, columnar.SeriesValues):
+        return dict(value.items())
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    return value
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    cache_dir = tmp_path / "cache.columnar"
+    columnar.save(cache_dir, {"version": 1}, _results())
+
+    return cache_dir
+
+
+def test_header(cache_dir):
+    header = columnar.load_header(cache_dir)
+
+    assert header["version"] == 1
+    assert header["has_series"]
+    assert set(header["attributes"]) == set(_results().__dict__)
+
+
+def test_round_trip(cache_dir):
+    results = columnar.load(cache_dir, columnar.load_header(cache_dir))
+
+    assert _plain(results.load_all()) == _plain(_results())
+
+
+def test_lazy_loading(cache_dir):
+    results = columnar.load(cache_dir, columnar.load_header(cache_dir))
+    assert results.__dict__ == {}
+
+    assert results.scalar == 42
+    assert list(results.__dict__) == ["scalar"]
+
+    with pytest.raises(AttributeError):
+        results.missing
+
+    assert "int_keys" not in results.__dict__
+    results.load_all()
+    assert results.__dict__.keys() == _results().__dict__.keys()
+
+
+def test_series_values(cache_dir):
+    results = columnar.load(cache_dir, columnar.load_header(cache_dir))
+    cpu = results.metrics["cpu"]
+
+    assert isinstance(cpu[0].values, columnar.SeriesValues)
+    assert cpu[0].metric == {"pod": "a", "container": "c"}
+    assert list(cpu[0].values) == [1, 2] # int timestamps
+    assert cpu[0].values[2] == 1.5
+    assert list(cpu[1].values.values()) == [2, 3] # int values
+    assert len(results.metrics["memory"][0].values) == 2
+
+    # the pickled results don't refer to the cache directory
+    reloaded = pickle.loads(pickle.dumps(results))
+    assert type(reloaded) is types.SimpleNamespace
+    assert _plain(reloaded) == _plain(_results())
@@ -0,0 +1,402 @@
+import io
+import json
+import struct
+import tarfile
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+pytest.importorskip("matrix_benchmarking")
+
+from projects.matrix_benchmarking.visualizations.helpers.store import prom_tsdb, promql
+
+
+###
+# Encoder of a tiny Prometheus TSDB dump, following the format
+# documentation of the Prometheus repository (tsdb/docs/format/). The
+# checksums are left empty, they aren't verified by the reader.
+###
+
+BASE_MS = 1_699_999_980_000 # a multiple of the evaluation step
+
+BLOCK_ULID = "01ARZ3NDEKTSV4RRFFQ69G5FAV"
+
+# XOR chunk of the (1000ms, 1.0), (2000ms, 1.0), (3000ms, 2.0), (4500ms, 2.0) samples, encoded by hand:
+XOR_CHUNK = bytes([
+    0x00, 0x04, # number of samples
+    0xD0, 0x0F, # first timestamp, varint: 1000
+    0x3F, 0xF0, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, # first value: 1.0
+    0xE8, 0x07, # second timestamp delta, uvarint: 1000
+    # 0: same value | 0: delta of delta is 0
+    # 11 00001 001011 11111111111: value xor 0x7ff0000000000000, 1 leading zero, 11 significant bits
+    # 10 00000111110100: delta of delta of 500 | 0: same value | padding
+    0x30, 0x97, 0xFF, 0xE0, 0x7D, 0x00,
+])
+
+
+def _uvarint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _varint(value):
+    return _uvarint((value << 1) ^ (value >> 63))
+
+
+def _string(value):
+    return _uvarint(len(value.encode())) + value.encode()
+
+
+def _float_bits(value):
+    return struct.unpack(">Q", struct.pack(">d", value))[0]
+
+
+def _in_bit_range(value, nbits):
+    return -((1 << (nbits - 1)) - 1) <= value <= 1 << (nbits - 1)
+
+
+def _xor_chunk(samples):
+    bits = []
+
+    def write(value, nbits):
+        bits.extend((value >> (nbits - 1 - idx)) & 1 for idx in range(nbits))
+
+    def write_bytes(data):
+        for byte in data:
+            write(byte, 8)
+
+    leading = trailing = None
+    t_delta = 0
+    for idx, (t, value) in enumerate(samples):
+        if idx == 0:
+            write_bytes(_varint(t))
+            write(_float_bits(value), 64)
+            continue
+
+        previous_t, previous_value = samples[idx - 1]
+        if idx == 1:
+            t_delta = t - previous_t
+            write_bytes(_uvarint(t_delta))
+        else:
+            dod = (t - previous_t) - t_delta
+            t_delta = t - previous_t
+            if dod == 0:
+                write(0, 1)
+            else:
+                for prefix, nbits in ((0b10, 14), (0b110, 17), (0b1110, 20), (0b1111, 64)):
+                    if nbits == 64 or _in_bit_range(dod, nbits):
+                        write(prefix, prefix.bit_length())
+                        write(dod & ((1 << nbits) - 1), nbits)
+                        break
+
+        xor = _float_bits(value) ^ _float_bits(previous_value)
+        if xor == 0:
+            write(0, 1)
+            continue
+
+        new_leading = min(64 - xor.bit_length(), 31)
+        new_trailing = (xor & -xor).bit_length() - 1
+        if leading is not None and new_leading >= leading and new_trailing >= trailing:
+            write(0b10, 2)
+            write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = new_leading, new_trailing
+            significant_bits = 64 - leading - trailing
+            write(0b11, 2)
+            write(leading, 5)
+            write(significant_bits & 0x3f, 6)
+            write(xor >> trailing, significant_bits)
+
+    bits += [0] * (-len(bits) % 8)
+    data = bytes(int("".join(map(str, bits[pos:pos + 8])), 2) for pos in range(0, len(bits), 8))
+
+    return len(samples).to_bytes(2, "big") + data
+
+
+def _block_files(series):
+    """
+    Returns the {path: content} of a persisted block with the `series`
+    [(labels, [(time ms, value)])], one chunk per series.
+    """
+
+    series = sorted(series, key=lambda entry: sorted(entry[0].items()))
+
+    # chunks/000001
+    chunks = bytearray(struct.pack(">IB3x", prom_tsdb.CHUNKS_MAGIC, 1))
+    chunk_refs = []
+    for _, samples in series:
+        chunk_refs.append(len(chunks)) # file sequence 0
+        data = _xor_chunk(samples)
+        chunks += _uvarint(len(data)) + bytes([prom_tsdb.CHUNK_ENCODING_XOR]) + data + bytes(4)
+
+    # index
+    symbols = sorted({string for labels, _ in series for item in labels.items() for string in item})
+    index = bytearray(struct.pack(">IB", prom_tsdb.INDEX_MAGIC, prom_tsdb.INDEX_FORMAT_V2))
+
+    symbols_offset = len(index)
+    content = struct.pack(">I", len(symbols)) + b"".join(_string(symbol) for symbol in symbols)
+    index += struct.pack(">I", len(content)) + content + bytes(4)
+
+    series_offset = None
+    series_refs = []
+    for (labels, samples), chunk_ref in zip(series, chunk_refs):
+        index += bytes(-len(index) % 16) # 16-byte aligned
+        series_offset = series_offset or len(index)
+        series_refs.append(len(index) // 16)
+
+        entry = _uvarint(len(labels))
+        for name, value in sorted(labels.items()):
+            entry += _uvarint(symbols.index(name)) + _uvarint(symbols.index(value))
+        mint, maxt = samples[0][0], samples[-1][0]
+        entry += _uvarint(1) + _varint(mint) + _uvarint(maxt - mint) + _uvarint(chunk_ref)
+        index += _uvarint(len(entry)) + entry + bytes(4)
+
+    postings = {("", ""): series_refs}
+    for (labels, _), ref in zip(series, series_refs):
+        postings.setdefault(("__name__", labels["__name__"]), []).append(ref)
+
+    postings_start = len(index)
+    postings_offsets = {}
+    for key in sorted(postings):
+        postings_offsets[key] = len(index)
+        content = struct.pack(f">I{len(postings[key])}I", len(postings[key]), *postings[key])
+        index += struct.pack(">I", len(content)) + content + bytes(4)
+
+    postings_table_offset = len(index)
+    content = struct.pack(">I", len(postings_offsets))
+    for (name, value), offset in postings_offsets.items():
+        content += _uvarint(2) + _string(name) + _string(value) + _uvarint(offset)
+    index += struct.pack(">I", len(content)) + content + bytes(4)
+
+    # no label indices, nor label offset table: not used by the reader
+    index += struct.pack(">6Q", symbols_offset, series_offset, postings_start, postings_table_offset,
+                         postings_start, postings_table_offset) + bytes(4)
+
+    times = [t for _, samples in series for t, _ in samples]
+    meta = dict(ulid=BLOCK_ULID, minTime=min(times), maxTime=max(times) + 1, version=1)
+
+    return {
+        # the chunks before the index, to have them spooled
+        f"{BLOCK_ULID}/chunks/000001": bytes(chunks),
+        f"{BLOCK_ULID}/index": bytes(index),
+        f"{BLOCK_ULID}/meta.json": json.dumps(meta).encode(),
+    }
+
+
+def _series_record(series):
+    # series: {ref: labels}
+    record = bytes([prom_tsdb.RECORD_SERIES])
+    for ref, labels in series.items():
+        record += struct.pack(">Q", ref) + _uvarint(len(labels))
+        for name, value in labels.items():
+            record += _string(name) + _string(value)
+
+    return record
+
+
+def _samples_record(samples):
+    # samples: [(ref, time ms, value)]
+    base_ref, base_time, _ = samples[0]
+    record = bytes([prom_tsdb.RECORD_SAMPLES]) + struct.pack(">Qq", base_ref, base_time)
+    for ref, t, value in samples:
+        record += _varint(ref - base_ref) + _varint(t - base_time) + struct.pack(">d", value)
+
+    return record
+
+
+def _snappy_literal(data):
+    # a snappy block made of a single literal
+    length = len(data) - 1
+    if length < 60:
+        tag = bytes([length << 2])
+    else:
+        tag = bytes([61 << 2]) + length.to_bytes(2, "little")
+
+    return _uvarint(len(data)) + tag + data
+
+
+def _wal_segment(records, snappy=False, split=False):
+    segment = bytearray()
+    for record in records:
+        flags = 0
+        if snappy:
+            record = _snappy_literal(record)
+            flags = prom_tsdb.WAL_SNAPPY_MASK
+
+        fragments = [(prom_tsdb.WAL_RECORD_FULL, record)]
+        if split:
+            middle = len(record) // 2
+            fragments = [(prom_tsdb.WAL_RECORD_FIRST, record[:middle]), (prom_tsdb.WAL_RECORD_LAST, record[middle:])]
+
+        for record_type, fragment in fragments:
+            segment += struct.pack(">BH", record_type | flags, len(fragment)) + bytes(4) + fragment
+
+    # padding until the end of the page
+    return bytes(segment + bytes(-len(segment) % prom_tsdb.WAL_PAGE_SIZE))
+
+
+def _s(seconds):
+    return BASE_MS + seconds * 1000
+
+
+UP = {"__name__": "up", "job": "a", "instance": "x"}
+REQUESTS_X = {"__name__": "requests_total", "job": "a", "instance": "x"}
+REQUESTS_Z = {"__name__": "requests_total", "job": "a", "instance": "z"}
+STALE_NAN = struct.unpack(">d", struct.pack(">Q", promql.STALE_NAN_BITS))[0]
+
+
+def _tarball_files():
+    files = _block_files([
+        (UP, [(_s(t), 1.0) for t in (0, 15, 30, 45, 60)]),
+        (REQUESTS_X, [(_s(t), float(t // 15 * 10)) for t in (0, 15, 30, 45, 60)]), # 0 -> 40
+        (REQUESTS_Z, [(_s(t), 100.0) for t in (0, 15, 30, 45, 60)]),
+    ])
+
+    wal_series = _series_record({1: UP, 2: REQUESTS_X})
+
+    # the checkpoint covers the segment 0, which is still there
+    files["wal/checkpoint.00000000/00000000"] = _wal_segment([
+        wal_series,
+        _samples_record([(1, _s(75), 1.0), (2, _s(75), 50.0), (1, _s(90), 1.0), (2, _s(90), 60.0)]),
+    ], split=True)
+    files["wal/00000000"] = _wal_segment([wal_series, _samples_record([(1, _s(80), 99.0), (2, _s(80), 99.0)])])
+
+    # the series are only defined in the checkpoint; counter reset at 105s
+    files["wal/00000001"] = _wal_segment([
+        _samples_record([(2, _s(105), 5.0), (1, _s(120), STALE_NAN), (2, _s(120), 15.0), (2, _s(150), 25.0)]),
+    ], snappy=True)
+
+    return files
+
+
+@pytest.fixture
+def prom_tarball(tmp_path):
+    path = tmp_path / "prometheus.tar.gz"
+    with tarfile.open(path, "w:gz") as tar:
+        for name, content in _tarball_files().items():
+            info = tarfile.TarInfo(f"./{name}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+
+    return path
+
+
+def test_decode_xor_chunk():
+    times, values = prom_tsdb._decode_xor_chunk(XOR_CHUNK)
+
+    assert times == [1000, 2000, 3000, 4500]
+    assert values == [_float_bits(1.0), _float_bits(1.0), _float_bits(2.0), _float_bits(2.0)]
+
+
+def test_xor_chunk_encoder():
+    # checks the encoder of the fixtures against the hand-encoded chunk
+    assert _xor_chunk([(1000, 1.0), (2000, 1.0), (3000, 2.0), (4500, 2.0)]) == XOR_CHUNK
+
+
+@pytest.mark.parametrize("samples", [
+    [(0, 0.0)],
+    [(-5000, 1.5), (10_000, -2.25), (10_001, 1e300), (2_000_000, 0.1), (2_000_000 + 2**40, 0.1)],
+    [(t * 15_000 + (t % 3) * 700, float(t ** 2)) for t in range(200)],
+])
+def test_xor_chunk_round_trip(samples):
+    times, values = prom_tsdb._decode_xor_chunk(_xor_chunk(samples))
+
+    assert times == [t for t, _ in samples]
+    assert values == [_float_bits(value) for _, value in samples]
+
+
+def test_snappy_decompress():
+    data = b"abcabcabcabcd"
+    # literal "abc", copy of 9 bytes with the 1-byte offset 3 (overlapping its output), literal "d"
+    block = _uvarint(len(data)) + bytes([2 << 2]) + b"abc" + bytes([((9 - 4) << 2) | 1, 3]) + bytes([0]) + b"d"
+
+    assert prom_tsdb._snappy_decompress(block) == data
+
+
+def _evaluate(prom_tarball, queries):
+    results = prom_tsdb.evaluate_tarball(prom_tarball, {name: promql.parse(query) for name, query in queries.items()})
+
+    return {name: [(series.metric, {ts - BASE_MS // 1000: value for ts, value in series.values.items()})
+                   for series in result]
+            for name, result in results.items()}
+
+
+def test_read_tarball(prom_tarball):
+    selectors = promql.selectors(promql.parse("requests_total"))
+    series, min_time, max_time = prom_tsdb.read_tarball(prom_tarball, selectors)
+
+    assert (min_time, max_time) == (_s(0), _s(150))
+    assert sorted(labels["instance"] for labels, _, _ in series.values()) == ["x", "z"]
+
+    labels, times, values = series[prom_tsdb._labels_key(REQUESTS_X)]
+    # the block, the checkpoint and the segment 1. The segment 0 is covered by the checkpoint.
+    assert ((times - BASE_MS) // 1000).tolist() == [0, 15, 30, 45, 60, 75, 90, 105, 120, 150]
+    assert values.tolist() == [0, 10, 20, 30, 40, 50, 60, 5, 15, 25]
+
+
+def test_evaluate_tarball(prom_tarball):
+    results = _evaluate(prom_tarball, {
+        "up": 'up{job="a"}',
+        "requests": "sum by (job) (requests_total)",
+        "rate": 'rate(requests_total{instance="x"}[1m])',
+        "missing": "missing_metric",
+    })
+
+    # evaluated every 30s; the stale marker at 120s removes the `up` series
+    assert results["up"] == [(UP, {0: 1, 30: 1, 60: 1, 90: 1})]
+    assert results["requests"] == [({"job": "a"}, {0: 100, 30: 120, 60: 140, 90: 160, 120: 115, 150: 125})]
+
+    # [60s, 120s] window: 40 -> 60, reset, 5 -> 15
+    rate_metric, rate_values = results["rate"][0]
+    assert rate_metric == {"job": "a", "instance": "x"}
+    assert rate_values[120] == pytest.approx((20 + 5 + 10) / 60)
+
+    assert results["missing"] == []
+
+
+def test_extract_metrics(prom_tarball, monkeypatch, caplog):
+    forwarded = []
+
+    def server_extract_metrics(prom_tarball, metrics, dirname):
+        forwarded.extend(metrics)
+        return {name: ["from the server"] for entry in metrics for name in (entry if isinstance(entry, dict) else [entry])}
+
+    monkeypatch.setattr(prom_tsdb.store_prom_db, "extract_metrics", server_extract_metrics, raising=False)
+
+    metrics = [
+        "up",
+        {"quantile": "histogram_quantile(0.9, sum(rate(latency_bucket[1m])) by (le))"},
+        {"requests": "sum(requests_total)"},
+    ]
+    results = prom_tsdb.extract_metrics(prom_tarball, metrics, prom_tarball.parent)
+
+    assert list(results) == ["up", "quantile", "requests"]
+    assert forwarded == [metrics[1]]
+    assert results["quantile"] == ["from the server"]
+    assert results["requests"][0].values[BASE_MS // 1000 + 60] == 140
+    assert "'quantile'" in caplog.text
+
+
+def test_extract_metrics_invalid_tarball(tmp_path, monkeypatch, caplog):
+    forwarded = []
+    monkeypatch.setattr(prom_tsdb.store_prom_db, "extract_metrics",
+                        lambda prom_tarball, metrics, dirname: forwarded.extend(metrics) or {}, raising=False)
+
+    prom_tarball = tmp_path / "prometheus.tar"
+    with tarfile.open(prom_tarball, "w") as tar:
+        content = b"not an index"
+        info = tarfile.TarInfo(f"./{BLOCK_ULID}/index")
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+
+    metrics = ["up", {"requests": "sum(requests_total)"}]
+    prom_tsdb.extract_metrics(prom_tarball, metrics, tmp_path)
+
+    # everything is forwarded to the Prometheus server, with a warning naming the queries
+    assert forwarded == metrics
+    assert "'up', 'requests'" in caplog.text
+    assert "TSDBFormatError" in caplog.text
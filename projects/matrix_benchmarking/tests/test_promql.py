@@ -0,0 +1,157 @@
+import struct
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+pytest.importorskip("matrix_benchmarking")
+
+from projects.matrix_benchmarking.visualizations.helpers.store import promql
+
+
+STALE_NAN = struct.unpack(">d", struct.pack(">Q", promql.STALE_NAN_BITS))[0]
+
+
+def _series(labels, samples):
+    # samples: [(time in seconds, value)]
+    times = numpy.array([int(t * 1000) for t, _ in samples], dtype=numpy.int64)
+    values = numpy.array([value for _, value in samples], dtype=numpy.float64)
+    return labels, times, values
+
+
+SERIES = [
+    _series({"__name__": "up", "job": "a", "instance": "x"}, [(0, 1), (15, 1), (30, 1), (45, 1), (60, 1)]),
+    _series({"__name__": "up", "job": "a", "instance": "y"}, [(0, 0), (30, 0)]),
+    _series({"__name__": "up", "job": "b", "instance": "z"}, [(0, 1), (15, 1), (30, 1), (45, 1), (60, 1)]),
+    # counter reset at 45s
+    _series({"__name__": "requests_total", "job": "a", "instance": "x"}, [(0, 0), (15, 10), (30, 20), (45, 5), (60, 15)]),
+    _series({"__name__": "requests_total", "job": "a", "instance": "y"}, [(0, 0), (15, 30), (30, 60), (45, 90), (60, 120)]),
+    # stale marker at 30s, the series comes back at 60s
+    _series({"__name__": "temperature", "room": "a"}, [(0, 20), (15, 21), (30, STALE_NAN), (60, 23)]),
+]
+
+
+def _select(selector):
+    return [(labels, times, values) for labels, times, values in SERIES
+            if promql.matches(selector.matchers, labels)]
+
+
+def _evaluate(query, timestamps=(0, 15, 30, 45, 60)):
+    timestamps_ms = [t * 1000 for t in timestamps]
+    result = promql.evaluate(promql.parse(query), _select, timestamps_ms)
+
+    # {labels: {timestamp: value}} of the samples present
+    return {tuple(sorted(series.labels.items())): {t: value for t, value, present
+                                                   in zip(timestamps, series.values.tolist(), series.present.tolist())
+                                                   if present}
+            for series in result}
+
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+
+@pytest.mark.parametrize("query, instances", [
+    ('up{job="a"}', ["x", "y"]),
+    ('up{job!="a"}', ["z"]),
+    ('up{instance=~"x|z"}', ["x", "z"]),
+    ('up{instance!~"x|z"}', ["y"]),
+    ('{__name__="up", job="b"}', ["z"]),
+    ('{__name__=~"up|requests_total", instance="x"}', ["x", "x"]),
+])
+def test_selectors(query, instances):
+    result = _evaluate(query, [60])
+
+    assert sorted(dict(labels)["instance"] for labels in result) == instances
+
+
+def test_instant_lookback():
+    result = _evaluate('up{instance="y"}', [0, 60, 300 + 30, 300 + 31])
+
+    # the last sample is at 30s, visible for 5 minutes
+    assert result == {_labels(__name__="up", job="a", instance="y"): {0: 0, 60: 0, 330: 0}}
+
+
+def test_rate_counter_reset():
+    result = _evaluate('rate(requests_total{instance="x"}[1m])', [60])
+
+    # 0 -> 20, reset, 5 -> 15: increase of 35 in 60s (no extrapolation, the window is fully sampled)
+    assert result == {_labels(job="a", instance="x"): {60: pytest.approx(35 / 60)}}
+
+    result = _evaluate('increase(requests_total{instance="x"}[1m])', [60])
+    assert result == {_labels(job="a", instance="x"): {60: pytest.approx(35)}}
+
+
+def test_rate_extrapolation():
+    # the samples of the [5s, 45s] window (15s -> 45s) increase by 60 in
+    # 30s: extrapolated to the start of the window, 80 in 40s
+    result = _evaluate('increase(requests_total{instance="y"}[40s])', [45])
+    assert result[_labels(job="a", instance="y")][45] == pytest.approx(80)
+
+    result = _evaluate('rate(requests_total{instance="y"}[40s])', [45])
+    assert result[_labels(job="a", instance="y")][45] == pytest.approx(2.0)
+
+    # fewer than two samples in the window
+    assert _evaluate('rate(requests_total{instance="y"}[10s])', [60]) == {}
+
+
+def test_irate():
+    result = _evaluate('irate(requests_total{instance="x"}[1m])', [45, 60])
+
+    # the last two samples: a reset (5 / 15s), then 10 / 15s
+    assert result == {_labels(job="a", instance="x"): {45: pytest.approx(5 / 15), 60: pytest.approx(10 / 15)}}
+
+
+def test_sum_by():
+    result = _evaluate("sum by (job) (up)", [60])
+
+    assert result == {_labels(job="a"): {60: 1}, _labels(job="b"): {60: 1}}
+
+
+def test_sum_without():
+    result = _evaluate("sum without (instance) (requests_total)", [30, 60])
+
+    # the metric name is dropped
+    assert result == {_labels(job="a"): {30: 80, 60: 135}}
+
+
+def test_aggregations():
+    assert _evaluate('max(up)', [60]) == {(): {60: 1}}
+    assert _evaluate('min(up)', [60]) == {(): {60: 0}}
+    assert _evaluate('count(up)', [60]) == {(): {60: 3}}
+    assert _evaluate('avg(up)', [60]) == {(): {60: pytest.approx(2 / 3)}}
+    assert _evaluate("sum(rate(requests_total[1m])) by (job)", [60]) == \
+        {_labels(job="a"): {60: pytest.approx(35 / 60 + 120 / 60)}}
+
+
+def test_binary_operations():
+    assert _evaluate('requests_total{instance="y"} / 30', [60]) == {_labels(job="a", instance="y"): {60: 4}}
+    assert _evaluate('100 - requests_total{instance="y"}', [30]) == {_labels(job="a", instance="y"): {30: 40}}
+
+    # the comparisons filter the samples, and keep the metric name
+    assert _evaluate('requests_total > 50', [30, 60]) == \
+        {_labels(__name__="requests_total", job="a", instance="y"): {30: 60, 60: 120}}
+
+
+def test_stale_markers():
+    result = _evaluate("temperature", [0, 15, 30, 45, 60])
+
+    # absent from the stale marker until the next sample
+    assert result == {_labels(__name__="temperature", room="a"): {0: 20, 15: 21, 60: 23}}
+
+    # the stale markers are ignored by the range functions: 20 -> 23
+    result = _evaluate("increase(temperature[1m])", [60])
+    assert result == {_labels(room="a"): {60: pytest.approx(3)}}
+
+
+@pytest.mark.parametrize("query", [
+    'histogram_quantile(0.9, rate(x[1m]))',
+    'x offset 5m',
+    'rate(x[5m:1m])',
+    'x / y',
+    'x + on(job) y',
+    '1 + 1',
+    'x{',
+])
+def test_unsupported_queries(query):
+    with pytest.raises(promql.UnsupportedQuery):
+        promql.parse(query)
@@ -20,6 +20,9 @@ def get_tests_timestamp_plots(entries, y_max, variables):
     tz_offset = datetime.datetime.fromtimestamp(now.timestamp()) - datetime.datetime.utcfromtimestamp(now.timestamp())
 
     for entry in entries:
+        if hasattr(entry.results, "load_all"):
+            entry.results.load_all() # lazy results of the columnar cache, read through __dict__
+
         if "tests_timestamp" not in entry.results.__dict__: continue
 
         for test_timestamp in entry.results.tests_timestamp:
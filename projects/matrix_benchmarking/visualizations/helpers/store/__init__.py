@@ -4,15 +4,77 @@ import os
 import pathlib
 import pickle
 import fnmatch
+import re
 import json
 import functools
 import inspect
-
-import jsonpath_ng
+import hashlib
+import stat
+import multiprocessing
+import concurrent.futures
 
 from matrix_benchmarking.parse import json_dumper
 import matrix_benchmarking.store as store
+import matrix_benchmarking.store.simple as store_simple
 import matrix_benchmarking.common as common
+import matrix_benchmarking.cli_args as cli_args
+
+import projects.core.library.jsonpath as jsonpath_lib
+
+from . import columnar
+from .directory_index import DirectoryIndex
+
+# bump when the structure of the cache files changes
+CACHE_FORMAT_VERSION = 3
+
+# the files bigger than this are validated with their size and mtime only
+MANIFEST_HASH_MAX_SIZE = 32 * 1024 * 1024
+
+# pickle: one pickle file per directory
+# columnar: Parquet table + memory-mapped NumPy arrays, loaded lazily (requires pyarrow and numpy)
+CACHE_BACKENDS = ("pickle", "columnar")
+
+_parsing_store = None # the store running its parse_once, which records the files read
+_prefetching_store = None # the store parsing directories in the worker processes
+
+
+def track_file(dirname, filename):
+    """
+    Records dirname/filename in the manifest of the cache file of the
+    directory being parsed, and returns it.
+
+    Used by the helper parsers, to get the files they read tracked
+    without requiring them in the workload important files.
+    """
+
+    if _parsing_store is not None:
+        _parsing_store._track_file(dirname, filename)
+
+    return dirname / filename
+
+
+def get_directory_index(dirname):
+    """
+    Returns the DirectoryIndex of `dirname`. When called from the
+    parsers, the index is shared with the store parsing the directory.
+    """
+
+    if _parsing_store is not None:
+        return _parsing_store.get_directory_index(dirname)
+
+    return DirectoryIndex(dirname)
+
+
+def glob(dirname, pattern):
+    """
+    Returns the sorted dirname/path paths matching `pattern` (relative
+    to `dirname`, with the pathlib.Path.glob syntax). The lookups go
+    through the DirectoryIndex of `dirname`, so the listings are part
+    of the manifest of the cache file.
+    """
+
+    return [dirname / path for path in get_directory_index(dirname).glob(str(pattern))]
+
 
 class BaseStore():
     def __init__(self, *,
@@ -22,11 +84,14 @@ class BaseStore():
                  parse_always, parse_once,
                  generate_lts_payload=None, lts_payload_model=None,
                  models_kpis=None, get_kpi_labels=None,
+                 parser_version=None, manifest_hash_max_size=MANIFEST_HASH_MAX_SIZE,
+                 cache_backend="pickle",
                  ):
 
         self.cache_filename = cache_filename
         self.important_files = important_files
         self.extra_mandatory_files = extra_mandatory_files
+        self._compile_important_files()
 
         self.artifact_dirnames = artifact_dirnames
         self.artifact_paths = artifact_paths
@@ -34,6 +99,33 @@ class BaseStore():
         self.parse_always = parse_always
         self.parse_once = parse_once
 
+        # if None, computed from the sources of the store and parser modules
+        self._parser_version = parser_version
+        self.manifest_hash_max_size = manifest_hash_max_size
+
+        self.cache_backend = os.environ.get("MATBENCH_STORE_CACHE_BACKEND", cache_backend)
+        if self.cache_backend not in CACHE_BACKENDS:
+            raise ValueError(f"Invalid cache backend '{self.cache_backend}'. Expected one of {', '.join(CACHE_BACKENDS)}.")
+
+        if self.cache_backend == "columnar" and not columnar.is_available():
+            logging.warning("The columnar cache backend requires pyarrow and numpy. Using the pickle backend.")
+            self.cache_backend = "pickle"
+
+        self.columnar_cache_dirname = f"{pathlib.Path(cache_filename).stem}.columnar"
+
+        # the files read by parse_once, relative to the directory being parsed
+        self._manifest_dirname = None
+        self._manifest_files = None
+        # the directories listed by parse_once (globs), relative to the directory being parsed
+        self._manifest_listings = None
+
+        # the index of the directory being parsed, see get_directory_index
+        self._directory_index = None
+
+        # realpath(dirname) --> future of the directories parsed in the worker processes
+        self._prefetched = {}
+        self._prefetch_started = False
+
         self.lts_payload_model = lts_payload_model
         if lts_payload_model:
             self.generate_lts_payload = generate_lts_payload
@@ -48,22 +140,46 @@ class BaseStore():
             or filename.name.startswith("settings.")
         )
 
-    def is_important_file(self, filename):
-        if str(filename) in self.important_files:
-            return True
+    def _compile_important_files(self):
+        # the exact paths are looked up in a set, the globs are
+        # combined into a single regex. Mind that the globs are
+        # compiled here: `important_files` must be complete when the
+        # store is created.
+        self._important_paths = set(self.important_files)
 
-        for important_file in self.important_files:
-            if "*" not in important_file: continue
+        globs = [important_file for important_file in self.important_files if "*" in important_file]
+        self._important_globs_re = re.compile("|".join(map(fnmatch.translate, globs))) if globs else None
 
-            if fnmatch.filter([str(filename)], important_file):
-                return True
+        self._is_important_file_cache = {} # str(filename) --> bool
 
-        return False
+    def is_important_file(self, filename):
+        filename = str(filename)
+        try:
+            return self._is_important_file_cache[filename]
+        except KeyError:
+            pass
+
+        is_important = (
+            filename in self._important_paths
+            or (self._important_globs_re is not None and self._important_globs_re.match(filename) is not None)
+        )
+        self._is_important_file_cache[filename] = is_important
+
+        return is_important
 
     def is_cache_file(self, filename):
-        return filename.name == self.cache_filename
+        return filename.name == self.cache_filename or self.columnar_cache_dirname in filename.parts
+
+    def _is_cache_entry(self, name):
+        # the cache file or directory, or their temporary copies (.<name>.tmp, .<name>.old)
+        if name.startswith("."):
+            name = name[1:].rpartition(".")[0]
+
+        return name in (self.cache_filename, self.columnar_cache_dirname)
 
     def register_important_file(self, base_dirname, filename):
+        self._track_file(base_dirname, filename)
+
         to_return = base_dirname / filename
         if self.is_important_file(filename):
             return to_return
@@ -80,51 +196,423 @@ class BaseStore():
 
         return to_return
 
+    def get_directory_index(self, dirname):
+        """
+        Returns the DirectoryIndex of `dirname`, shared by all the
+        lookups done while parsing this directory.
+        """
+
+        dirname = pathlib.Path(dirname)
+        if self._directory_index is None or self._directory_index.dirname != dirname:
+            if self._directory_index is not None:
+                self._track_listings(self._directory_index)
+            self._directory_index = DirectoryIndex(dirname)
+
+        return self._directory_index
+
     def resolve_artifact_dirnames(self, dirname):
+        directory_index = self.get_directory_index(dirname)
+
         artifact_paths = types.SimpleNamespace()
         for artifact_dirname, unresolved_dirname in self.artifact_dirnames.__dict__.items():
-            direct_resolution = dirname / unresolved_dirname
-            if direct_resolution.exists():
+            if directory_index.exists(unresolved_dirname):
                 artifact_paths.__dict__[artifact_dirname] = pathlib.Path(unresolved_dirname)
                 continue
 
-            resolutions = list(dirname.glob(unresolved_dirname))
+            resolutions = directory_index.glob(unresolved_dirname) # sorted, relative to dirname
             resolved_dir = None
 
-            if direct_resolution.exists():
-                # all good
-                resolved_dir = direct_resolution
-            elif not resolutions:
+            if not resolutions:
                 logging.warning(f"Cannot resolve {artifact_dirname} glob '{unresolved_dirname}' in '{dirname}'")
             else:
                 if len(resolutions) > 1:
                     logging.debug(f"Found multiple resolutions for {artifact_dirname} glob '{unresolved_dirname}' in '{dirname}': {resolutions}. Taking the last one")
-                    resolved_dir = [r.relative_to(dirname) for r in sorted(resolutions)][-1]
-                else:
-                    resolved_dir = resolutions[0].relative_to(dirname)
+                resolved_dir = resolutions[-1]
 
             artifact_paths.__dict__[artifact_dirname] = resolved_dir
 
         self.artifact_paths.__dict__.update(artifact_paths.__dict__)
 
+    def get_parser_version(self):
+        if self._parser_version is None:
+            self._parser_version = _hash_sources([self.parse_once, self.parse_always, type(self)])
+
+        return self._parser_version
+
+    def _track_file(self, base_dirname, filename):
+        if self._manifest_files is None:
+            return
+
+        path = base_dirname / filename
+        try:
+            path = path.relative_to(self._manifest_dirname)
+        except ValueError:
+            path = path.absolute() # outside of the directory being parsed
+
+        self._manifest_files.add(str(path))
+
+    def _track_listings(self, directory_index):
+        if self._manifest_listings is None:
+            return
+
+        for relpath, names in directory_index.listings().items():
+            path = directory_index.dirname / relpath
+            try:
+                path = path.relative_to(self._manifest_dirname)
+            except ValueError:
+                path = path.absolute() # outside of the directory being parsed
+
+            self._manifest_listings[str(path)] = self._listing_signature(names)
+
+    def _listing_signature(self, names):
+        """
+        Returns a hash of the entry names of a directory (without the
+        cache entries), or None if it isn't a directory.
+        """
+
+        if names is None:
+            return None
+
+        digest = hashlib.sha256()
+        for name in sorted(names):
+            if not self._is_cache_entry(name):
+                digest.update(name.encode() + b"\0")
+
+        return digest.hexdigest()
+
+    def _is_listing_unchanged(self, path, signature):
+        try:
+            names = os.listdir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            names = None
+
+        if signature is None:
+            return names is None # wasn't a directory, must still not be one
+
+        if names is None:
+            # deleted since the parsing, as the files of the manifest
+            return True
+
+        return self._listing_signature(names) == signature
+
+    def _file_signature(self, path):
+        """
+        Returns the (size, mtime_ns, sha256) tuple of `path`,
+        (None, None, None) if it's a directory, or None if it doesn't exist.
+        The sha256 is None if the file is bigger than `manifest_hash_max_size`.
+        """
+
+        try:
+            file_stat = path.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+        if stat.S_ISDIR(file_stat.st_mode):
+            return (None, None, None)
+
+        sha256 = None
+        if file_stat.st_size <= self.manifest_hash_max_size:
+            sha256 = _sha256(path)
+
+        return (file_stat.st_size, file_stat.st_mtime_ns, sha256)
+
+    def _is_file_unchanged(self, path, signature):
+        try:
+            file_stat = path.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            file_stat = None
+
+        if signature is None:
+            return file_stat is None # was missing, must still be missing
+
+        if file_stat is None:
+            # deleted since the parsing (eg, only the cache file was
+            # downloaded). The cache is the only source left.
+            return True
+
+        size, mtime_ns, sha256 = signature
+        if size is None:
+            return stat.S_ISDIR(file_stat.st_mode)
+
+        if file_stat.st_size != size:
+            return False
+
+        if file_stat.st_mtime_ns == mtime_ns:
+            return True
+
+        # touched (eg, downloaded again), maybe not modified
+        return sha256 is not None and _sha256(path) == sha256
+
+    def _build_manifest(self, dirname, files):
+        return {filename: self._file_signature(dirname / filename) for filename in sorted(files)}
+
+    def _stale_reason(self, dirname, header):
+        if not isinstance(header, dict) or header.get("format_version") != CACHE_FORMAT_VERSION:
+            return "cache format outdated"
+
+        if header["parser_version"] != self.get_parser_version():
+            return f"parser version changed ({header['parser_version']} --> {self.get_parser_version()})"
+
+        for filename, signature in header["manifest"].items():
+            if not self._is_file_unchanged(dirname / filename, signature):
+                return f"'{filename}' changed"
+
+        for listed_dirname, signature in header["listings"].items():
+            if not self._is_listing_unchanged(dirname / listed_dirname, signature):
+                return f"the entries of '{listed_dirname}' changed"
+
+        return None
+
     def load_cache(self, dirname):
+        """
+        Returns the results saved in the cache file of `dirname`, or
+        None if the cache is stale (the parser or the files it read
+        changed since it was written).
+
+        Raises FileNotFoundError if the cache file doesn't exist.
+        """
+
+        if self.cache_backend == "columnar":
+            return self._load_columnar_cache(dirname)
+
+        # the cache file contains two pickles: the header (with the
+        # manifest), then the results. The header is validated
+        # without loading the results.
         try:
             with open(dirname / self.cache_filename, "rb") as f:
-                results = pickle.load(f)
+                header = pickle.load(f)
+                stale_reason = self._stale_reason(dirname, header)
+                results = pickle.load(f) if not stale_reason else None
+        except FileNotFoundError:
+            raise # will be catch at higher levels
+        except Exception as e:
+            logging.warning(f"Could not reload the cache file of '{dirname}', ignoring it: {e}")
+            return None
+
+        if stale_reason:
+            logging.info(f"Cache file of '{dirname}' is stale: {stale_reason}. Parsing the artifacts.")
+            return None
+
+        self._prepare_after_pickle(results)
+        self.prepare_after_pickle(results)
+
+        return results
+
+    def _load_columnar_cache(self, dirname):
+        cache_dir = dirname / self.columnar_cache_dirname
+        try:
+            header = columnar.load_header(cache_dir)
         except FileNotFoundError:
             raise # will be catch at higher levels
         except Exception as e:
-            logging.error("Could not reload the cache file: {e}")
-            raise e
+            logging.warning(f"Could not reload the cache directory of '{dirname}', ignoring it: {e}")
+            return None
+
+        stale_reason = self._stale_reason(dirname, header)
+        if stale_reason:
+            logging.info(f"Cache directory of '{dirname}' is stale: {stale_reason}. Parsing the artifacts.")
+            return None
+
+        # lazy: the attributes are decoded when first accessed (see
+        # columnar.LazyResults.load_all)
+        results = columnar.load(cache_dir, header)
 
         self._prepare_after_pickle(results)
         self.prepare_after_pickle(results)
 
         return results
 
+    def _load_cache_header(self, dirname):
+        if self.cache_backend == "columnar":
+            return columnar.load_header(dirname / self.columnar_cache_dirname)
+
+        with open(dirname / self.cache_filename, "rb") as f:
+            return pickle.load(f)
+
+    def is_cache_valid(self, dirname):
+        try:
+            header = self._load_cache_header(dirname)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.warning(f"Could not reload the cache file of '{dirname}', ignoring it: {e}")
+            return False
+
+        stale_reason = self._stale_reason(dirname, header)
+        if stale_reason:
+            logging.info(f"Cache file of '{dirname}' is stale: {stale_reason}. Parsing the artifacts.")
+            return False
+
+        return True
+
+    def save_cache(self, dirname, results, files, listings=None):
+        header = dict(
+            format_version=CACHE_FORMAT_VERSION,
+            parser_version=self.get_parser_version(),
+            manifest=self._build_manifest(dirname, files),
+            listings=dict(sorted((listings or {}).items())),
+        )
+
+        self.prepare_for_pickle(results)
+        self._prepare_for_pickle(results)
+        try:
+            if self.cache_backend == "columnar":
+                columnar.save(dirname / self.columnar_cache_dirname, header, results)
+            else:
+                self._save_pickle_cache(dirname, header, results)
+        finally:
+            self._prepare_after_pickle(results)
+            self.prepare_after_pickle(results)
+
+    def _save_pickle_cache(self, dirname, header, results):
+        cache_file = dirname / self.cache_filename
+        tmp_cache_file = cache_file.with_name(f".{cache_file.name}.tmp")
+
+        with open(tmp_cache_file, "wb") as f:
+            pickle.dump(header, f)
+            pickle.dump(results, f)
+
+        # the cache file is never seen half-written
+        os.replace(tmp_cache_file, cache_file)
+
+
+    def find_test_directories(self, results_dirname):
+        """
+        Returns the test directories of `results_dirname`, as the
+        `simple` store finds them: the directories with an `exit_code`
+        and a `settings` file, and without a `skip` file.
+        """
+
+        test_directories = []
+        for this_dir, dirnames, filenames in os.walk(results_dirname, followlinks=True):
+            dirnames.sort()
+
+            if "exit_code" not in filenames or "skip" in filenames:
+                continue
+
+            if not any(filename == "settings" or filename.startswith("settings.") for filename in filenames):
+                continue
+
+            test_directories.append(pathlib.Path(this_dir))
+            dirnames[:] = [] # no nested test directory
+
+        return test_directories
+
+    def prefetch(self, dirnames):
+        """
+        Starts parsing the `dirnames` directories in worker processes.
+
+        parse_directory then takes the results of these directories
+        from the workers, and only runs parse_always and parse_lts.
+        The results are added to the matrix in the order of the
+        parse_directory calls.
+
+        The number of processes is set by the
+        MATBENCH_STORE_PARSE_PROCESSES environment variable (default:
+        the number of CPUs). 1 disables the parallel parsing.
+        """
+
+        global _prefetching_store
+
+        self._prefetch_started = True
+
+        dirnames = [dirname for dirname in dirnames if os.path.realpath(dirname) not in self._prefetched]
+        processes = min(_parse_processes(), len(dirnames))
+        if processes <= 1:
+            return
+
+        if "fork" not in multiprocessing.get_all_start_methods():
+            logging.info("The 'fork' start method isn't available, parsing the directories sequentially.")
+            return
+
+        logging.info(f"Parsing {len(dirnames)} directories with {processes} processes ...")
+
+        # the worker processes inherit the store (and the parser modules) when forked
+        _prefetching_store = self
+        executor = concurrent.futures.ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork"))
+        ignore_cache = _ignore_cache()
+        for dirname in dirnames:
+            self._prefetched[os.path.realpath(dirname)] = executor.submit(_prefetch_directory, dirname, ignore_cache)
+
+        executor.shutdown(wait=False) # the submitted directories are still parsed
+
+    def _discover_and_prefetch(self):
+        self._prefetch_started = True
+
+        results_dirname = cli_args.kwargs.get("results_dirname")
+        if not results_dirname:
+            return
+
+        self.prefetch(self.find_test_directories(pathlib.Path(results_dirname)))
+
+    def _parse_cold(self, dirname, ignore_cache):
+        """
+        Runs in the worker processes. Returns None if the cache file
+        of `dirname` is valid, otherwise parses the directory, saves
+        its cache file and returns the results, ready to be pickled.
+        """
+
+        if not ignore_cache and self.is_cache_valid(dirname):
+            return None
+
+        # this process has its own copy of artifact_paths
+        self.resolve_artifact_dirnames(dirname)
+
+        import_settings = None
+        if self._parse_once_takes_settings():
+            import_settings = store_simple.parse_settings(dirname)
+
+        results = types.SimpleNamespace()
+        files, listings = self._parse_once_tracked(results, dirname, import_settings)
+
+        self.save_cache(dirname, results, files, listings)
+
+        self.prepare_for_pickle(results)
+        self._prepare_for_pickle(results)
+
+        return results
+
+    def _get_prefetched(self, dirname):
+        """
+        Returns the results of `dirname` parsed by a worker process, or
+        None if it wasn't parsed there (not prefetched, cache file
+        valid, or parsing failed).
+        """
+
+        future = self._prefetched.pop(os.path.realpath(dirname), None)
+        if future is None:
+            return None
+
+        try:
+            results = future.result()
+        except Exception as e:
+            logging.warning(f"Parallel parsing of '{dirname}' failed ({e.__class__.__name__}: {e}). Parsing it again.")
+            return None
+
+        if results is None:
+            return None
+
+        self._prepare_after_pickle(results)
+        self.prepare_after_pickle(results)
+
+        return results
 
     def parse_directory(self, fn_add_to_matrix, dirname, import_settings, exit_code):
-        ignore_cache = os.environ.get("MATBENCH_STORE_IGNORE_CACHE", False) in ("yes", "y", "true", "True")
+        if not self._prefetch_started:
+            self._discover_and_prefetch()
+
+        results = self._get_prefetched(dirname)
+        if results:
+            # parsed by a worker process, which saved the cache file
+            self.parse_always(results, dirname, import_settings)
+            self.parse_lts(results, import_settings, exit_code)
+
+            fn_add_to_matrix(results)
+
+            print("parsing done :)")
+            return
+
+        ignore_cache = _ignore_cache()
         if not ignore_cache:
             try:
                 results = self.load_cache(dirname)
@@ -147,27 +635,48 @@ class BaseStore():
 
         results = types.SimpleNamespace()
 
-        parse_once_kwargs = {}
-        if "import_settings" in inspect.signature(self.parse_once).parameters:
-            parse_once_kwargs["import_settings"] = import_settings
-
-        self.parse_once(results, dirname, **parse_once_kwargs)
+        files, listings = self._parse_once_tracked(results, dirname, import_settings)
         self.parse_always(results, dirname, import_settings)
         self.parse_lts(results, import_settings, exit_code)
 
         fn_add_to_matrix(results)
 
-        with open(dirname / self.cache_filename, "wb") as f:
+        self.save_cache(dirname, results, files, listings)
 
-            self.prepare_for_pickle(results)
-            self._prepare_for_pickle(results)
+        print("parsing done :)")
 
-            pickle.dump(results, f)
+    def _parse_once_takes_settings(self):
+        return "import_settings" in inspect.signature(self.parse_once).parameters
 
-            self._prepare_after_pickle(results)
-            self.prepare_after_pickle(results)
+    def _parse_once_tracked(self, results, dirname, import_settings):
+        """
+        Runs parse_once, and returns the set of files it registered,
+        and the signatures of the directories it listed through the
+        DirectoryIndex (including the artifact dirnames resolution).
+        """
 
-        print("parsing done :)")
+        global _parsing_store
+
+        parse_once_kwargs = {}
+        if self._parse_once_takes_settings():
+            parse_once_kwargs["import_settings"] = import_settings
+
+        self._manifest_dirname = dirname
+        self._manifest_files = files = set()
+        self._manifest_listings = listings = {}
+        _parsing_store = self
+        try:
+            self.parse_once(results, dirname, **parse_once_kwargs)
+            if self._directory_index is not None:
+                self._track_listings(self._directory_index)
+        finally:
+            _parsing_store = None
+            self._manifest_dirname = None
+            self._manifest_files = None
+            self._manifest_listings = None
+            self._directory_index = None
+
+        return files, listings
 
     def parse_lts(self, results, import_settings, exit_code):
         if not self.lts_payload_model:
@@ -248,21 +757,68 @@ class BaseStore():
             yield lts_payload, lts_payload.metadata.start, lts_payload.metadata.end
 
 
+def _ignore_cache():
+    return os.environ.get("MATBENCH_STORE_IGNORE_CACHE", False) in ("yes", "y", "true", "True")
+
+
+def _parse_processes():
+    try:
+        return int(os.environ.get("MATBENCH_STORE_PARSE_PROCESSES", os.cpu_count() or 1))
+    except ValueError:
+        logging.warning("Invalid MATBENCH_STORE_PARSE_PROCESSES value, parsing the directories sequentially.")
+        return 1
+
+
+def _prefetch_directory(dirname, ignore_cache):
+    return _prefetching_store._parse_cold(dirname, ignore_cache)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _hash_sources(objs):
+    """
+    Returns a hash of the Python files of the packages defining `objs`
+    and of this package, so that the cache files are invalidated when
+    the parsers code changes.
+    """
+
+    dirnames = {pathlib.Path(__file__).parent}
+    for obj in objs:
+        try:
+            dirnames.add(pathlib.Path(inspect.getsourcefile(obj)).parent)
+        except TypeError:
+            pass # not defined in a Python file
+
+    digest = hashlib.sha256()
+    for dirname in sorted(dirnames):
+        for source_file in sorted(dirname.glob("*.py")):
+            digest.update(str(source_file.name).encode())
+            digest.update(source_file.read_bytes())
+
+    return digest.hexdigest()[:16]
+
+
 class _yaml_file_get():
     def __init__(self, filename, yaml_file):
         self.yaml_file = yaml_file
 
     def get(self, key, missing=...):
-        jsonpath_expression = jsonpath_ng.parse(f'$.{key}')
-
-        match = jsonpath_expression.find(self.yaml_file)
-        if not match:
-            if missing != ...:
-                return missing
+        try:
+            return jsonpath_lib.get(self.yaml_file, f'$.{key}')
+        except IndexError:
+            pass
 
-            raise KeyError(f"Key '{key}' not found in {self.yaml_file} ...")
+        if missing != ...:
+            return missing
 
-        return match[0].value
+        raise KeyError(f"Key '{key}' not found in {self.yaml_file} ...")
 
 def get_yaml_get_key(filename, yaml_file):
 
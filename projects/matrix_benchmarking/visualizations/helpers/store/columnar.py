@@ -0,0 +1,364 @@
+import types
+import os
+import pathlib
+import pickle
+import json
+import shutil
+import collections.abc
+
+try:
+    import numpy
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    numpy = None
+    pyarrow = None
+
+###
+# Columnar backend of the BaseStore cache files.
+#
+# The results tree is stored in a directory:
+# - header.json: the cache header (format and parser versions, manifest)
+#   and the list of the top-level attributes of the results,
+# - results.parquet: one row per node of the results tree, with one
+#   row group per top-level attribute, so that each attribute can be
+#   loaded independently. The scalars are stored as JSON, the other
+#   leaves are pickled,
+# - series_keys.npy, series_values.npy: the timestamps and values of
+#   all the Prometheus time series, concatenated, memory-mapped when
+#   loaded.
+#
+# The results are loaded lazily: the top-level attributes are decoded
+# on first access, and the time series are only read when iterated.
+# Mind that `results.__dict__` only contains the attributes already
+# accessed (see LazyResults.load_all).
+###
+
+COLUMNAR_FORMAT_VERSION = 1
+
+HEADER_FILENAME = "header.json"
+RESULTS_FILENAME = "results.parquet"
+SERIES_KEYS_FILENAME = "series_keys.npy"
+SERIES_VALUES_FILENAME = "series_values.npy"
+
+_SCALAR_TYPES = (type(None), bool, int, float, str)
+_NUMBER_TYPES = (int, float)
+
+
+def is_available():
+    return pyarrow is not None
+
+
+def save(cache_dir, header, results):
+    """
+    Saves `header` and the `results` namespace into the `cache_dir` directory.
+    The directory is replaced atomically.
+    """
+
+    cache_dir = pathlib.Path(cache_dir)
+    tmp_dir = cache_dir.with_name(f".{cache_dir.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+
+    encoder = _Encoder()
+    attributes = []
+    with pyarrow.parquet.ParquetWriter(tmp_dir / RESULTS_FILENAME, _schema()) as writer:
+        for name, value in results.__dict__.items():
+            rows = encoder.encode(name, value)
+            attributes.append(name)
+            # one row group per attribute, skipped when loading the other attributes
+            writer.write_table(pyarrow.Table.from_pylist(rows, schema=_schema()))
+
+    has_series = bool(encoder.series_keys)
+    if has_series:
+        numpy.save(tmp_dir / SERIES_KEYS_FILENAME, numpy.concatenate(encoder.series_keys))
+        numpy.save(tmp_dir / SERIES_VALUES_FILENAME, numpy.concatenate(encoder.series_values))
+
+    with open(tmp_dir / HEADER_FILENAME, "w") as f:
+        json.dump(header | dict(columnar_version=COLUMNAR_FORMAT_VERSION,
+                                attributes=attributes,
+                                has_series=has_series), f)
+
+    old_dir = cache_dir.with_name(f".{cache_dir.name}.old")
+    if cache_dir.exists():
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(cache_dir, old_dir)
+    os.replace(tmp_dir, cache_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def load_header(cache_dir):
+    """
+    Returns the header of the `cache_dir` directory, or None if it
+    was written by another version of this backend.
+
+    Raises FileNotFoundError if the directory doesn't exist.
+    """
+
+    with open(pathlib.Path(cache_dir) / HEADER_FILENAME) as f:
+        header = json.load(f)
+
+    if header.get("columnar_version") != COLUMNAR_FORMAT_VERSION:
+        return None
+
+    return header
+
+
+def load(cache_dir, header):
+    """
+    Returns the results of the `cache_dir` directory. The attributes
+    are decoded when first accessed.
+    """
+
+    results = LazyResults()
+    results._reader = _Reader(pathlib.Path(cache_dir), header)
+
+    return results
+
+
+def _schema():
+    return pyarrow.schema(
+        [
+            ("top", pyarrow.string()),
+            ("path", pyarrow.string()), # JSON list of the attribute names, keys and indexes
+            ("kind", pyarrow.string()),
+            ("value", pyarrow.string()), # JSON value
+            ("blob", pyarrow.binary()), # pickled value
+            ("series_offset", pyarrow.int64()),
+            ("series_length", pyarrow.int64()),
+        ],
+        metadata={b"topsail.columnar_version": str(COLUMNAR_FORMAT_VERSION).encode()},
+    )
+
+
+def _is_json_scalars(values):
+    return all(type(value) in _SCALAR_TYPES for value in values)
+
+
+def _series_arrays(obj):
+    """
+    Returns the (keys, values, key_type) arrays of `obj` if it's a
+    Prometheus time series (SimpleNamespace(metric={labels}, values={ts: value})),
+    or None.
+    """
+
+    if type(obj) is not types.SimpleNamespace or obj.__dict__.keys() != {"metric", "values"}:
+        return None
+
+    if not isinstance(obj.metric, dict) or type(obj.values) is not dict:
+        return None
+
+    if not _is_json_scalars(obj.metric.keys()) or not _is_json_scalars(obj.metric.values()):
+        return None
+
+    key_types = {type(key) for key in obj.values.keys()}
+    value_types = {type(value) for value in obj.values.values()}
+    if not key_types <= {int, float} or not value_types <= {int, float}:
+        return None
+
+    key_type = "int" if key_types == {int} else "float"
+    value_type = "int" if value_types == {int} else "float"
+
+    return (numpy.fromiter(obj.values.keys(), dtype=numpy.float64, count=len(obj.values)),
+            numpy.fromiter(obj.values.values(), dtype=numpy.float64, count=len(obj.values)),
+            key_type, value_type)
+
+
+class _Encoder(object):
+    def __init__(self):
+        self.series_keys = []
+        self.series_values = []
+        self.series_offset = 0
+
+    def encode(self, name, value):
+        rows = []
+        self._encode(rows, name, [name], value)
+        return rows
+
+    def _row(self, rows, top, path, kind, value=None, blob=None, series_offset=None, series_length=None):
+        rows.append(dict(top=top, path=json.dumps(path), kind=kind, value=value, blob=blob,
+                         series_offset=series_offset, series_length=series_length))
+
+    def _encode(self, rows, top, path, value):
+        if type(value) in _SCALAR_TYPES:
+            self._row(rows, top, path, "json", value=json.dumps(value))
+            return
+
+        series = _series_arrays(value)
+        if series is not None:
+            keys, values, key_type, value_type = series
+            self._row(rows, top, path, "series",
+                      value=json.dumps(dict(metric=value.metric, key_type=key_type, value_type=value_type)),
+                      series_offset=self.series_offset, series_length=len(keys))
+            self.series_keys.append(keys)
+            self.series_values.append(values)
+            self.series_offset += len(keys)
+            return
+
+        if type(value) is list:
+            if _is_json_scalars(value):
+                self._row(rows, top, path, "json", value=json.dumps(value))
+                return
+
+            self._row(rows, top, path, "list")
+            for idx, item in enumerate(value):
+                self._encode(rows, top, path + [idx], item)
+            return
+
+        if type(value) is dict and _is_json_scalars(value.keys()):
+            if all(type(key) is str for key in value.keys()) and _is_json_scalars(value.values()):
+                self._row(rows, top, path, "json", value=json.dumps(value))
+                return
+
+            self._row(rows, top, path, "dict")
+            for key, item in value.items():
+                self._encode(rows, top, path + [key], item)
+            return
+
+        if type(value) is types.SimpleNamespace:
+            self._row(rows, top, path, "namespace")
+            for key, item in value.__dict__.items():
+                self._encode(rows, top, path + [key], item)
+            return
+
+        self._row(rows, top, path, "pickle", blob=pickle.dumps(value))
+
+
+class _Reader(object):
+    def __init__(self, cache_dir, header):
+        self.cache_dir = cache_dir
+        self.attributes = set(header["attributes"])
+        self.has_series = header["has_series"]
+        self._series = None
+
+    def series_arrays(self):
+        if self._series is None:
+            self._series = (numpy.load(self.cache_dir / SERIES_KEYS_FILENAME, mmap_mode="r"),
+                            numpy.load(self.cache_dir / SERIES_VALUES_FILENAME, mmap_mode="r"))
+
+        return self._series
+
+    def decode(self, name):
+        table = pyarrow.parquet.read_table(self.cache_dir / RESULTS_FILENAME,
+                                           filters=[("top", "==", name)], memory_map=True)
+
+        nodes = {}
+        for row in table.to_pylist():
+            path = tuple(json.loads(row["path"]))
+            value = self._decode_node(row)
+            nodes[path] = value
+
+            if len(path) == 1:
+                continue
+
+            parent = nodes[path[:-1]]
+            if type(parent) is types.SimpleNamespace:
+                setattr(parent, path[-1], value)
+            elif type(parent) is list:
+                parent.append(value)
+            else:
+                parent[path[-1]] = value
+
+        return nodes[(name,)]
+
+    def _decode_node(self, row):
+        kind = row["kind"]
+        if kind == "json":
+            return json.loads(row["value"])
+        if kind == "list":
+            return []
+        if kind == "dict":
+            return {}
+        if kind == "namespace":
+            return types.SimpleNamespace()
+        if kind == "series":
+            properties = json.loads(row["value"])
+            return types.SimpleNamespace(
+                metric=properties["metric"],
+                values=SeriesValues(self, row["series_offset"], row["series_length"],
+                                    properties["key_type"], properties["value_type"]),
+            )
+        if kind == "pickle":
+            return pickle.loads(row["blob"])
+
+        raise ValueError(f"Unknown node kind '{kind}' in {self.cache_dir}")
+
+
+class SeriesValues(collections.abc.Mapping):
+    """
+    Read-only {timestamp: value} mapping of a time series, backed by
+    the memory-mapped arrays of the cache directory.
+    """
+
+    def __init__(self, reader, offset, length, key_type, value_type):
+        self._reader = reader
+        self._offset = offset
+        self._length = length
+        self._key_type = int if key_type == "int" else float
+        self._value_type = int if value_type == "int" else float
+        self._dict = None
+
+    def _arrays(self):
+        keys, values = self._reader.series_arrays()
+        end = self._offset + self._length
+        return keys[self._offset:end], values[self._offset:end]
+
+    def _as_dict(self):
+        if self._dict is None:
+            self._dict = dict(self.items())
+        return self._dict
+
+    def __getitem__(self, key):
+        return self._as_dict()[key]
+
+    def __iter__(self):
+        keys, _ = self._arrays()
+        return iter(map(self._key_type, keys.tolist()))
+
+    def __len__(self):
+        return self._length
+
+    def items(self):
+        keys, values = self._arrays()
+        return list(zip(map(self._key_type, keys.tolist()), map(self._value_type, values.tolist())))
+
+    def values(self):
+        _, values = self._arrays()
+        return list(map(self._value_type, values.tolist()))
+
+    def __reduce__(self):
+        return (dict, (self.items(),))
+
+
+class LazyResults(types.SimpleNamespace):
+    """
+    Results namespace which attributes are decoded from the cache
+    directory when first accessed. Mind that `__dict__` only contains
+    the attributes already accessed; the code reading the results
+    through `__dict__` must call `load_all()` first.
+    """
+
+    __slots__ = ("_reader",)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        reader = object.__getattribute__(self, "_reader")
+        if name not in reader.attributes:
+            raise AttributeError(f"'{name}' not found in the results")
+
+        value = reader.decode(name)
+        setattr(self, name, value)
+
+        return value
+
+    def load_all(self):
+        for name in self._reader.attributes - self.__dict__.keys():
+            getattr(self, name)
+
+        return self
+
+    def __reduce__(self):
+        self.load_all()
+        return (types.SimpleNamespace, (), dict(self.__dict__))
@@ -0,0 +1,178 @@
+import os
+import pathlib
+import fnmatch
+import re
+
+###
+# Index of the entries of a result directory.
+#
+# Each directory is listed with `os.scandir` at most once, when it is
+# first looked up, and the glob patterns, existence, type and size
+# lookups are resolved against these listings. On network filesystems
+# and big artifact trees, this avoids listing the same directories
+# again and again (one `glob` per artifact directory, then in each
+# parser).
+#
+# Mind that the listings are not refreshed: the entries created after
+# a directory has been listed are not seen, unless `invalidate()` is
+# called.
+###
+
+_PATTERN_CHARS = ("*", "?", "[")
+
+
+def _is_pattern(part):
+    return any(char in part for char in _PATTERN_CHARS)
+
+
+class DirectoryIndex(object):
+    def __init__(self, dirname):
+        self.dirname = pathlib.Path(dirname)
+        self._listings = {} # relative directory parts --> {name: os.DirEntry}, or None if not a directory
+
+    def invalidate(self):
+        self._listings = {}
+
+    def listings(self):
+        """
+        Returns the {relative path: sorted entry names, or None if not a
+        directory} of the directories listed so far.
+        """
+
+        return {pathlib.Path(*parts): (sorted(listing) if listing is not None else None)
+                for parts, listing in self._listings.items()}
+
+    def _listing(self, parts):
+        try:
+            return self._listings[parts]
+        except KeyError:
+            pass
+
+        try:
+            with os.scandir(self.dirname.joinpath(*parts)) as entries:
+                listing = {entry.name: entry for entry in entries}
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            listing = None
+
+        self._listings[parts] = listing
+
+        return listing
+
+    def _parts(self, relpath):
+        """
+        Returns the parts of `relpath`, or None if it can't be looked up
+        in the index (absolute path, or containing `..`).
+        """
+
+        relpath = pathlib.PurePath(relpath)
+        if relpath.is_absolute() or ".." in relpath.parts:
+            return None
+
+        return relpath.parts
+
+    def _entry(self, parts):
+        listing = self._listing(parts[:-1])
+        if listing is None:
+            return None
+
+        return listing.get(parts[-1])
+
+    def exists(self, relpath):
+        parts = self._parts(relpath)
+        if parts is None:
+            return (self.dirname / relpath).exists()
+
+        if not parts:
+            return self._listing(()) is not None
+
+        entry = self._entry(parts)
+        return entry is not None and (not entry.is_symlink() or os.path.exists(entry.path))
+
+    def is_dir(self, relpath):
+        parts = self._parts(relpath)
+        if parts is None:
+            return (self.dirname / relpath).is_dir()
+
+        if not parts:
+            return self._listing(()) is not None
+
+        entry = self._entry(parts)
+        return entry is not None and entry.is_dir()
+
+    def is_file(self, relpath):
+        parts = self._parts(relpath)
+        if parts is None:
+            return (self.dirname / relpath).is_file()
+
+        entry = self._entry(parts) if parts else None
+        return entry is not None and entry.is_file()
+
+    def size(self, relpath):
+        """
+        Returns the size of `relpath`. Raises FileNotFoundError if it doesn't exist.
+        """
+
+        parts = self._parts(relpath)
+        entry = self._entry(parts) if parts else None
+        if entry is None:
+            return (self.dirname / relpath).stat().st_size
+
+        return entry.stat().st_size
+
+    def listdir(self, relpath="."):
+        """
+        Returns the sorted names of the entries of `relpath`, or an
+        empty list if it isn't a directory.
+        """
+
+        parts = self._parts(relpath)
+        if parts is None:
+            raise ValueError(f"Cannot list '{relpath}': not relative to {self.dirname}")
+
+        return sorted(self._listing(parts) or {})
+
+    def _subdirectories(self, parts):
+        # the symlinks to directories aren't followed, to avoid loops (like pathlib `**`)
+        subdirectories = [parts]
+        for name, entry in sorted((self._listing(parts) or {}).items()):
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories += self._subdirectories(parts + (name,))
+
+        return subdirectories
+
+    def glob(self, pattern):
+        """
+        Returns the sorted list of the paths (relative to the indexed
+        directory) matching `pattern`, with the pathlib.Path.glob
+        syntax (`*`, `?`, `[...]` and `**`).
+        """
+
+        pattern_parts = self._parts(pattern)
+        if not pattern_parts:
+            raise ValueError(f"Invalid glob pattern '{pattern}': must be relative to {self.dirname}")
+
+        candidates = [()]
+        for idx, part in enumerate(pattern_parts):
+            is_last = idx == len(pattern_parts) - 1
+            matches = []
+
+            if part == "**":
+                for candidate in candidates:
+                    matches += self._subdirectories(candidate)
+
+            elif _is_pattern(part):
+                part_re = re.compile(fnmatch.translate(part))
+                for candidate in candidates:
+                    for name, entry in (self._listing(candidate) or {}).items():
+                        if part_re.match(name) and (is_last or entry.is_dir()):
+                            matches.append(candidate + (name,))
+
+            else:
+                for candidate in candidates:
+                    entry = self._entry(candidate + (part,))
+                    if entry is not None and (is_last or entry.is_dir()):
+                        matches.append(candidate + (part,))
+
+            candidates = matches
+
+        return sorted(pathlib.Path(*parts) for parts in dict.fromkeys(candidates))
@@ -9,18 +9,18 @@ import os
 from functools import reduce
 import urllib
 
-import matrix_benchmarking.store.prom_db as store_prom_db
 import matrix_benchmarking.cli_args as cli_args
 
 import projects.matrix_benchmarking.visualizations.helpers.store as helpers_store
 from . import k8s_quantity
+from . import prom_tsdb
 
 K8S_TIME_FMT = "%Y-%m-%dT%H:%M:%SZ"
 K8S_TIME_MILLI_FMT = "%Y-%m-%dT%H:%M:%S.%fZ"
 SHELL_DATE_TIME_FMT = "%a %b %d %H:%M:%S %Z %Y"
 ANSIBLE_LOG_DATE_TIME_FMT = "%Y-%m-%d %H:%M:%S"
 
-register_important_file = lambda dirname, filename: dirname/filename
+register_important_file = lambda dirname, filename: helpers_store.track_file(dirname, filename)
 
 def ignore_file_not_found(fn):
     def decorator(*args, **kwargs):
@@ -66,7 +66,7 @@ def parse_env(dirname, test_config, capture_state_dir):
     base_artifact_dir = "/logs/artifacts"
 
     if dirname.name == "from_url":
-        with open(dirname / "source_url") as f: # not an important file
+        with open(helpers_store.track_file(dirname, "source_url")) as f: # not an important file
             source_url = f.read().strip()
         _prefix, _, from_env.test.test_path = source_url.partition(f"{from_env.test.run_id}/artifacts/")
         pass
@@ -182,7 +182,7 @@ def parse_env(dirname, test_config, capture_state_dir):
 
 @ignore_file_not_found
 def parse_test_uuid(dirname):
-    with open(dirname / ".uuid") as f:
+    with open(register_important_file(dirname, ".uuid")) as f:
         test_uuid = f.read().strip()
 
     return uuid.UUID(test_uuid)
@@ -302,7 +302,8 @@ def parse_ocp_version(dirname, capture_state_dir):
         logging.warning("no capture_state_dir received. Cannot parse OCP version")
         return ""
 
-    ocp_version_files = list((dirname / capture_state_dir).glob("ocp_version.y*ml"))
+    directory_index = helpers_store.get_directory_index(dirname)
+    ocp_version_files = directory_index.glob(str(pathlib.Path(capture_state_dir) / "ocp_version.y*ml"))
 
     if not ocp_version_files:
         raise FileNotFoundError(f"no 'ocp_version.y*ml' in {dirname / capture_state_dir}")
@@ -341,7 +342,7 @@ def parse_local_env(dirname):
     from_local_env.is_interactive = False
 
     try:
-        with open(dirname / "source_url") as f: # not an important file
+        with open(helpers_store.track_file(dirname, "source_url")) as f: # not an important file
             from_local_env.source_url = f.read().strip()
             from_local_env.artifacts_basedir = pathlib.Path(urllib.parse.urlparse(from_local_env.source_url).path)
     except FileNotFoundError as e:
@@ -385,12 +386,12 @@ def extract_metrics(dirname, db_files):
     metrics = {}
     for name, (tarball_glob, metric) in db_files.items():
         try:
-            prom_tarball = list(dirname.glob(tarball_glob))[0]
+            prom_tarball = dirname / helpers_store.get_directory_index(dirname).glob(tarball_glob)[0]
         except IndexError:
             logging.warning(f"No {tarball_glob} in '{dirname}'.")
             continue
 
         register_important_file(dirname, prom_tarball.relative_to(dirname))
-        metrics[name] = store_prom_db.extract_metrics(prom_tarball, metric, dirname)
+        metrics[name] = prom_tsdb.extract_metrics(prom_tarball, metric, dirname)
 
     return metrics
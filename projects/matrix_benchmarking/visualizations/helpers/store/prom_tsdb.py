@@ -0,0 +1,846 @@
+import os
+import re
+import json
+import struct
+import pathlib
+import logging
+import tarfile
+import tempfile
+import shutil
+import types
+import time
+import traceback
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import snappy
+except ImportError:
+    snappy = None
+
+import matrix_benchmarking.store.prom_db as store_prom_db
+
+from . import promql
+
+###
+# Offline reader of the Prometheus database dumps.
+#
+# The `prometheus.t*` tarballs captured by `cluster_prometheus_db dump`
+# contain the whole TSDB directory of the Prometheus server:
+# - the persisted blocks (`<ULID>/meta.json`, `<ULID>/index`,
+#   `<ULID>/chunks/NNNNNN`), with the XOR-encoded samples,
+# - the write-ahead log of the head block (`wal/NNNNNNNN`, and the
+#   last `wal/checkpoint.NNNNNNNN/`), with the most recent samples.
+#
+# The tarball is read in a single pass, with streaming decompression:
+# the queries are parsed first, so that only the series they select are
+# decoded. The chunk files found before the index of their block are
+# spooled to a temporary file. The queries are then evaluated with
+# `promql.evaluate`, as a range query covering the whole database.
+#
+# The queries outside of the PromQL subset of `promql.py`, and the
+# dumps that can't be decoded (unknown format version, zstd-compressed
+# WAL) are forwarded to `matrix_benchmarking.store.prom_db`, which
+# queries them through a Prometheus server.
+#
+# The tombstones, the out-of-order samples and the native histograms
+# are ignored. The checksums aren't verified.
+###
+
+READER_ENV_KEY = "MATBENCH_STORE_PROM_READER" # "tsdb" (default) or "server"
+
+DEFAULT_STEP_SECONDS = 30
+MAX_POINTS = 11000 # same limit as the Prometheus range query API
+
+INDEX_MAGIC = 0xBAAAD700
+INDEX_FORMAT_V2 = 2
+INDEX_TOC_SIZE = 6 * 8 + 4
+
+CHUNKS_MAGIC = 0x85BD40DD
+CHUNKS_HEADER_SIZE = 8
+CHUNK_ENCODING_XOR = 1
+
+WAL_PAGE_SIZE = 32 * 1024
+WAL_RECORD_HEADER_SIZE = 7
+WAL_RECORD_PAGE_TERM, WAL_RECORD_FULL, WAL_RECORD_FIRST, WAL_RECORD_MIDDLE, WAL_RECORD_LAST = range(5)
+WAL_SNAPPY_MASK = 1 << 3
+WAL_ZSTD_MASK = 1 << 4
+
+RECORD_SERIES = 1
+RECORD_SAMPLES = 2
+
+SPOOL_MAX_MEMORY_SIZE = 64 * 1024 * 1024
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+_BLOCK_DIRNAME_RE = re.compile(r"^[0-9A-HJKMNP-TV-Z]{26}$")
+_SEGMENT_NAME_RE = re.compile(r"^\d+$")
+_CHECKPOINT_DIRNAME_RE = re.compile(r"^checkpoint\.(\d+)$")
+
+
+class TSDBFormatError(Exception):
+    pass
+
+
+def is_available():
+    return numpy is not None
+
+
+def _uvarint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _varint(data, pos):
+    value, pos = _uvarint(data, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def _read_uvarint(fileobj):
+    """
+    Returns the uvarint read from `fileobj`, and the number of bytes read.
+    """
+
+    result = 0
+    shift = 0
+    size = 0
+    while True:
+        byte = fileobj.read(1)
+        if not byte:
+            raise TSDBFormatError("Unexpected end of file")
+        size += 1
+        result |= (byte[0] & 0x7f) << shift
+        if byte[0] < 0x80:
+            return result, size
+        shift += 7
+
+
+def _string(data, pos):
+    length, pos = _uvarint(data, pos)
+    return data[pos:pos + length].decode(), pos + length
+
+
+def _snappy_decompress(data):
+    """
+    Decompresses a snappy block (the WAL records compression), with
+    python-snappy if it is installed.
+    """
+
+    if snappy is not None:
+        return snappy.uncompress(data)
+
+    length, pos = _uvarint(data, 0)
+    out = bytearray()
+    end = len(data)
+    while pos < end:
+        tag = data[pos]
+        pos += 1
+        kind = tag & 3
+
+        if kind == 0: # literal
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                size = int.from_bytes(data[pos:pos + extra], "little")
+                pos += extra
+            size += 1
+            out += data[pos:pos + size]
+            pos += size
+            continue
+
+        if kind == 1:
+            size = ((tag >> 2) & 7) + 4
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        elif kind == 2:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 2], "little")
+            pos += 2
+        else:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 4], "little")
+            pos += 4
+
+        if offset == 0 or offset > len(out):
+            raise TSDBFormatError("Invalid snappy copy offset")
+
+        start = len(out) - offset
+        if size <= offset:
+            out += out[start:start + size]
+        else: # the copy overlaps with its output
+            pattern = out[start:]
+            out += (pattern * (size // offset + 1))[:size]
+
+    if len(out) != length:
+        raise TSDBFormatError(f"Invalid snappy block length ({len(out)}, expected {length})")
+
+    return bytes(out)
+
+
+def _decode_xor_chunk(data):
+    """
+    Returns the (timestamps, value bits) lists of a XOR-encoded chunk.
+    """
+
+    count = int.from_bytes(data[0:2], "big")
+    if count == 0:
+        return [], []
+
+    stream = int.from_bytes(data[2:], "big")
+    size = (len(data) - 2) * 8
+    pos = 0
+
+    def read(nbits):
+        nonlocal pos
+        pos += nbits
+        if pos > size:
+            raise TSDBFormatError("Truncated XOR chunk")
+        return (stream >> (size - pos)) & ((1 << nbits) - 1)
+
+    def read_uvarint():
+        result = 0
+        shift = 0
+        while True:
+            byte = read(8)
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    t = read_uvarint()
+    t = (t >> 1) ^ -(t & 1)
+    value = read(64)
+    times = [t]
+    values = [value]
+
+    leading = trailing = 0
+    t_delta = 0
+    for idx in range(1, count):
+        if idx == 1:
+            t_delta = read_uvarint()
+        else:
+            prefix = 0
+            while prefix < 4 and read(1):
+                prefix += 1
+
+            if prefix == 4:
+                dod = read(64)
+                if dod >= 1 << 63:
+                    dod -= 1 << 64
+            elif prefix:
+                nbits = (0, 14, 17, 20)[prefix]
+                dod = read(nbits)
+                if dod > 1 << (nbits - 1):
+                    dod -= 1 << nbits
+            else:
+                dod = 0
+            t_delta += dod
+
+        t += t_delta
+
+        if read(1): # the value changed
+            if read(1): # new leading/trailing zeros
+                leading = read(5)
+                significant_bits = read(6) or 64
+                trailing = 64 - leading - significant_bits
+            value ^= read(64 - leading - trailing) << trailing
+
+        times.append(t)
+        values.append(value)
+
+    return times, values
+
+
+class _SelectorSet(object):
+    """
+    Matches the labels of the series against the selectors of all the queries.
+    """
+
+    def __init__(self, selectors):
+        self.selectors = selectors
+        self.by_name = {} # metric name --> the selectors with a __name__ equality matcher on this name
+        self.others = []
+        for selector in selectors:
+            name = _metric_name(selector)
+            if name is None:
+                self.others.append(selector)
+            else:
+                self.by_name.setdefault(name, []).append(selector)
+
+    def matches(self, labels):
+        for selector in self.by_name.get(labels.get("__name__"), []) + self.others:
+            if promql.matches(selector.matchers, labels):
+                return True
+
+        return False
+
+
+def _metric_name(selector):
+    for matcher in selector.matchers:
+        if matcher.name == "__name__" and matcher.op == "=" and matcher.value:
+            return matcher.value
+
+    return None
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class _BlockIndex(object):
+    """
+    Reader of the index file of a persisted block.
+    """
+
+    def __init__(self, data):
+        if len(data) < 5 + INDEX_TOC_SIZE or struct.unpack_from(">I", data, 0)[0] != INDEX_MAGIC:
+            raise TSDBFormatError("Invalid index file")
+
+        version = data[4]
+        if version != INDEX_FORMAT_V2:
+            raise TSDBFormatError(f"Unsupported index format version {version}")
+
+        self.data = data
+        (self.symbols_offset, self.series_offset, _label_indices_offset, _label_offset_table_offset,
+         _postings_offset, self.postings_table_offset) = struct.unpack_from(">6Q", data, len(data) - INDEX_TOC_SIZE)
+
+        self._symbols = None
+        self._postings_offsets = None
+
+    def symbols(self):
+        if self._symbols is None:
+            data = self.data
+            count = struct.unpack_from(">I", data, self.symbols_offset + 4)[0]
+            pos = self.symbols_offset + 8
+            symbols = []
+            for _ in range(count):
+                length, pos = _uvarint(data, pos)
+                symbols.append(data[pos:pos + length].decode())
+                pos += length
+            self._symbols = symbols
+
+        return self._symbols
+
+    def postings_offsets(self):
+        """
+        Returns the {(label name, label value): postings offset} of the
+        `__name__` label, and of the "all postings" list (("", "") key).
+        """
+
+        if self._postings_offsets is None:
+            data = self.data
+            count = struct.unpack_from(">I", data, self.postings_table_offset + 4)[0]
+            pos = self.postings_table_offset + 8
+            offsets = {}
+            for _ in range(count):
+                _, pos = _uvarint(data, pos) # number of strings of the key, always 2
+                name, pos = _string(data, pos)
+                value, pos = _string(data, pos)
+                offset, pos = _uvarint(data, pos)
+                if name > "__name__":
+                    break # the entries are sorted by label name
+                if name in ("", "__name__"):
+                    offsets[(name, value)] = offset
+
+            self._postings_offsets = offsets
+
+        return self._postings_offsets
+
+    def postings(self, offset):
+        count = struct.unpack_from(">I", self.data, offset + 4)[0]
+        return struct.unpack_from(f">{count}I", self.data, offset + 8)
+
+    def series_refs(self, selector):
+        """
+        Returns the references of the series that may match `selector`,
+        looked up with the postings of its `__name__` matchers.
+        """
+
+        postings_offsets = self.postings_offsets()
+        name_matchers = [matcher for matcher in selector.matchers if matcher.name == "__name__"]
+
+        name = _metric_name(selector)
+        if name is not None:
+            offset = postings_offsets.get(("__name__", name))
+            return self.postings(offset) if offset is not None else ()
+
+        if not name_matchers:
+            return self.postings(postings_offsets[("", "")])
+
+        refs = set()
+        for (label, value), offset in postings_offsets.items():
+            if label == "__name__" and promql.matches(name_matchers, {"__name__": value}):
+                refs.update(self.postings(offset))
+
+        return sorted(refs)
+
+    def series(self, ref):
+        """
+        Returns the labels and the [(mint, maxt, chunk ref)] of the `ref` series.
+        """
+
+        data = self.data
+        symbols = self.symbols()
+        _, pos = _uvarint(data, ref * 16) # the series are 16-byte aligned
+
+        label_count, pos = _uvarint(data, pos)
+        labels = {}
+        for _ in range(label_count):
+            name, pos = _uvarint(data, pos)
+            value, pos = _uvarint(data, pos)
+            labels[symbols[name]] = symbols[value]
+
+        chunk_count, pos = _uvarint(data, pos)
+        chunks = []
+        maxt = chunk_ref = 0
+        for idx in range(chunk_count):
+            if idx == 0:
+                mint, pos = _varint(data, pos)
+            else:
+                mint_delta, pos = _uvarint(data, pos)
+                mint = maxt + mint_delta
+            maxt_delta, pos = _uvarint(data, pos)
+            maxt = mint + maxt_delta
+            if idx == 0:
+                chunk_ref, pos = _uvarint(data, pos)
+            else:
+                ref_delta, pos = _varint(data, pos)
+                chunk_ref += ref_delta
+            chunks.append((mint, maxt, chunk_ref))
+
+        return labels, chunks
+
+
+class _Block(object):
+    def __init__(self, name):
+        self.name = name
+        self.meta = None
+        self.wanted_chunks = None # chunk file index --> {offset: series key}, once the index is known
+        self.pending_chunk_files = {} # chunk file index --> spooled chunk file, received before the index
+
+
+class _Database(object):
+    """
+    Collects the samples of the series matching `selector_set` from
+    the members of a TSDB tarball.
+    """
+
+    def __init__(self, selector_set):
+        self.selector_set = selector_set
+        self.blocks = {}
+        self.samples = {} # series key --> [(times, value bits)]
+        self.labels = {} # series key --> labels
+        self.min_time = None
+        self.max_time = None
+
+        self.wal_series = {} # WAL series ref --> labels
+        self.wal_wanted = {} # WAL series ref --> True if the series matches a selector
+        self.wal_sources = {} # ("checkpoint", N, segment) or ("segment", segment) --> (refs, times, value bits)
+        self.checkpoints = set()
+
+    def _update_time_range(self, min_time, max_time):
+        self.min_time = min_time if self.min_time is None else min(self.min_time, min_time)
+        self.max_time = max_time if self.max_time is None else max(self.max_time, max_time)
+
+    def _block(self, name):
+        if name not in self.blocks:
+            self.blocks[name] = _Block(name)
+        return self.blocks[name]
+
+    def add_member(self, parts, fileobj):
+        if _BLOCK_DIRNAME_RE.match(parts[0]):
+            block = self._block(parts[0])
+            if parts[1:] == ("meta.json",):
+                block.meta = json.load(fileobj)
+                self._update_time_range(block.meta["minTime"], block.meta["maxTime"] - 1)
+            elif parts[1:] == ("index",):
+                self._add_block_index(block, fileobj.read())
+            elif len(parts) == 3 and parts[1] == "chunks" and _SEGMENT_NAME_RE.match(parts[2]):
+                self._add_chunk_file(block, int(parts[2]) - 1, fileobj)
+            return
+
+        if parts[0] != "wal":
+            return # chunks_head (the head chunks are also in the WAL), wbl, lock files, ...
+
+        if len(parts) == 2 and _SEGMENT_NAME_RE.match(parts[1]):
+            self._add_wal_segment(("segment", int(parts[1])), fileobj.read())
+
+        elif len(parts) == 3 and _CHECKPOINT_DIRNAME_RE.match(parts[1]) and _SEGMENT_NAME_RE.match(parts[2]):
+            checkpoint = int(_CHECKPOINT_DIRNAME_RE.match(parts[1]).group(1))
+            self.checkpoints.add(checkpoint)
+            self._add_wal_segment(("checkpoint", checkpoint, int(parts[2])), fileobj.read())
+
+    def _add_block_index(self, block, data):
+        index = _BlockIndex(data)
+
+        wanted_chunks = {}
+        decoded = {} # series ref --> (labels, chunks), when selected by multiple selectors
+        for selector in self.selector_set.selectors:
+            for ref in index.series_refs(selector):
+                if ref not in decoded:
+                    decoded[ref] = index.series(ref)
+                labels, chunks = decoded[ref]
+                if not promql.matches(selector.matchers, labels):
+                    continue
+
+                key = _labels_key(labels)
+                self.labels[key] = labels
+                for _mint, _maxt, chunk_ref in chunks:
+                    wanted_chunks.setdefault(chunk_ref >> 32, {})[chunk_ref & 0xffffffff] = key
+
+        block.wanted_chunks = wanted_chunks
+
+        for file_index, spooled in block.pending_chunk_files.items():
+            with spooled:
+                spooled.seek(0)
+                self._read_chunks(block, file_index, spooled)
+        block.pending_chunk_files = {}
+
+    def _add_chunk_file(self, block, file_index, fileobj):
+        if block.wanted_chunks is not None:
+            self._read_chunks(block, file_index, fileobj)
+            return
+
+        spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_SIZE)
+        shutil.copyfileobj(fileobj, spooled, STREAM_BLOCK_SIZE)
+        block.pending_chunk_files[file_index] = spooled
+
+    def _read_chunks(self, block, file_index, fileobj):
+        wanted = block.wanted_chunks.get(file_index)
+        if not wanted:
+            return
+
+        header = fileobj.read(CHUNKS_HEADER_SIZE)
+        if len(header) < CHUNKS_HEADER_SIZE or struct.unpack_from(">I", header, 0)[0] != CHUNKS_MAGIC:
+            raise TSDBFormatError(f"Invalid chunk file {file_index + 1:06d} in block {block.name}")
+
+        position = CHUNKS_HEADER_SIZE
+        for offset in sorted(wanted):
+            # skips to the chunk, without seeking: the tarball members can only be read sequentially
+            while position < offset:
+                skipped = len(fileobj.read(min(offset - position, STREAM_BLOCK_SIZE)))
+                if not skipped:
+                    raise TSDBFormatError(f"Truncated chunk file {file_index + 1:06d} in block {block.name}")
+                position += skipped
+
+            # length <uvarint> | encoding <1b> | data | CRC32 <4b>
+            length, size = _read_uvarint(fileobj)
+            chunk = fileobj.read(1 + length + 4)
+            position += size + len(chunk)
+            if len(chunk) < 1 + length:
+                raise TSDBFormatError(f"Truncated chunk file {file_index + 1:06d} in block {block.name}")
+
+            if chunk[0] != CHUNK_ENCODING_XOR:
+                continue # native histograms
+
+            self.samples.setdefault(wanted[offset], []).append(_decode_xor_chunk(chunk[1:1 + length]))
+
+    def _add_wal_segment(self, source, data):
+        refs, times, values = array("Q"), array("q"), array("Q")
+
+        for record in _wal_records(data):
+            if not record:
+                continue
+
+            if record[0] == RECORD_SERIES:
+                self._add_wal_series(record)
+            elif record[0] == RECORD_SAMPLES and len(record) > 1:
+                self._add_wal_samples(record, refs, times, values)
+
+        self.wal_sources[source] = (refs, times, values)
+
+    def _add_wal_series(self, record):
+        pos = 1
+        while pos < len(record):
+            ref = struct.unpack_from(">Q", record, pos)[0]
+            label_count, pos = _uvarint(record, pos + 8)
+            labels = {}
+            for _ in range(label_count):
+                name, pos = _string(record, pos)
+                value, pos = _string(record, pos)
+                labels[name] = value
+
+            self.wal_series[ref] = labels
+            self.wal_wanted[ref] = self.selector_set.matches(labels)
+
+    def _add_wal_samples(self, record, refs, times, values):
+        wal_wanted = self.wal_wanted
+        base_ref, base_time = struct.unpack_from(">Qq", record, 1)
+        min_time = max_time = base_time
+
+        pos = 17
+        end = len(record)
+        while pos < end:
+            # the deltas mostly fit in one byte
+            byte = record[pos]
+            if byte < 0x80:
+                ref_delta = (byte >> 1) ^ -(byte & 1)
+                pos += 1
+            else:
+                ref_delta, pos = _varint(record, pos)
+            byte = record[pos]
+            if byte < 0x80:
+                time_delta = (byte >> 1) ^ -(byte & 1)
+                pos += 1
+            else:
+                time_delta, pos = _varint(record, pos)
+
+            t = base_time + time_delta
+            if t < min_time:
+                min_time = t
+            elif t > max_time:
+                max_time = t
+
+            ref = base_ref + ref_delta
+            # the series of a sample may not be known yet, when the tarball members aren't in order
+            if wal_wanted.get(ref, True):
+                refs.append(ref)
+                times.append(t)
+                values.append(int.from_bytes(record[pos:pos + 8], "big"))
+            pos += 8
+
+        self._update_time_range(min_time, max_time)
+
+    def finish(self):
+        for block in self.blocks.values():
+            if block.pending_chunk_files:
+                logging.warning(f"Block {block.name} has no index, ignoring it.")
+                for spooled in block.pending_chunk_files.values():
+                    spooled.close()
+
+        # the segments included in the last checkpoint may still be there
+        last_checkpoint = max(self.checkpoints, default=None)
+        for source, (refs, times, values) in sorted(self.wal_sources.items()):
+            if source[0] == "checkpoint" and source[1] != last_checkpoint:
+                continue
+            if source[0] == "segment" and last_checkpoint is not None and source[1] <= last_checkpoint:
+                continue
+
+            refs = numpy.frombuffer(refs, dtype=numpy.uint64)
+            times = numpy.frombuffer(times, dtype=numpy.int64)
+            values = numpy.frombuffer(values, dtype=numpy.uint64)
+
+            order = numpy.argsort(refs, kind="stable")
+            refs, times, values = refs[order], times[order], values[order]
+            unique_refs, starts = numpy.unique(refs, return_index=True)
+            ends = list(starts[1:]) + [len(refs)]
+            for ref, start, end in zip(unique_refs.tolist(), starts.tolist(), ends):
+                if not self.wal_wanted.get(ref):
+                    continue
+
+                labels = self.wal_series[ref]
+                key = _labels_key(labels)
+                self.labels[key] = labels
+                self.samples.setdefault(key, []).append((times[start:end], values[start:end]))
+
+        self.wal_sources = {}
+
+    def series(self):
+        """
+        Returns the {series key: (labels, times, values)} of the series
+        collected, with the samples sorted and without duplicates.
+        """
+
+        series = {}
+        for key, parts in self.samples.items():
+            times = numpy.concatenate([numpy.asarray(part_times, dtype=numpy.int64) for part_times, _ in parts])
+            values = numpy.concatenate([numpy.asarray(part_values, dtype=numpy.uint64) for _, part_values in parts])
+
+            order = numpy.argsort(times, kind="stable")
+            times, values = times[order], values[order]
+            unique = numpy.concatenate(([True], times[1:] != times[:-1]))
+
+            series[key] = (self.labels[key], times[unique], values[unique].view(numpy.float64))
+
+        return series
+
+
+def _wal_records(data):
+    """
+    Yields the records of a WAL segment, reassembled and decompressed.
+    """
+
+    pos = 0
+    end = len(data)
+    fragments = []
+    while pos + WAL_RECORD_HEADER_SIZE <= end:
+        header = data[pos]
+        record_type = header & 0x07
+
+        if record_type == WAL_RECORD_PAGE_TERM:
+            # the rest of the page is padding
+            pos = (pos // WAL_PAGE_SIZE + 1) * WAL_PAGE_SIZE
+            continue
+
+        length, = struct.unpack_from(">H", data, pos + 1)
+        pos += WAL_RECORD_HEADER_SIZE
+        if pos + length > end:
+            break # torn write at the end of the last segment
+
+        fragment = data[pos:pos + length]
+        pos += length
+
+        if record_type in (WAL_RECORD_FULL, WAL_RECORD_FIRST):
+            fragments = [fragment]
+        else:
+            fragments.append(fragment)
+
+        if record_type in (WAL_RECORD_FIRST, WAL_RECORD_MIDDLE):
+            continue
+
+        record = b"".join(fragments)
+        fragments = []
+
+        if header & WAL_ZSTD_MASK:
+            raise TSDBFormatError("zstd-compressed WAL records are not supported")
+        if header & WAL_SNAPPY_MASK:
+            record = _snappy_decompress(record)
+
+        yield record
+
+
+def _member_parts(name):
+    return tuple(part for part in pathlib.PurePosixPath(name).parts if part not in (".", "/"))
+
+
+def read_tarball(prom_tarball, selectors):
+    """
+    Reads the `prom_tarball` TSDB dump, and returns the
+    (series, min time, max time) of the series matching `selectors`.
+    `series` is the {series key: (labels, times, values)} of `_Database.series`.
+    The times are in milliseconds.
+    """
+
+    database = _Database(_SelectorSet(selectors))
+
+    with tarfile.open(prom_tarball, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+
+            parts = _member_parts(member.name)
+            if len(parts) < 2:
+                continue
+
+            database.add_member(parts, tar.extractfile(member))
+
+    database.finish()
+
+    return database.series(), database.min_time, database.max_time
+
+
+def _evaluation_timestamps(min_time, max_time):
+    """
+    Returns the timestamps (in milliseconds) where the queries are
+    evaluated: every DEFAULT_STEP_SECONDS (or more, to stay below
+    MAX_POINTS) over the time range of the database.
+    """
+
+    start = -(-min_time // 1000)
+    end = max_time // 1000
+    if end < start:
+        return numpy.array([], dtype=numpy.int64)
+
+    step = max(DEFAULT_STEP_SECONDS, -(-(end - start) // (MAX_POINTS - 1)))
+
+    return numpy.arange(start, end + 1, step, dtype=numpy.int64) * 1000
+
+
+def _queries(metrics):
+    """
+    Yields the (name, query, original entry) of the `metrics` list
+    (metric names and {name: query} dicts).
+    """
+
+    for entry in metrics:
+        if isinstance(entry, dict):
+            for name, query in entry.items():
+                yield name, query, {name: query}
+        else:
+            yield entry, entry, entry
+
+
+def _to_results(series_list, timestamps_ms):
+    timestamps = (timestamps_ms // 1000).tolist()
+
+    results = []
+    for series in series_list:
+        values = {ts: value for ts, value, present in zip(timestamps, series.values.tolist(), series.present.tolist())
+                  if present}
+        results.append(types.SimpleNamespace(metric=series.labels, values=values))
+
+    return results
+
+
+def evaluate_tarball(prom_tarball, queries):
+    """
+    Evaluates the `queries` {name: parsed query} over the `prom_tarball` TSDB dump.
+    Returns the {name: [SimpleNamespace(metric={labels}, values={ts: value})]} results.
+    """
+
+    selectors = [selector for node in queries.values() for selector in promql.selectors(node)]
+    series, min_time, max_time = read_tarball(prom_tarball, selectors)
+
+    if min_time is None:
+        return {name: [] for name in queries}
+
+    timestamps_ms = _evaluation_timestamps(min_time, max_time)
+
+    def select(selector):
+        return [(labels, times, values) for labels, times, values in series.values()
+                if promql.matches(selector.matchers, labels)]
+
+    return {name: _to_results(promql.evaluate(node, select, timestamps_ms), timestamps_ms)
+            for name, node in queries.items()}
+
+
+def extract_metrics(prom_tarball, metrics, dirname):
+    """
+    Drop-in replacement of `matrix_benchmarking.store.prom_db.extract_metrics`:
+    evaluates the `metrics` queries directly from the `prom_tarball`
+    TSDB dump. The queries the offline reader doesn't support are
+    forwarded to a Prometheus server with `store_prom_db`.
+    """
+
+    if os.environ.get(READER_ENV_KEY, "tsdb") == "server" or not is_available():
+        return store_prom_db.extract_metrics(prom_tarball, metrics, dirname)
+
+    supported = {}
+    unsupported = []
+    for name, query, entry in _queries(metrics):
+        try:
+            supported[name] = promql.parse(query)
+        except promql.UnsupportedQuery as e:
+            logging.warning(f"{prom_tarball.name}: query '{name}' not supported by the offline reader ({e}), "
+                            "extracting it through a Prometheus server.")
+            unsupported.append(entry)
+
+    results = {}
+    if supported:
+        start = time.time()
+        try:
+            results = evaluate_tarball(prom_tarball, supported)
+            logging.info(f"{prom_tarball.name}: {len(results)} metrics extracted in {time.time() - start:.1f}s"
+                         f" ({len(unsupported)} through a Prometheus server)")
+        except Exception as e:
+            # any failure of the offline reader falls back to the Prometheus server
+            logging.debug(traceback.format_exc())
+            logging.warning(f"{prom_tarball}: cannot read the Prometheus database ({e.__class__.__name__}: {e}), "
+                            f"extracting the {', '.join(repr(name) for name in supported)} queries through a Prometheus server.")
+            unsupported = list(metrics)
+
+    if unsupported:
+        results |= store_prom_db.extract_metrics(prom_tarball, unsupported, dirname)
+
+    # keeps the order of the `metrics` list
+    return {name: results[name] for name, _, _ in _queries(metrics) if name in results}
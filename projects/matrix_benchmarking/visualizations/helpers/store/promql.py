@@ -0,0 +1,544 @@
+import re
+import operator
+import collections
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+###
+# Evaluation of a subset of PromQL, as a range query over time series
+# loaded in memory.
+#
+# The subset covers the queries generated by `prom.py`:
+# - instant selectors, with the =, !=, =~ and !~ label matchers,
+# - `rate`, `irate` and `increase` of a range selector,
+# - the `sum`, `min`, `max`, `avg` and `count` aggregations, with
+#   `by` or `without`,
+# - the arithmetic and comparison operators between a vector and a
+#   number.
+#
+# The semantics follow the ones of Prometheus 2.x (5min lookback delta,
+# closed range selector windows, extrapolation of `rate` and
+# `increase`). Anything else (vector matching, other functions,
+# subqueries, `offset`, ...) raises UnsupportedQuery, so that the caller
+# can forward the query to a Prometheus server.
+###
+
+LOOKBACK_DELTA_MS = 5 * 60 * 1000
+
+# the value Prometheus stores to mark that a series disappeared
+STALE_NAN_BITS = 0x7ff0000000000002
+
+AGGREGATIONS = ("sum", "min", "max", "avg", "count")
+RANGE_FUNCTIONS = ("rate", "irate", "increase")
+
+_DURATION_UNITS_MS = dict(ms=1, s=1000, m=60 * 1000, h=60 * 60 * 1000, d=24 * 60 * 60 * 1000,
+                          w=7 * 24 * 60 * 60 * 1000, y=365 * 24 * 60 * 60 * 1000)
+
+_ARITHMETIC_OPERATORS = {
+    "+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv,
+    "%": lambda lhs, rhs: numpy.fmod(lhs, rhs), "^": lambda lhs, rhs: numpy.power(lhs, rhs),
+}
+_COMPARISON_OPERATORS = {
+    "==": operator.eq, "!=": operator.ne, ">": operator.gt, "<": operator.lt, ">=": operator.ge, "<=": operator.le,
+}
+
+# binary operators, by increasing precedence
+_PRECEDENCE = [("==", "!=", ">", "<", ">=", "<="), ("+", "-"), ("*", "/", "%"), ("^",)]
+
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+) |
+    (?P<duration>(?:\d+(?:ms|[smhdwy]))+) |
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?) |
+    (?P<identifier>[a-zA-Z_:][a-zA-Z0-9_:]*) |
+    (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`[^`]*`) |
+    (?P<operator>=~|!~|!=|==|>=|<=|[-+*/%^<>=(){}\[\],])
+""", re.VERBOSE)
+
+_ESCAPES = dict(n="\n", t="\t", r="\r")
+
+
+class UnsupportedQuery(ValueError):
+    pass
+
+
+Matcher = collections.namedtuple("Matcher", ["name", "op", "value", "regex"])
+
+Selector = collections.namedtuple("Selector", ["matchers"])
+RangeFunction = collections.namedtuple("RangeFunction", ["function", "selector", "range_ms"])
+Aggregation = collections.namedtuple("Aggregation", ["op", "labels", "without", "expr"])
+BinaryOperation = collections.namedtuple("BinaryOperation", ["op", "lhs", "rhs"])
+Number = collections.namedtuple("Number", ["value"])
+
+# the result of a query: `values` and `present` are arrays over the evaluation timestamps
+Series = collections.namedtuple("Series", ["labels", "values", "present"])
+
+
+def _unquote(string):
+    if string[0] == "`":
+        return string[1:-1]
+
+    return re.sub(r"\\(.)", lambda match: _ESCAPES.get(match.group(1), match.group(1)), string[1:-1])
+
+
+def _parse_duration(duration):
+    return sum(int(value) * _DURATION_UNITS_MS[unit]
+               for value, unit in re.findall(r"(\d+)(ms|[smhdwy])", duration))
+
+
+def _tokenize(query):
+    tokens = []
+    pos = 0
+    while pos < len(query):
+        match = _TOKEN_RE.match(query, pos)
+        if not match:
+            raise UnsupportedQuery(f"Unexpected character '{query[pos]}' at position {pos}")
+        pos = match.end()
+
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group()))
+
+    return tokens
+
+
+class _Parser(object):
+    def __init__(self, query):
+        self.tokens = _tokenize(query)
+        self.pos = 0
+
+    def peek(self, offset=0):
+        try:
+            return self.tokens[self.pos + offset]
+        except IndexError:
+            return (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise UnsupportedQuery("Unexpected end of query")
+        self.pos += 1
+        return token
+
+    def expect(self, value):
+        kind, token = self.next()
+        if token != value:
+            raise UnsupportedQuery(f"Expected '{value}', got '{token}'")
+
+    def accept(self, value):
+        if self.peek()[1] == value:
+            self.pos += 1
+            return True
+
+        return False
+
+    def parse(self):
+        node = self.expression()
+        if self.peek()[0] is not None:
+            raise UnsupportedQuery(f"Unexpected '{self.peek()[1]}'")
+
+        return node
+
+    def expression(self, level=0):
+        if level == len(_PRECEDENCE):
+            return self.unary()
+
+        lhs = self.expression(level + 1)
+        while self.peek()[0] == "operator" and self.peek()[1] in _PRECEDENCE[level]:
+            op = self.next()[1]
+            if self.peek()[1] in ("bool", "on", "ignoring", "group_left", "group_right"):
+                raise UnsupportedQuery(f"Unsupported binary operator modifier '{self.peek()[1]}'")
+
+            # `^` is right-associative
+            rhs = self.expression(level if op == "^" else level + 1)
+            lhs = BinaryOperation(op, lhs, rhs)
+
+        return lhs
+
+    def unary(self):
+        if self.accept("-"):
+            return BinaryOperation("*", Number(-1.0), self.unary())
+        if self.accept("+"):
+            return self.unary()
+
+        return self.primary()
+
+    def primary(self):
+        kind, token = self.peek()
+
+        if token == "(":
+            self.next()
+            node = self.expression()
+            self.expect(")")
+            return node
+
+        if kind == "number":
+            self.next()
+            return Number(float(token))
+
+        if token == "{":
+            return self.selector(None)
+
+        if kind != "identifier":
+            raise UnsupportedQuery(f"Unexpected '{token}'")
+
+        if token in AGGREGATIONS and self.peek(1)[1] in ("(", "by", "without"):
+            return self.aggregation()
+
+        if token in RANGE_FUNCTIONS and self.peek(1)[1] == "(":
+            return self.range_function()
+
+        if self.peek(1)[1] == "(":
+            raise UnsupportedQuery(f"Unsupported function '{token}'")
+
+        self.next()
+        return self.selector(token)
+
+    def grouping(self):
+        kind, without = self.next()
+        self.expect("(")
+        labels = []
+        while not self.accept(")"):
+            kind, label = self.next()
+            if kind != "identifier":
+                raise UnsupportedQuery(f"Invalid grouping label '{label}'")
+            labels.append(label)
+            if not self.accept(","):
+                self.expect(")")
+                break
+
+        return tuple(labels), without == "without"
+
+    def aggregation(self):
+        op = self.next()[1]
+
+        labels, without = None, False
+        if self.peek()[1] in ("by", "without"):
+            labels, without = self.grouping()
+
+        self.expect("(")
+        expr = self.expression()
+        if self.accept(","):
+            raise UnsupportedQuery(f"Unexpected parameter of '{op}'")
+        self.expect(")")
+
+        if labels is None and self.peek()[1] in ("by", "without"):
+            labels, without = self.grouping()
+
+        return Aggregation(op, labels, without, expr)
+
+    def range_function(self):
+        function = self.next()[1]
+        self.expect("(")
+
+        kind, token = self.next()
+        if kind == "identifier":
+            selector = self.selector(token, range_allowed=True)
+        elif token == "{":
+            self.pos -= 1
+            selector = self.selector(None, range_allowed=True)
+        else:
+            raise UnsupportedQuery(f"'{function}' expects a range selector")
+
+        if not isinstance(selector, RangeFunction):
+            raise UnsupportedQuery(f"'{function}' expects a range selector")
+
+        self.expect(")")
+
+        return selector._replace(function=function)
+
+    def selector(self, name, range_allowed=False):
+        matchers = []
+        if name is not None:
+            matchers.append(_matcher("__name__", "=", name))
+
+        if self.accept("{"):
+            while not self.accept("}"):
+                kind, label = self.next()
+                if kind != "identifier":
+                    raise UnsupportedQuery(f"Invalid label name '{label}'")
+                op = self.next()[1]
+                if op not in ("=", "!=", "=~", "!~"):
+                    raise UnsupportedQuery(f"Invalid label matcher '{op}'")
+                kind, value = self.next()
+                if kind != "string":
+                    raise UnsupportedQuery(f"Invalid label value '{value}'")
+                matchers.append(_matcher(label, op, _unquote(value)))
+                if not self.accept(","):
+                    self.expect("}")
+                    break
+
+        if not matchers:
+            raise UnsupportedQuery("Empty selector")
+
+        selector = Selector(tuple(matchers))
+
+        if self.accept("["):
+            kind, duration = self.next()
+            if kind != "duration":
+                raise UnsupportedQuery(f"Invalid range '{duration}'")
+            self.expect("]")
+            if not range_allowed:
+                raise UnsupportedQuery("Range selectors are only supported in rate, irate and increase")
+            selector = RangeFunction(None, selector, _parse_duration(duration))
+
+        if self.peek()[1] in ("offset", "@", "["):
+            raise UnsupportedQuery(f"Unsupported selector modifier '{self.peek()[1]}'")
+
+        return selector
+
+
+def _matcher(name, op, value):
+    regex = re.compile(f"(?:{value})\\Z", re.DOTALL) if op in ("=~", "!~") else None
+
+    return Matcher(name, op, value, regex)
+
+
+def parse(query):
+    """
+    Parses `query` into a tree of Selector, RangeFunction, Aggregation,
+    BinaryOperation and Number tuples.
+
+    Raises UnsupportedQuery if the query is invalid or outside of the
+    supported subset.
+    """
+
+    node = _Parser(query).parse()
+    if _is_scalar(node):
+        raise UnsupportedQuery("Scalar queries are not supported")
+
+    return node
+
+
+def _is_scalar(node):
+    """
+    Tells if `node` evaluates to a scalar. Raises UnsupportedQuery if
+    its operands are of unsupported types.
+    """
+
+    if isinstance(node, Number):
+        return True
+
+    if isinstance(node, Aggregation):
+        if _is_scalar(node.expr):
+            raise UnsupportedQuery(f"Cannot aggregate a scalar with '{node.op}'")
+        return False
+
+    if isinstance(node, BinaryOperation):
+        lhs_scalar, rhs_scalar = _is_scalar(node.lhs), _is_scalar(node.rhs)
+        if lhs_scalar and rhs_scalar and node.op in _COMPARISON_OPERATORS:
+            raise UnsupportedQuery("Comparisons between scalars need the 'bool' modifier")
+        if not lhs_scalar and not rhs_scalar:
+            raise UnsupportedQuery(f"Unsupported binary operation '{node.op}' between two vectors")
+        return lhs_scalar and rhs_scalar
+
+    return False
+
+
+def selectors(node):
+    """
+    Returns the list of the Selectors of the `node` query.
+    """
+
+    if isinstance(node, Selector):
+        return [node]
+    if isinstance(node, RangeFunction):
+        return [node.selector]
+    if isinstance(node, Aggregation):
+        return selectors(node.expr)
+    if isinstance(node, BinaryOperation):
+        return selectors(node.lhs) + selectors(node.rhs)
+
+    return []
+
+
+def matches(matchers, labels):
+    """
+    Tells if the `labels` dict matches all the `matchers`. A missing label is an empty value.
+    """
+
+    for matcher in matchers:
+        value = labels.get(matcher.name, "")
+        if matcher.op == "=":
+            ok = value == matcher.value
+        elif matcher.op == "!=":
+            ok = value != matcher.value
+        elif matcher.op == "=~":
+            ok = matcher.regex.match(value) is not None
+        else:
+            ok = matcher.regex.match(value) is None
+
+        if not ok:
+            return False
+
+    return True
+
+
+def evaluate(node, select, timestamps_ms):
+    """
+    Evaluates the `node` query at each of the `timestamps_ms`.
+
+    `select(selector)` must return the list of the (labels, times_ms,
+    values) of the series matching `selector`, with the times sorted,
+    without duplicates, and the values as float64 arrays (including the
+    stale markers).
+
+    Returns the list of the Series with at least one value, sorted by labels.
+    """
+
+    timestamps_ms = numpy.asarray(timestamps_ms, dtype=numpy.int64)
+
+    with numpy.errstate(all="ignore"):
+        result = _Evaluator(select, timestamps_ms).evaluate(node)
+
+    if isinstance(result, float):
+        result = [Series({}, numpy.full(len(timestamps_ms), result), numpy.ones(len(timestamps_ms), dtype=bool))]
+
+    return sorted((series for series in result if series.present.any()),
+                  key=lambda series: sorted(series.labels.items()))
+
+
+def _drop_name(labels):
+    return {key: value for key, value in labels.items() if key != "__name__"}
+
+
+class _Evaluator(object):
+    def __init__(self, select, timestamps_ms):
+        self.select = select
+        self.timestamps_ms = timestamps_ms
+
+    def evaluate(self, node):
+        if isinstance(node, Number):
+            return node.value
+        if isinstance(node, Selector):
+            return [self.instant(labels, times, values) for labels, times, values in self.select(node)]
+        if isinstance(node, RangeFunction):
+            return [self.range_function(node, labels, times, values) for labels, times, values in self.select(node.selector)]
+        if isinstance(node, Aggregation):
+            return self.aggregation(node, self.evaluate(node.expr))
+        if isinstance(node, BinaryOperation):
+            return self.binary_operation(node.op, self.evaluate(node.lhs), self.evaluate(node.rhs))
+
+        raise ValueError(f"Cannot evaluate {node}")
+
+    def instant(self, labels, times, values):
+        # the last sample of the lookback window, if it isn't a stale marker
+        stale = values.view(numpy.uint64) == STALE_NAN_BITS
+        idx = numpy.searchsorted(times, self.timestamps_ms, side="right") - 1
+        found = idx >= 0
+        idx = numpy.maximum(idx, 0)
+
+        present = found & (times[idx] >= self.timestamps_ms - LOOKBACK_DELTA_MS) & ~stale[idx]
+
+        return Series(labels, numpy.where(present, values[idx], numpy.nan), present)
+
+    def range_function(self, node, labels, times, values):
+        not_stale = values.view(numpy.uint64) != STALE_NAN_BITS
+        times, values = times[not_stale], values[not_stale]
+
+        range_start = self.timestamps_ms - node.range_ms
+        range_end = self.timestamps_ms
+        first = numpy.searchsorted(times, range_start, side="left")
+        end = numpy.searchsorted(times, range_end, side="right")
+        count = end - first
+
+        if not len(times):
+            return Series(_drop_name(labels), numpy.full(len(self.timestamps_ms), numpy.nan), count > 1)
+
+        last = numpy.clip(end - 1, 0, len(times) - 1)
+        first = numpy.minimum(first, len(times) - 1)
+
+        if node.function == "irate":
+            previous = numpy.maximum(last - 1, 0)
+            delta = numpy.where(values[last] < values[previous], values[last], values[last] - values[previous])
+            interval = times[last] - times[previous]
+            present = (count > 1) & (interval > 0)
+            return Series(_drop_name(labels), delta / (interval / 1000), present)
+
+        # the counter resets are compensated with the cumulative sum of the values before the resets
+        resets = numpy.where(values[1:] < values[:-1], values[:-1], 0.0)
+        corrections = numpy.concatenate(([0.0], numpy.cumsum(resets)))
+
+        first_value = values[first]
+        result = values[last] - first_value + corrections[last] - corrections[first]
+
+        duration_to_start = (times[first] - range_start) / 1000
+        duration_to_end = (range_end - times[last]) / 1000
+        sampled_interval = (times[last] - times[first]) / 1000
+        average_duration_between_samples = sampled_interval / (count - 1)
+
+        # a counter can't be extrapolated below zero
+        duration_to_zero = sampled_interval * (first_value / result)
+        duration_to_start = numpy.where((result > 0) & (first_value >= 0) & (duration_to_zero < duration_to_start),
+                                        duration_to_zero, duration_to_start)
+
+        extrapolation_threshold = average_duration_between_samples * 1.1
+        extrapolate_to_interval = (
+            sampled_interval
+            + numpy.where(duration_to_start < extrapolation_threshold, duration_to_start, average_duration_between_samples / 2)
+            + numpy.where(duration_to_end < extrapolation_threshold, duration_to_end, average_duration_between_samples / 2)
+        )
+
+        result = result * (extrapolate_to_interval / sampled_interval)
+        if node.function == "rate":
+            result = result / (node.range_ms / 1000)
+
+        return Series(_drop_name(labels), result, count > 1)
+
+    def aggregation(self, node, vector):
+        groups = {}
+        for series in vector:
+            if node.labels is None:
+                group_labels = {}
+            elif node.without:
+                group_labels = {key: value for key, value in series.labels.items()
+                                if key not in node.labels and key != "__name__"}
+            else:
+                group_labels = {key: value for key, value in series.labels.items() if key in node.labels}
+
+            groups.setdefault(tuple(sorted(group_labels.items())), []).append(series)
+
+        result = []
+        for key, group in groups.items():
+            values = numpy.stack([series.values for series in group])
+            present = numpy.stack([series.present for series in group])
+            count = present.sum(axis=0)
+
+            if node.op == "sum":
+                aggregated = numpy.where(present, values, 0.0).sum(axis=0)
+            elif node.op == "count":
+                aggregated = count.astype(numpy.float64)
+            elif node.op == "avg":
+                aggregated = numpy.where(present, values, 0.0).sum(axis=0) / count
+            elif node.op == "max":
+                aggregated = numpy.fmax.reduce(numpy.where(present, values, numpy.nan), axis=0)
+            else:
+                aggregated = numpy.fmin.reduce(numpy.where(present, values, numpy.nan), axis=0)
+
+            result.append(Series(dict(key), aggregated, count > 0))
+
+        return result
+
+    def binary_operation(self, op, lhs, rhs):
+        # the operand types are checked by `parse`
+        lhs_scalar, rhs_scalar = isinstance(lhs, float), isinstance(rhs, float)
+
+        if lhs_scalar and rhs_scalar:
+            return float(_ARITHMETIC_OPERATORS[op](numpy.float64(lhs), rhs))
+
+        vector, scalar = (rhs, lhs) if lhs_scalar else (lhs, rhs)
+
+        if op in _COMPARISON_OPERATORS:
+            # filters the samples, keeping the values of the vector
+            compare = _COMPARISON_OPERATORS[op]
+            return [Series(series.labels, series.values,
+                           series.present & (compare(scalar, series.values) if lhs_scalar else compare(series.values, scalar)))
+                    for series in vector]
+
+        function = _ARITHMETIC_OPERATORS[op]
+
+        return [Series(_drop_name(series.labels),
+                       function(scalar, series.values) if lhs_scalar else function(series.values, scalar),
+                       series.present)
+                for series in vector]
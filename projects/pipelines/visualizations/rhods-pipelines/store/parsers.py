@@ -135,7 +135,7 @@ def _parse_user_progress(dirname, ci_pod_dir):
 
 def _parse_user_ansible_progress(dirname, ci_pod_dir):
     ansible_progress = {}
-    for ansible_log in sorted(ci_pod_dir.glob("*/_ansible.log")):
+    for ansible_log in helpers_store.glob(dirname, ci_pod_dir.relative_to(dirname) / "*/_ansible.log"):
         filename = ansible_log.relative_to(dirname)
         last_line = None
         step_name = filename.parent.name
@@ -156,7 +156,7 @@ def _parse_user_data(dirname, user_count):
     user_data = {}
     for user_id in range(user_count):
         ci_pod_dirname = dirname / f"{artifact_paths.LOCAL_CI__RUN_MULTI}" / "artifacts" / f"ci-pod-{user_id}"
-        if not ci_pod_dirname.exists():
+        if not helpers_store.get_directory_index(dirname).exists(ci_pod_dirname.relative_to(dirname)):
             user_data[user_id] = None
             logging.warning(f"No user directory collector for user #{user_id}")
             continue
@@ -225,7 +225,7 @@ def _extract_metrics(dirname):
 @ignore_file_not_found
 def _parse_pod_times(dirname, ci_pod_dir):
     filenames = [fname.relative_to(dirname) for fname in
-                 ci_pod_dir.glob("*__pipelines__capture_state/pods/*.json")]
+                 helpers_store.glob(dirname, ci_pod_dir.relative_to(dirname) / "*__pipelines__capture_state/pods/*.json")]
 
     pod_times = []
 
@@ -319,7 +319,7 @@ def _parse_resource_times(dirname, ci_pod_dir):
 
     @ignore_file_not_found
     def parse(fname):
-        state_dirs = list(ci_pod_dir.glob("*__pipelines__capture_state"))
+        state_dirs = helpers_store.glob(dirname, ci_pod_dir.relative_to(dirname) / "*__pipelines__capture_state")
         if not state_dirs:
             logging.error(f"No '*__pipelines__capture_state' available in {dirname} ...")
             return
@@ -360,7 +360,7 @@ def _parse_workflow_run_names(dirname, ci_pod_dir):
 
     @ignore_file_not_found
     def parse(fname):
-        state_dirs = list(ci_pod_dir.glob("*__pipelines__capture_state"))
+        state_dirs = helpers_store.glob(dirname, ci_pod_dir.relative_to(dirname) / "*__pipelines__capture_state")
         if not state_dirs:
             logging.error(f"No '*__pipelines__capture_state' available in {dirname} ...")
             return
@@ -404,7 +404,7 @@ def _parse_workflow_start_times(dirname, ci_pod_dir):
 
     @ignore_file_not_found
     def parse(fname):
-        state_dirs = list(ci_pod_dir.glob("*__pipelines__capture_state"))
+        state_dirs = helpers_store.glob(dirname, ci_pod_dir.relative_to(dirname) / "*__pipelines__capture_state")
         if not state_dirs:
             logging.error(f"No '*__pipelines__capture_state' available in {dirname} ...")
             return
@@ -450,7 +450,7 @@ def _parse_submit_run_times(dirname, ci_pod_dir):
     logging.info(f"Parsing submit run times for {ci_pod_dir.name} ...")
 
 
-    run_times_files_submit = list(ci_pod_dir.glob("*__pipelines__run_kfp_notebook/notebook-artifacts/*_runs_submit.json"))
+    run_times_files_submit = helpers_store.glob(dirname, ci_pod_dir.relative_to(dirname) / "*__pipelines__run_kfp_notebook/notebook-artifacts/*_runs_submit.json")
     if not run_times_files_submit:
         logging.error(f"No run times JSON files available in {dirname} ...")
         return
@@ -472,7 +472,7 @@ def _parse_complete_run_times(dirname, ci_pod_dir):
     logging.info(f"Parsing submit run times for {ci_pod_dir.name} ...")
 
 
-    run_times_files_complete = list(ci_pod_dir.glob("*__pipelines__run_kfp_notebook/notebook-artifacts/*_runs_complete.json"))
+    run_times_files_complete = helpers_store.glob(dirname, ci_pod_dir.relative_to(dirname) / "*__pipelines__run_kfp_notebook/notebook-artifacts/*_runs_complete.json")
     if not run_times_files_complete:
         logging.error(f"No run times JSON files available in {dirname} ...")
         return
@@ -0,0 +1,209 @@
+#! /usr/bin/env python
+
+# This script analyzes the `_ansible.events.jsonl` files written by
+# the `human_log` Ansible callback: one event per task and per loop
+# item, with its duration and number of retries.
+#
+# It reports the slowest tasks, the `until:` loops with the most
+# retries, and the tasks that slowed down between two runs.
+
+import sys
+import os
+import json
+import pathlib
+import argparse
+import statistics
+import logging
+logging.getLogger().setLevel(logging.INFO)
+
+TOPSAIL_DIR = pathlib.Path(__file__).absolute().parent.parent.parent.parent
+if str(TOPSAIL_DIR) not in sys.path:
+    sys.path.insert(0, str(TOPSAIL_DIR)) # to import the `projects` package when executed directly
+
+from projects.repo.scripts import report_table
+
+EVENTS_FILENAME = "_ansible.events.jsonl"
+
+DEFAULT_TOP = 20
+NAME_LENGTH = 70 # characters
+DEFAULT_MIN_DELTA = 5 # seconds
+DEFAULT_MIN_RATIO = 0.2
+
+
+def find_event_files(artifact_dirs):
+    for artifact_dir in artifact_dirs:
+        for dirpath, dirnames, filenames in os.walk(artifact_dir):
+            dirnames.sort()
+            if EVENTS_FILENAME in filenames:
+                yield pathlib.Path(dirpath) / EVENTS_FILENAME
+
+
+def load_events(artifact_dirs):
+    events = []
+    for events_file in find_event_files(artifact_dirs):
+        with open(events_file) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue # truncated line of an interrupted execution
+
+                event["events_file"] = str(events_file)
+                events.append(event)
+
+    return events
+
+
+def aggregate_tasks(events):
+    """
+    Returns a dict {task name --> dict(count, total, mean, max, retries, items)} of the task events.
+    """
+
+    durations = {}
+    retries = {}
+    items = {}
+    for event in events:
+        if event["type"] != "task":
+            continue
+
+        durations.setdefault(event["task"], []).append(event["duration"])
+        retries[event["task"]] = retries.get(event["task"], 0) + event["retries"]
+        items[event["task"]] = items.get(event["task"], 0) + (event.get("items") or 0)
+
+    return {
+        task: dict(count=len(task_durations),
+                   total=sum(task_durations),
+                   mean=statistics.mean(task_durations),
+                   max=max(task_durations),
+                   retries=retries[task],
+                   items=items[task])
+        for task, task_durations in durations.items()
+    }
+
+
+def aggregate_retries(events):
+    """
+    Returns the `until:` loops that had to retry, as a dict {task name --> dict(count, retries, max_retries, total)}.
+
+    The loop items are counted individually.
+    """
+
+    loops = {}
+    for event in events:
+        if not event.get("until") or not event["retries"]:
+            continue
+
+        if event["type"] == "task" and event.get("items"):
+            continue # already counted in the item events
+
+        loop = loops.setdefault(event["task"], dict(count=0, retries=0, max_retries=0, total=0))
+        loop["count"] += 1
+        loop["retries"] += event["retries"]
+        loop["max_retries"] = max(loop["max_retries"], event["retries"])
+        loop["total"] += event["duration"]
+
+    return loops
+
+
+def compare(baseline_tasks, current_tasks, min_delta=DEFAULT_MIN_DELTA, min_ratio=DEFAULT_MIN_RATIO):
+    """
+    Returns the list of (task name, baseline mean, current mean) of the
+    tasks whose mean duration increased by more than `min_delta`
+    seconds and `min_ratio` of the baseline, sorted by decreasing delta.
+    """
+
+    regressions = []
+    for task, current in current_tasks.items():
+        baseline = baseline_tasks.get(task)
+        if baseline is None:
+            continue
+
+        delta = current["mean"] - baseline["mean"]
+        if delta < min_delta or delta < min_ratio * baseline["mean"]:
+            continue
+
+        regressions.append((task, baseline["mean"], current["mean"]))
+
+    return sorted(regressions, key=lambda entry: entry[2] - entry[1], reverse=True)
+
+
+def report(artifact_dirs, top=DEFAULT_TOP):
+    events = load_events(artifact_dirs)
+    if not events:
+        logging.warning(f"No {EVENTS_FILENAME} file found in {', '.join(map(str, artifact_dirs))}")
+        return 1
+
+    tasks = aggregate_tasks(events)
+    slowest = sorted(tasks.items(), key=lambda entry: entry[1]["total"], reverse=True)[:top]
+
+    print(f"# Slowest tasks (top {top})")
+    print()
+    report_table.print_table(["total (s)", "count", "mean (s)", "max (s)", "retries", "task"],
+                             [[f"{stats['total']:.1f}", stats["count"], f"{stats['mean']:.1f}", f"{stats['max']:.1f}",
+                               stats["retries"], report_table.short(task, NAME_LENGTH)]
+                              for task, stats in slowest])
+
+    loops = aggregate_retries(events)
+    retry_heavy = sorted(loops.items(), key=lambda entry: entry[1]["total"], reverse=True)[:top]
+
+    print(f"# Retry-heavy `until:` loops (top {top})")
+    print()
+    if retry_heavy:
+        report_table.print_table(["total (s)", "executions", "retries", "max retries", "task"],
+                                 [[f"{stats['total']:.1f}", stats["count"], stats["retries"], stats["max_retries"], report_table.short(task, NAME_LENGTH)]
+                                  for task, stats in retry_heavy])
+    else:
+        print("No retry.")
+        print()
+
+    return 0
+
+
+def report_regressions(baseline_dirs, current_dirs, top=DEFAULT_TOP, min_delta=DEFAULT_MIN_DELTA, min_ratio=DEFAULT_MIN_RATIO):
+    baseline_tasks = aggregate_tasks(load_events(baseline_dirs))
+    current_tasks = aggregate_tasks(load_events(current_dirs))
+
+    if not baseline_tasks or not current_tasks:
+        logging.warning(f"No {EVENTS_FILENAME} file found in the {'baseline' if not baseline_tasks else 'current'} directories")
+        return 1
+
+    regressions = compare(baseline_tasks, current_tasks, min_delta, min_ratio)
+
+    print(f"# Task duration regressions (delta >= {min_delta}s and >= {min_ratio:.0%})")
+    print()
+    if not regressions:
+        print("No regression.")
+        print()
+        return 0
+
+    report_table.print_table(["baseline (s)", "current (s)", "delta (s)", "task"],
+                             [[f"{baseline:.1f}", f"{current:.1f}", f"+{current - baseline:.1f}", report_table.short(task, NAME_LENGTH)]
+                              for task, baseline, current in regressions[:top]])
+
+    return 0
+
+
+def main(artifact_dirs, baseline_dirs=None, top=DEFAULT_TOP, min_delta=DEFAULT_MIN_DELTA, min_ratio=DEFAULT_MIN_RATIO):
+    ret = report(artifact_dirs, top)
+
+    if baseline_dirs and ret == 0:
+        ret = report_regressions(baseline_dirs, artifact_dirs, top, min_delta, min_ratio)
+
+    return ret
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyzes the ansible task timings of TOPSAIL artifact directories.")
+    parser.add_argument("artifact_dirs", nargs="+", type=pathlib.Path,
+                        help="the artifact directories to analyze")
+    parser.add_argument("--baseline", nargs="+", type=pathlib.Path, dest="baseline_dirs",
+                        help="the artifact directories of the reference run, to detect the task duration regressions")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP,
+                        help="the number of entries in each report")
+    parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA,
+                        help="the minimum duration increase (in seconds) of a regression")
+    parser.add_argument("--min-ratio", type=float, default=DEFAULT_MIN_RATIO,
+                        help="the minimum duration increase (relative to the baseline) of a regression")
+    args = parser.parse_args()
+
+    sys.exit(main(args.artifact_dirs, args.baseline_dirs, args.top, args.min_delta, args.min_ratio))
@@ -0,0 +1,138 @@
+#! /usr/bin/env python
+
+# This script measures the cost of `BaseStore.is_important_file`, the
+# check performed by the visualization parsers for every file they
+# read, against the former implementation (linear `fnmatch` scan of
+# the important files). The important file list mimics the one of the
+# container_bench store.
+
+import sys
+import time
+import types
+import fnmatch
+import statistics
+import pathlib
+import logging
+logging.getLogger().setLevel(logging.INFO)
+
+SCRIPT_THIS_DIR = pathlib.Path(__file__).absolute().parent
+TOPSAIL_DIR = SCRIPT_THIS_DIR.parent.parent.parent
+
+DEFAULT_DIRECTORIES = 200
+DEFAULT_REPEAT = 5
+
+RUN_BENCHMARK_DIR = "*__container_bench__run_benchmark"
+BENCHMARKS = ["cpu_benchmark", "memory_read_benchmark", "memory_write_benchmark",
+              "fileio_container", "fileio_mount",
+              "iperf_net_bridge", "iperf_net_host", "iperf_host_to_container"]
+
+IMPORTANT_FILES = [
+    "config.yaml",
+    ".uuid",
+    f"{RUN_BENCHMARK_DIR}/artifacts/metrics.json",
+    *[f"{RUN_BENCHMARK_DIR}/artifacts/{benchmark}.log" for benchmark in BENCHMARKS],
+    *[f"{RUN_BENCHMARK_DIR}/artifacts/{benchmark}_ts.yaml" for benchmark in BENCHMARKS],
+    "*__container_bench__capture_system_state/artifacts/system_info.txt",
+    "*__container_bench__capture_container_engine_info/artifacts/container_engine_info.json",
+]
+
+
+def linear_is_important_file(important_files, filename):
+    """
+    The former implementation of BaseStore.is_important_file, used as reference.
+    """
+
+    if str(filename) in important_files:
+        return True
+
+    for important_file in important_files:
+        if "*" not in important_file: continue
+
+        if fnmatch.filter([str(filename)], important_file):
+            return True
+
+    return False
+
+
+def generate_filenames(directories):
+    """
+    Returns the files read by the parsers in `directories` test
+    directories, plus files that aren't important.
+    """
+
+    filenames = []
+    for idx in range(directories):
+        run_dir = f"{idx:03d}__container_bench__run_benchmark"
+        filenames += ["config.yaml", ".uuid", f"{run_dir}/artifacts/metrics.json"]
+        filenames += [f"{run_dir}/artifacts/{benchmark}.log" for benchmark in BENCHMARKS]
+        filenames += [f"{run_dir}/artifacts/{benchmark}_ts.yaml" for benchmark in BENCHMARKS]
+        filenames += [f"{run_dir}/artifacts/{benchmark}.unknown" for benchmark in BENCHMARKS]
+        filenames += [f"{idx:03d}__container_bench__capture_system_state/artifacts/system_info.txt"]
+
+    return filenames
+
+
+def _measure(fct, filenames, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for filename in filenames:
+            fct(filename)
+        durations.append((time.perf_counter() - start) / len(filenames) * 1_000_000)
+
+    return statistics.median(durations)
+
+
+def new_store():
+    import projects.matrix_benchmarking.visualizations.helpers.store as helpers_store
+
+    return helpers_store.BaseStore(
+        cache_filename="cache.pickle", important_files=IMPORTANT_FILES,
+        artifact_dirnames=types.SimpleNamespace(), artifact_paths=types.SimpleNamespace(),
+        parse_always=None, parse_once=None,
+    )
+
+
+def main(directories=DEFAULT_DIRECTORIES, repeat=DEFAULT_REPEAT, max_microseconds=None):
+    directories = int(directories)
+    repeat = int(repeat)
+
+    filenames = generate_filenames(directories)
+
+    store = new_store()
+    mismatches = [filename for filename in filenames
+                  if store.is_important_file(filename) != linear_is_important_file(IMPORTANT_FILES, filename)]
+    if mismatches:
+        logging.fatal(f"is_important_file differs from the reference implementation for {len(mismatches)} files, eg: {mismatches[0]}")
+        return 1
+
+    reference = _measure(lambda filename: linear_is_important_file(IMPORTANT_FILES, filename), filenames, repeat)
+
+    # a new store for each measurement, so that the results aren't memoized yet
+    cold_durations = []
+    for _ in range(repeat):
+        cold_durations.append(_measure(new_store().is_important_file, filenames, 1))
+    cold = statistics.median(cold_durations)
+
+    warm = _measure(store.is_important_file, filenames, repeat)
+
+    logging.info(f"is_important_file: {len(filenames)} files, {len(IMPORTANT_FILES)} important files, {repeat} runs")
+    logging.info(f"reference (linear fnmatch) {reference:.2f}us/call")
+    logging.info(f"compiled, first call       {cold:.2f}us/call ({reference / cold:.1f}x)")
+    logging.info(f"compiled, memoized         {warm:.2f}us/call ({reference / warm:.1f}x)")
+
+    if max_microseconds is not None and cold > float(max_microseconds):
+        logging.fatal(f"The first-call cost ({cold:.2f}us) is above the threshold ({max_microseconds}us)")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    if "-h" in sys.argv or "--help" in sys.argv:
+        logging.info("Usage: benchmark_important_files.py [DIRECTORIES [REPEAT [MAX_MICROSECONDS]]]")
+        exit(0)
+
+    sys.path.insert(0, str(TOPSAIL_DIR)) # to import the `projects` package
+
+    exit(main(*sys.argv[1:]))
@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+
+# This script measures the cold-start time of the toolbox CLI, with
+# `./run_toolbox.py <group> <command> --help`.
+
+import sys
+import time
+import statistics
+import subprocess
+import pathlib
+import logging
+logging.getLogger().setLevel(logging.INFO)
+
+SCRIPT_THIS_DIR = pathlib.Path(__file__).absolute().parent
+TOPSAIL_DIR = SCRIPT_THIS_DIR.parent.parent.parent
+
+DEFAULT_GROUP = "cluster"
+DEFAULT_COMMAND = "set_scale"
+DEFAULT_REPEAT = 5
+
+
+def measure_startup(group, command, repeat):
+    cmd = [sys.executable, str(TOPSAIL_DIR / "run_toolbox.py"), group, command, "--help"]
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=TOPSAIL_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        durations.append(time.perf_counter() - start)
+
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(cmd)} failed: {proc.stderr.decode('utf8', 'ignore')}")
+
+    return durations
+
+
+def main(group=DEFAULT_GROUP, command=DEFAULT_COMMAND, repeat=DEFAULT_REPEAT, max_seconds=None):
+    repeat = int(repeat)
+    durations = measure_startup(group, command, repeat)
+
+    median = statistics.median(durations)
+    logging.info(f"run_toolbox.py {group} {command} --help: {repeat} runs")
+    logging.info(f"min={min(durations):.3f}s median={median:.3f}s max={max(durations):.3f}s")
+
+    if max_seconds is not None and median > float(max_seconds):
+        logging.fatal(f"The median startup time ({median:.3f}s) is above the threshold ({max_seconds}s)")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    if "-h" in sys.argv or "--help" in sys.argv:
+        logging.info("Usage: benchmark_toolbox_startup.py [GROUP COMMAND [REPEAT [MAX_SECONDS]]]")
+        exit(0)
+
+    exit(main(*sys.argv[1:]))
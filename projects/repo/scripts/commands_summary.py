@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+
+# This script ranks the most expensive commands of a test run, based
+# on the `commands.jsonl` files written by `run.run` in the artifact
+# directories (wall time, user/sys CPU time, max RSS and exit code of
+# each command).
+
+import sys
+import os
+import json
+import pathlib
+import argparse
+import logging
+logging.getLogger().setLevel(logging.INFO)
+
+TOPSAIL_DIR = pathlib.Path(__file__).absolute().parent.parent.parent.parent
+if str(TOPSAIL_DIR) not in sys.path:
+    sys.path.insert(0, str(TOPSAIL_DIR)) # to import the `projects` package when executed directly
+
+from projects.repo.scripts import report_table
+
+COMMANDS_LOG_FILENAME = "commands.jsonl"
+
+DEFAULT_TOP = 20
+NAME_LENGTH = 90 # characters
+SORT_KEYS = ("wall", "cpu", "maxrss_kb", "count")
+
+
+def load_commands(artifact_dirs):
+    commands = []
+    for artifact_dir in artifact_dirs:
+        for dirpath, dirnames, filenames in os.walk(artifact_dir):
+            dirnames.sort()
+            if COMMANDS_LOG_FILENAME not in filenames:
+                continue
+
+            with open(pathlib.Path(dirpath) / COMMANDS_LOG_FILENAME) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # truncated line of an interrupted execution
+
+                    entry["artifact_dir"] = dirpath
+                    entry["cpu"] = (entry["user"] or 0) + (entry["sys"] or 0)
+                    commands.append(entry)
+
+    return commands
+
+
+def command_group(command):
+    """
+    Returns the executable and subcommand of `command`, eg: 'oc get', 'podman run', 'ssh'
+    """
+
+    # skip the environment variable assignments (FOO=bar cmd ...)
+    words = [word for word in command.split() if "=" not in word or word.startswith("-")]
+    if not words:
+        return command
+
+    group = [pathlib.Path(words[0]).name]
+    for word in words[1:2]:
+        if not word.startswith("-") and word.replace("_", "").replace("-", "").isalnum():
+            group.append(word)
+
+    return " ".join(group)
+
+
+def aggregate(commands):
+    groups = {}
+    for entry in commands:
+        group = groups.setdefault(command_group(entry["command"]),
+                                  dict(count=0, wall=0, cpu=0, maxrss_kb=0, failed=0))
+        group["count"] += 1
+        group["wall"] += entry["wall"]
+        group["cpu"] += entry["cpu"]
+        group["maxrss_kb"] = max(group["maxrss_kb"], entry["maxrss_kb"] or 0)
+        group["failed"] += entry["returncode"] != 0
+
+    return groups
+
+
+def main(artifact_dirs, top=DEFAULT_TOP, sort_by="wall"):
+    if sort_by not in SORT_KEYS:
+        logging.error(f"Invalid sort key '{sort_by}'. Expected one of {', '.join(SORT_KEYS)}.")
+        return 1
+
+    commands = load_commands(artifact_dirs)
+    if not commands:
+        logging.warning(f"No {COMMANDS_LOG_FILENAME} file found in {', '.join(map(str, artifact_dirs))}")
+        return 1
+
+    total_wall = sum(entry["wall"] for entry in commands)
+    total_cpu = sum(entry["cpu"] for entry in commands)
+    print(f"{len(commands)} commands, {total_wall:.1f}s wall time, {total_cpu:.1f}s CPU time")
+    print()
+
+    groups = sorted(aggregate(commands).items(), key=lambda entry: entry[1][sort_by], reverse=True)[:top]
+    print(f"# Most expensive command groups, by {sort_by} (top {top})")
+    print()
+    report_table.print_table(["count", "wall (s)", "cpu (s)", "max rss (MB)", "failed", "command"],
+                             [[group["count"], f"{group['wall']:.1f}", f"{group['cpu']:.1f}",
+                               f"{group['maxrss_kb'] / 1024:.0f}", group["failed"], name]
+                              for name, group in groups])
+
+    if sort_by != "count":
+        slowest = sorted(commands, key=lambda entry: entry[sort_by] or 0, reverse=True)[:top]
+        print(f"# Most expensive commands, by {sort_by} (top {top})")
+        print()
+        report_table.print_table(["wall (s)", "cpu (s)", "max rss (MB)", "rc", "command"],
+                                 [[f"{entry['wall']:.1f}", f"{entry['cpu']:.1f}", f"{(entry['maxrss_kb'] or 0) / 1024:.0f}",
+                                   entry["returncode"], report_table.short(entry["command"], NAME_LENGTH)]
+                                  for entry in slowest])
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ranks the most expensive commands of TOPSAIL artifact directories.")
+    parser.add_argument("artifact_dirs", nargs="+", type=pathlib.Path,
+                        help="the artifact directories to analyze")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP,
+                        help="the number of entries in each report")
+    parser.add_argument("--sort-by", choices=SORT_KEYS, default="wall",
+                        help="the ranking criteria")
+    args = parser.parse_args()
+
+    sys.exit(main(args.artifact_dirs, args.top, args.sort_by))
@@ -0,0 +1,16 @@
+# Text table helpers shared by the report scripts of this directory
+# (ansible_task_timings.py, commands_summary.py).
+
+
+def print_table(header, rows):
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    print("  ".join(f"{cell:<{width}}" for cell, width in zip(header, widths)))
+    print("  ".join("-" * width for width in widths))
+    for row in rows:
+        print("  ".join(f"{cell:<{width}}" for cell, width in zip(row, widths)))
+    print()
+
+
+def short(name, length):
+    name = " ".join(name.split())
+    return name if len(name) <= length else name[:length-3] + "..."
@@ -4,6 +4,10 @@ import sys
 
 from projects.repo.scripts.validate_role_files import main as role_files_main
 from projects.repo.scripts.validate_role_vars_used import main as role_vars_used_main
+from projects.repo.scripts.benchmark_toolbox_startup import main as toolbox_startup_main
+from projects.repo.scripts.benchmark_important_files import main as important_files_main
+from projects.repo.scripts.ansible_task_timings import main as ansible_task_timings_main
+from projects.repo.scripts.commands_summary import main as commands_summary_main
 import projects.repo.scripts.ansible_default_config
 import projects.repo.scripts.toolbox_rst_documentation
 
@@ -57,6 +61,59 @@ class Repo:
         has_broken_links = os.system("find . -type l -exec file {} \\; | grep 'broken symbolic link'") == 0
         exit(1 if has_broken_links else 0)
 
+    @staticmethod
+    def benchmark_toolbox_startup(group="cluster", command="set_scale", repeat=5, max_seconds=None):
+        """
+        Measures the cold-start time of the toolbox, with `run_toolbox.py <group> <command> --help`.
+
+        Args:
+          group: the toolbox group to load
+          command: the toolbox command to load
+          repeat: the number of measurements to perform
+          max_seconds: if set, fail if the median startup time is above this value
+        """
+        exit(toolbox_startup_main(group, command, repeat, max_seconds))
+
+    @staticmethod
+    def benchmark_important_files(directories=200, repeat=5, max_microseconds=None):
+        """
+        Measures the cost of the visualization store `is_important_file` check, against the former linear implementation.
+
+        Args:
+          directories: the number of test directories to simulate
+          repeat: the number of measurements to perform
+          max_microseconds: if set, fail if the median cost of a first (not memoized) call is above this value
+        """
+        exit(important_files_main(directories, repeat, max_microseconds))
+
+    @staticmethod
+    def analyze_ansible_task_timings(artifact_dir, baseline_dir=None, top=20, min_delta=5, min_ratio=0.2):
+        """
+        Reports the slowest Ansible tasks and the retry-heavy `until:` loops of an artifact directory,
+        and the task duration regressions compared to a baseline.
+
+        Args:
+          artifact_dir: the artifact directory to analyze (the `_ansible.events.jsonl` files are searched recursively)
+          baseline_dir: if set, the artifact directory of the reference run
+          top: the number of entries in each report
+          min_delta: the minimum duration increase (in seconds) of a regression
+          min_ratio: the minimum duration increase (relative to the baseline) of a regression
+        """
+        exit(ansible_task_timings_main([artifact_dir], [baseline_dir] if baseline_dir else None,
+                                       int(top), float(min_delta), float(min_ratio)))
+
+    @staticmethod
+    def summarize_commands(artifact_dir, top=20, sort_by="wall"):
+        """
+        Ranks the most expensive commands executed by `run.run`, based on the `commands.jsonl` files of an artifact directory.
+
+        Args:
+          artifact_dir: the artifact directory to analyze (the `commands.jsonl` files are searched recursively)
+          top: the number of entries in each report
+          sort_by: the ranking criteria: wall, cpu, maxrss_kb or count
+        """
+        exit(commands_summary_main([artifact_dir], int(top), sort_by))
+
     @staticmethod
     def generate_ansible_default_settings():
         """
@@ -8,9 +8,14 @@ except ModuleNotFoundError:
     print("The toolbox requires the Python `fire` package, see requirements.txt for a full list of requirements")
     sys.exit(1)
 
+import projects.core.library
 import projects.core.library.ansible_toolbox
 
 def main(no_exit=False):
+    # the toolbox modules are loaded lazily, configure the logging
+    # here instead of relying on the import of one of them
+    projects.core.library.configure_logging()
+
     # Print help rather than opening a pager
     fire.core.Display = lambda lines, out: print(*lines, file=out)
 